@@ -28,4 +28,6 @@ it best matches each spike waveform.
 ### Controls
 - **select** : activate lasso selection to select individual spikes
 - **split** or **ctrl+s** : split the selected spikes into a new unit (only if one unit is visible)
+- **display_mode** : 'scatter' (decimated points) or 'density' (all spikes rasterized in an image,
+  spikes in low density regions are kept as points)
 """
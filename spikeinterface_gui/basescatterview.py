@@ -1,7 +1,13 @@
+from collections import OrderedDict
+
 import numpy as np
-from matplotlib.path import Path as mpl_path
 
 from .view_base import ViewBase
+from .selection_tools import SortedPointIndex
+
+
+# number of (unit, segment) entries kept in the statistics cache
+_max_cached_unit_stats = 256
 
 
 class BaseScatterView(ViewBase):
@@ -16,6 +22,10 @@ class BaseScatterView(ViewBase):
             {'name': 'num_bins', 'type': 'int', 'value' : 30, 'step': 1},
             {'name': 'display_low_percentiles', 'type': 'float', 'value' : 2.0, 'limits':(0, 50), 'step':0.5},
             {'name': 'display_high_percentiles', 'type': 'float', 'value' : 98.0, 'limits':(50, 100), 'step':0.5},
+            {'name': 'display_mode', 'type': 'list', 'value' : 'scatter', 'limits' : ['scatter', 'density']},
+            {'name': 'density_num_bins_x', 'type': 'int', 'value' : 800, 'step': 50},
+            {'name': 'density_num_bins_y', 'type': 'int', 'value' : 300, 'step': 50},
+            {'name': 'density_sparse_count', 'type': 'int', 'value' : 3, 'step': 1},
         ]
     _need_compute = False
 
@@ -37,13 +47,47 @@ class BaseScatterView(ViewBase):
         self._current_selected = 0
         self._block_auto_refresh_and_notify = False
         self._first_refresh_done = False
+        # (unit_id, segment_index, settings...) -> output of get_unit_data(), LRU order
+        self._unit_stats_cache = OrderedDict()
 
         ViewBase.__init__(self, controller=controller, parent=parent,  backend=backend)
 
         self.valid_period_regions = []
 
 
+    def _get_unit_stats_key(self, unit_id, segment_index):
+        return (
+            unit_id,
+            segment_index,
+            self.settings['num_bins'],
+            self.settings['display_low_percentiles'],
+            self.settings['display_high_percentiles'],
+            self.settings['auto_decimate'],
+            self.settings['max_spikes_per_unit'],
+            self.controller.main_settings['use_times'],
+        )
+
+    def clear_unit_stats_cache(self):
+        self._unit_stats_cache.clear()
+
     def get_unit_data(self, unit_id, segment_index=0):
+        """Get times, data, histogram, display range and (decimated) indices of one unit in one segment.
+
+        The result is cached per (unit, segment, settings) so that changing the visible units only
+        costs the drawing. The returned arrays must not be modified.
+        """
+        key = self._get_unit_stats_key(unit_id, segment_index)
+        unit_data = self._unit_stats_cache.get(key)
+        if unit_data is None:
+            unit_data = self._compute_unit_data(unit_id, segment_index)
+            self._unit_stats_cache[key] = unit_data
+            while len(self._unit_stats_cache) > _max_cached_unit_stats:
+                self._unit_stats_cache.popitem(last=False)
+        else:
+            self._unit_stats_cache.move_to_end(key)
+        return unit_data
+
+    def _compute_unit_data(self, unit_id, segment_index):
         inds = self.controller.get_spike_indices(unit_id, segment_index=segment_index)
         spike_indices = self.controller.spikes["sample_index"][inds]
         spike_times = self.controller.sample_index_to_time(spike_indices)
@@ -77,16 +121,89 @@ class BaseScatterView(ViewBase):
 
         return spike_times, spike_data, hist_count, hist_bins, ymin, ymax, inds
 
-    def get_selected_spikes_data(self, segment_index=0, visible_inds=None):
+    def get_density_data(self, segment_index=0):
+        """Rasterize all spikes of the visible units (no decimation) in a time x data density image.
+
+        Each visible unit is binned with one bincount. Pixels are colored with the mean color of the units
+        weighted by their log count, the opacity grows with the log of the total count.
+        Spikes falling in pixels with at most "density_sparse_count" spikes are not put in the image but
+        returned as points, so that sparse outliers stay visible as individual spikes.
+
+        Returns
+        -------
+        density : dict | None
+            * "image" : RGBA uint8 array (num_bins_y, num_bins_x, 4), the first row is at data min
+            * "extent" : (t_start, t_stop, data_min, data_max)
+            * "sparse" : dict unit_id -> (spike_times, spike_data, inds) of the sparse spikes
+            None if there is no spike to display.
+        """
+        num_bins_x = max(int(self.settings['density_num_bins_x']), 1)
+        num_bins_y = max(int(self.settings['density_num_bins_y']), 1)
+        t_start, t_stop = self.controller.get_t_start_t_stop(segment_index=segment_index)
+
+        units = []
+        for unit_id in self.controller.get_visible_unit_ids():
+            inds = self.controller.get_spike_indices(unit_id, segment_index=segment_index)
+            if inds.size == 0:
+                continue
+            spike_times = self.controller.sample_index_to_time(self.controller.spikes["sample_index"][inds])
+            units.append((unit_id, inds, np.asarray(spike_times), self.spike_data[inds]))
+        if len(units) == 0:
+            return None
+
+        data_min = min(np.nanmin(spike_data) for _, _, _, spike_data in units)
+        data_max = max(np.nanmax(spike_data) for _, _, _, spike_data in units)
+        if not data_max > data_min:
+            data_min, data_max = data_min - 0.5, data_max + 0.5
+        duration = max(t_stop - t_start, 1e-12)
+
+        counts = np.zeros((len(units), num_bins_y * num_bins_x), dtype='int32')
+        flat_bins = []
+        for k, (unit_id, inds, spike_times, spike_data) in enumerate(units):
+            ix = np.floor((spike_times - t_start) / duration * num_bins_x).astype('int64')
+            iy = np.floor((spike_data - data_min) / (data_max - data_min) * num_bins_y)
+            iy = np.nan_to_num(iy, nan=0).astype('int64')
+            np.clip(ix, 0, num_bins_x - 1, out=ix)
+            np.clip(iy, 0, num_bins_y - 1, out=iy)
+            flat = iy * num_bins_x + ix
+            counts[k] = np.bincount(flat, minlength=num_bins_y * num_bins_x)
+            flat_bins.append(flat)
+        total = counts.sum(axis=0)
+
+        # sparse spikes are displayed as points
+        sparse_pixels = total <= self.settings['density_sparse_count']
+        sparse = {}
+        for (unit_id, inds, spike_times, spike_data), flat in zip(units, flat_bins):
+            mask = sparse_pixels[flat]
+            sparse[unit_id] = (spike_times[mask], spike_data[mask], inds[mask])
+
+        # color = mean of the unit colors weighted by log counts, opacity = log of total count
+        unit_rgb = np.array([self.controller.get_unit_color(unit_id)[:3] for unit_id, _, _, _ in units], dtype='float32')
+        weights = np.log1p(counts, dtype='float32')
+        sum_weights = weights.sum(axis=0)
+        sum_weights[sum_weights == 0] = 1.
+        rgb = (weights.T @ unit_rgb) / sum_weights[:, None]
+        log_total = np.log1p(total, dtype='float32')
+        alpha = 0.3 + 0.7 * log_total / max(float(log_total.max()), 1e-6)
+        alpha[sparse_pixels] = 0.
+
+        image = np.empty((num_bins_y * num_bins_x, 4), dtype='uint8')
+        image[:, :3] = np.clip(rgb * 255, 0, 255)
+        image[:, 3] = np.clip(alpha * self.settings['alpha'] * 255, 0, 255)
+        image = image.reshape(num_bins_y, num_bins_x, 4)
+
+        return dict(image=image, extent=(t_start, t_stop, data_min, data_max), sparse=sparse)
+
+    def get_selected_spikes_data(self, segment_index=0, visible_units_only=True):
+        # the selection is sorted: the selected spikes of the segment are found with a binary search
         sl = self.controller.segment_slices[segment_index]
-        spikes_in_seg = self.controller.spikes[sl]
-        selected_indices = self.controller.get_indices_spike_selected()
-        if visible_inds is not None:
-            selected_indices = np.intersect1d(selected_indices, visible_inds)
-        mask = np.isin(sl.start + np.arange(len(spikes_in_seg)), selected_indices)
-        selected_spikes = spikes_in_seg[mask]
-        spike_times = self.controller.sample_index_to_time(selected_spikes['sample_index'])
-        spike_data = self.spike_data[sl][mask]
+        selected_indices = self.controller.get_indices_spike_selected_in_range(sl.start, sl.stop)
+        if visible_units_only and selected_indices.size > 0:
+            visible_unit_indices = [unit_index for unit_index, _ in self.controller.iter_visible_units()]
+            keep = np.isin(self.controller.spikes['unit_index'][selected_indices], visible_unit_indices)
+            selected_indices = selected_indices[keep]
+        spike_times = self.controller.sample_index_to_time(self.controller.spikes['sample_index'][selected_indices])
+        spike_data = self.spike_data[selected_indices]
         return (spike_times, spike_data)
 
 
@@ -112,15 +229,10 @@ class BaseScatterView(ViewBase):
             spike_times = self.controller.sample_index_to_time(self.controller.spikes["sample_index"][spike_inds])
             spike_data = self.spike_data[spike_inds]
 
-            points = np.column_stack((spike_times, spike_data))
-            indices_in_segment = []
-            for polygon in vertices:
-                # Check if points are inside the polygon
-                inside = mpl_path(polygon).contains_points(points)
-                if np.any(inside):
-                    # If any point is inside, we can proceed with the split
-                    indices_in_segment.extend(spike_inds[inside])
-            indices.extend(indices_in_segment)
+            # spike times are sorted in a segment: candidates are found with a binary search on times
+            index = SortedPointIndex(spike_times, spike_data, assume_sorted=True)
+            inside = index.select_in_polygons(vertices)
+            indices.extend(spike_inds[inside])
 
         if keep_already_selected:
             already_selected = self.controller.get_indices_spike_selected()
@@ -128,6 +240,16 @@ class BaseScatterView(ViewBase):
         self.controller.set_indices_spike_selected(indices)
         self.notify_spike_selection_changed()
 
+    def has_visible_spikes_in_polygon(self, polygon, segment_index=0):
+        """Return True if at least one spike of the visible units (displayed or not) is inside the polygon."""
+        for unit_id in self.controller.get_visible_unit_ids():
+            spike_inds = self.controller.get_spike_indices(unit_id, segment_index=segment_index)
+            spike_times = self.controller.sample_index_to_time(self.controller.spikes["sample_index"][spike_inds])
+            index = SortedPointIndex(spike_times, self.spike_data[spike_inds], assume_sorted=True)
+            if index.select_in_polygons([polygon]).size > 0:
+                return True
+        return False
+
     def split(self):
         """
         Add a split to the curation data based on the lasso vertices.
@@ -175,14 +297,21 @@ class BaseScatterView(ViewBase):
             return
         
         # Clear the lasso vertices after splitting
+        self.clear_unit_stats_cache()
         self._lasso_vertices = {segment_index: None for segment_index in range(self.controller.num_segments)}
         self.refresh()
         self.notify_manual_curation_updated()
         
 
     def _on_settings_changed(self):
+        self.clear_unit_stats_cache()
         self.refresh(set_scatter_range=True)
 
+    def on_manual_curation_updated(self):
+        # a split can change the spikes of a unit
+        self.clear_unit_stats_cache()
+        ViewBase.on_manual_curation_updated(self)
+
 
     def on_unit_visibility_changed(self):
         self._lasso_vertices = {segment_index: None for segment_index in range(self.controller.num_segments)}
@@ -265,6 +394,10 @@ class BaseScatterView(ViewBase):
         self.plot2.hideButtons()
         self.plot2.setYLink(self.plot)
         
+        # density image (display_mode='density') below the scatter
+        self.density_image = pg.ImageItem(axisOrder='row-major')
+        self.plot.addItem(self.density_image)
+
         self.scatter = pg.ScatterPlotItem(size=self.settings['scatter_size'], pxMode = True)
         self.plot.addItem(self.scatter)
         
@@ -297,8 +430,19 @@ class BaseScatterView(ViewBase):
         if self.combo_seg.currentIndex() != segment_index:
             self.combo_seg.setCurrentIndex(segment_index)
 
+        density = None
+        if self.settings['display_mode'] == 'density':
+            density = self.get_density_data(segment_index=segment_index)
+        if density is not None:
+            t_start, t_stop, data_min, data_max = density['extent']
+            self.density_image.setImage(density['image'], autoLevels=False, levels=(0, 255))
+            self.density_image.setRect(QT.QRectF(t_start, data_min, t_stop - t_start, data_max - data_min))
+            self.density_image.show()
+        else:
+            self.density_image.clear()
+            self.density_image.hide()
+
         max_count = 1
-        all_inds = []
         ymins = []
         ymaxs = []
         visible_units = self.controller.get_visible_unit_ids()
@@ -309,6 +453,9 @@ class BaseScatterView(ViewBase):
             )
             if len(spike_times) == 0:
                 continue
+            if density is not None:
+                # only the sparse spikes are points, the others are in the image
+                spike_times, spike_data, _ = density['sparse'][unit_id]
 
             # make a copy of the color
             color = QT.QColor(self.get_unit_color(unit_id))
@@ -320,7 +467,6 @@ class BaseScatterView(ViewBase):
             self.plot2.addItem(curve)
 
             max_count = max(max_count, np.max(hist_count))
-            all_inds.extend(inds)
             ymins.append(ymin)
             ymaxs.append(ymax)
 
@@ -339,7 +485,7 @@ class BaseScatterView(ViewBase):
         self.viewBox2.setXRange(0, self._max_count, padding = 0.0)
 
         # explicitly set the y-range of the histogram to match the spike data
-        spike_times, spike_data = self.get_selected_spikes_data(segment_index=segment_index, visible_inds=all_inds)
+        spike_times, spike_data = self.get_selected_spikes_data(segment_index=segment_index)
         self.scatter_select.setData(spike_times, spike_data)
 
         if self.settings["display_valid_periods"] and self.controller.valid_periods is not None:
@@ -384,17 +530,13 @@ class BaseScatterView(ViewBase):
         vertices = np.array(points)
         
         segment_index = self.combo_seg.currentIndex()
-        sl = self.controller.segment_slices[segment_index]
-        spikes_in_seg = self.controller.spikes[sl]
-        
-        # Create mask for visible units
-        visible_mask = np.zeros(len(spikes_in_seg), dtype=bool)
-        for unit_index, unit_id in self.controller.iter_visible_units():
-            visible_mask |= (spikes_in_seg['unit_index'] == unit_index)
-        
+
         # Only consider spikes from visible units
-        visible_spikes = spikes_in_seg[visible_mask]
-        if len(visible_spikes) == 0:
+        num_visible_spikes = sum(
+            self.controller.get_spike_indices(unit_id, segment_index=segment_index).size
+            for unit_id in self.controller.get_visible_unit_ids()
+        )
+        if num_visible_spikes == 0:
             # Clear selection if no visible spikes and shift not held
             if not shift_held:
                 self.controller.set_indices_spike_selected([])
@@ -455,6 +597,9 @@ class BaseScatterView(ViewBase):
             y_range=self.y_range,
             styles={"flex": "1"}
         )
+        # density image (display_mode='density') below the scatter
+        self.density_source = ColumnDataSource(data=dict(image=[], x=[], y=[], dw=[], dh=[]))
+        self.scatter_fig.image_rgba(image="image", x="x", y="y", dw="dw", dh="dh", source=self.density_source)
         self.scatter = self.scatter_fig.scatter(
             "x",
             "y",
@@ -551,6 +696,20 @@ class BaseScatterView(ViewBase):
         if segment_index != segment_index_from_selector:
             self.segment_selector.value = f"Segment {segment_index}"
 
+        density = None
+        if self.settings['display_mode'] == 'density':
+            density = self.get_density_data(segment_index=segment_index)
+        if density is not None:
+            t_start, t_stop, data_min, data_max = density['extent']
+            num_bins_y, num_bins_x, _ = density['image'].shape
+            # bokeh wants one uint32 per RGBA pixel
+            image = density['image'].view(dtype='uint32').reshape(num_bins_y, num_bins_x)
+            self.density_source.data = dict(
+                image=[image], x=[t_start], y=[data_min], dw=[t_stop - t_start], dh=[data_max - data_min]
+            )
+        else:
+            self.density_source.data = dict(image=[], x=[], y=[], dw=[], dh=[])
+
         visible_unit_ids = self.controller.get_visible_unit_ids()
         ymins = []
         ymaxs = []
@@ -561,6 +720,9 @@ class BaseScatterView(ViewBase):
             )
             if len(spike_times) == 0:
                 continue
+            if density is not None:
+                # only the sparse spikes are points, the others are in the image
+                spike_times, spike_data, inds = density['sparse'][unit_id]
             color = self.get_unit_color(unit_id)
             xs.extend(spike_times)
             ys.extend(spike_data)
@@ -668,13 +830,18 @@ class BaseScatterView(ViewBase):
             polygon = np.column_stack((xs, ys))
 
             selected = self.scatter_source.selected.indices
-            if len(selected) == 0:
+            segment_index = self.controller.get_time()[1]
+            if self.settings["display_mode"] == "density":
+                # most spikes are in the image and not in the scatter: the lasso is tested on all spikes
+                lasso_is_empty = not self.has_visible_spikes_in_polygon(polygon, segment_index)
+            else:
+                lasso_is_empty = len(selected) == 0
+            if lasso_is_empty:
                 self.controller.set_indices_spike_selected([])
                 self.notify_spike_selection_changed()
                 return
 
             # Append the current polygon to the lasso vertices if shift is held
-            segment_index = self.controller.get_time()[1]
             if self._lasso_vertices[segment_index] is None:
                 self._lasso_vertices[segment_index] = []
             if len(selected) > self._current_selected:
@@ -698,30 +865,18 @@ class BaseScatterView(ViewBase):
     def _panel_update_selected_spikes(self):
         import panel as pn
 
-        # handle selected spikes
-        selected_spike_indices = self.controller.get_indices_spike_selected()
-        selected_spike_indices = np.intersect1d(selected_spike_indices, self.plotted_inds)
+        # handle selected spikes: selection bitmap lookup of the plotted spikes
+        plotted_inds = np.asarray(self.plotted_inds, dtype='int64')
+        selected_mask = self.controller.is_spike_selected(plotted_inds)
+        selected_spike_indices = plotted_inds[selected_mask]
         if len(selected_spike_indices) == 1:
             selected_segment = self.controller.spikes[selected_spike_indices[0]]['segment_index']
             segment_index = self.controller.get_time()[1]
             if selected_segment != segment_index:
                 self.segment_selector.value = f"Segment {selected_segment}"
                 self._panel_change_segment(None)
-        if len(selected_spike_indices) > 0:
-            # map absolute indices to visible spikes
-            segment_index = self.controller.get_time()[1]
-            sl = self.controller.segment_slices[segment_index]
-            spikes_in_seg = self.controller.spikes[sl]
-            visible_mask = np.zeros(len(spikes_in_seg), dtype=bool)
-            for unit_index, unit_id in self.controller.iter_visible_units():
-                visible_mask |= (spikes_in_seg['unit_index'] == unit_index)
-            visible_indices = sl.start + np.nonzero(visible_mask)[0]
-            selected_indices = np.nonzero(np.isin(visible_indices, selected_spike_indices))[0]
-            # set selected spikes in scatter plot
-            if self.settings["auto_decimate"] and len(selected_indices) > 0:
-                selected_indices, = np.nonzero(np.isin(self.plotted_inds, selected_spike_indices))
-        else:
-            selected_indices = []
+        # positions in the scatter source
+        selected_indices = np.flatnonzero(selected_mask)
 
         def _do_update():
             self.scatter_source.selected.indices = list(selected_indices)
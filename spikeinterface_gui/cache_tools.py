@@ -0,0 +1,391 @@
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# increase this when the content of the cache changes
+_index_cache_version = 1
+
+# names of the arrays stored in the cache
+index_cache_keys = (
+    "sample_index",
+    "unit_index",
+    "channel_index",
+    "segment_index",
+    "extremum_channel",
+    "spike_order",
+    "spike_offsets",
+    "segment_limits",
+    "final_spike_samples",
+)
+
+
+def _get_files_info(folder):
+    # cheap content info: name, size and modification time of all files
+    folder = Path(folder)
+    files = sorted(f for f in folder.rglob("*") if f.is_file())
+    return [(str(f.relative_to(folder)), f.stat().st_size, f.stat().st_mtime_ns) for f in files]
+
+
+def get_index_cache_fingerprint(analyzer):
+    """Compute a fingerprint of the sorting and of the extensions used to build the GUI index.
+
+    This is cheap: it only uses the sorting metadata, the extension params/run_info and the size
+    and modification time of the sorting files. For a remote zarr analyzer (no local files) the
+    sorting arrays are hashed.
+
+    Parameters
+    ----------
+    analyzer : SortingAnalyzer
+        The sorting analyzer.
+
+    Returns
+    -------
+    fingerprint : str | None
+        A hash, None if the analyzer is not saved on disk.
+    """
+    if analyzer.format not in ("binary_folder", "zarr"):
+        return None
+
+    info = dict(
+        cache_version=_index_cache_version,
+        unit_ids=[str(unit_id) for unit_id in analyzer.unit_ids],
+        num_channels=analyzer.get_num_channels(),
+        num_samples=[analyzer.get_num_samples(segment_index) for segment_index in range(analyzer.get_num_segments())],
+        sampling_frequency=float(analyzer.sampling_frequency),
+    )
+    for extension_name in ("random_spikes", "templates"):
+        ext = analyzer.get_extension(extension_name)
+        if ext is not None:
+            info[extension_name] = dict(params=ext.params, run_info=ext.run_info)
+
+    if analyzer.format == "binary_folder":
+        info["sorting_files"] = _get_files_info(analyzer.folder / "sorting")
+    elif analyzer.format == "zarr":
+        import zarr
+
+        zarr_root = zarr.open(analyzer.folder, mode="r")
+        if "sorting" in zarr_root.keys():
+            sorting_group = zarr_root["sorting"]
+            info["sorting_attrs"] = sorting_group.attrs.asdict()
+            local_folder = Path(str(analyzer.folder)) / "sorting"
+            if local_folder.is_dir():
+                info["sorting_files"] = _get_files_info(local_folder)
+            else:
+                # the shapes are not enough: a new sorting can have the same number of spikes
+                arrays = []
+                sorting_group.visititems(lambda name, item: arrays.append((name, item)) if isinstance(item, zarr.Array) else None)
+                info["sorting_arrays"] = [
+                    (name, hashlib.sha1(np.ascontiguousarray(array[:]).tobytes()).hexdigest())
+                    for name, array in sorted(arrays, key=lambda x: x[0])
+                ]
+
+    txt = json.dumps(info, sort_keys=True, default=str)
+    return hashlib.sha1(txt.encode("utf8")).hexdigest()
+
+
+def get_index_cache_folder(analyzer):
+    """The folder of the GUI index cache of an analyzer: one folder per analyzer location in the
+    user cache folder, so the analyzer folder (which can be read-only or shared) is never written."""
+    from .utils_global import get_cache_folder
+
+    location = str(analyzer.folder)
+    if "://" not in location:
+        location = str(Path(location).resolve())
+    key = hashlib.sha1(location.encode("utf8")).hexdigest()
+    return get_cache_folder() / "index" / key
+
+
+def load_index_cache(analyzer, fingerprint, cache_folder=None, verbose=False):
+    """Load the GUI index cache if it exists and if it matches the fingerprint.
+
+    The arrays are memory-mapped.
+
+    Parameters
+    ----------
+    analyzer : SortingAnalyzer
+        The sorting analyzer.
+    fingerprint : str | None
+        The fingerprint of the analyzer (see get_index_cache_fingerprint()).
+    cache_folder : str | Path | None, default: None
+        The folder of the cache. If None, get_index_cache_folder() is used.
+    verbose : bool, default: False
+        Print messages.
+
+    Returns
+    -------
+    cache_data : dict | None
+        The arrays of the cache, None if the cache is missing or not valid.
+    """
+    if fingerprint is None:
+        return None
+    if cache_folder is None:
+        cache_folder = get_index_cache_folder(analyzer)
+    cache_folder = Path(cache_folder)
+    try:
+        fingerprint_file = cache_folder / "fingerprint.json"
+        if not fingerprint_file.is_file():
+            return None
+        with open(fingerprint_file, "r") as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                if verbose:
+                    print("\tGUI index cache is outdated")
+                return None
+        cache_data = {key: np.load(cache_folder / f"{key}.npy", mmap_mode="r") for key in index_cache_keys}
+    except Exception as e:
+        if verbose:
+            print(f"\tGUI index cache could not be loaded: {e}")
+        return None
+
+    return cache_data
+
+
+def save_index_cache(analyzer, fingerprint, cache_data, cache_folder=None, verbose=False):
+    """Save the GUI index cache in the user cache folder (or in cache_folder).
+
+    The fingerprint is written last, so an interrupted write leaves an invalid cache.
+    Errors (for instance a read-only folder) are not raised.
+    """
+    if fingerprint is None:
+        return
+    if cache_folder is None:
+        cache_folder = get_index_cache_folder(analyzer)
+    cache_folder = Path(cache_folder)
+    try:
+        cache_folder.mkdir(exist_ok=True, parents=True)
+        fingerprint_file = cache_folder / "fingerprint.json"
+        if fingerprint_file.exists():
+            fingerprint_file.unlink()
+        for key in index_cache_keys:
+            np.save(cache_folder / f"{key}.npy", np.asarray(cache_data[key]))
+        with open(fingerprint_file, "w") as f:
+            json.dump(dict(fingerprint=fingerprint, analyzer_folder=str(analyzer.folder)), f)
+    except Exception as e:
+        if verbose:
+            print(f"\tGUI index cache could not be saved: {e}")
+
+
+# increase this when the layout of the traces disk cache changes
+_traces_disk_cache_version = 1
+
+
+def get_recording_fingerprint(recording, return_in_uV=False):
+    """Compute a fingerprint of a recording including its preprocessing chain.
+
+    The chain is described by `recording.to_dict()`. If the recording has no stable description
+    (for instance an in-memory recording), None is returned: two different recordings could not
+    be told apart, so persistent caches must be disabled.
+    """
+    from spikeinterface.core.core_tools import SIJsonEncoder
+
+    if not recording.check_serializability("json"):
+        return None
+    try:
+        description = recording.to_dict(recursive=True)
+    except Exception:
+        return None
+    info = dict(
+        cache_version=_traces_disk_cache_version,
+        description=description,
+        channel_ids=[str(channel_id) for channel_id in recording.channel_ids],
+        num_samples=[recording.get_num_samples(segment_index) for segment_index in range(recording.get_num_segments())],
+        sampling_frequency=float(recording.sampling_frequency),
+        return_in_uV=bool(return_in_uV),
+    )
+    # numpy arrays of the description are fully encoded (not their truncated repr)
+    txt = json.dumps(info, sort_keys=True, cls=SIJsonEncoder)
+    return hashlib.sha1(txt.encode("utf8")).hexdigest()
+
+
+class TracesDiskCache:
+    """Persistent cache of (preprocessed) traces in a local folder.
+
+    Each chunk is computed the first time it is read and written in a binary file per segment
+    (a npy memmap). A flag per chunk, set after the data is written, tells which chunks are
+    on disk, so later reads (and later sessions) are served at disk speed.
+    The whole recording can be precomputed with `warm(n_jobs=...)`. Each warm worker reads
+    with its own `make_get_traces_func()`, so that the warm job does not wait for (nor block)
+    the interactive reads of `get_traces_func`.
+
+    The cache is invalidated when the recording (preprocessing chain included) changes.
+
+    Parameters
+    ----------
+    folder : str | Path
+        The folder of the cache.
+    recording : BaseRecording
+        The recording, used for the fingerprint and the shapes.
+    get_traces_func : callable
+        Function with signature `(segment_index, start_frame, end_frame) -> traces`.
+    fingerprint : str
+        The fingerprint of the recording (see get_recording_fingerprint()).
+    make_get_traces_func : callable | None, default: None
+        Function without arguments returning an independent `get_traces_func` (for instance on a
+        clone of the recording). It is called once per warm worker. If None, the workers share
+        `get_traces_func`, which must then be thread safe.
+    chunk_duration : float, default: 1.0
+        The chunk duration in seconds.
+    verbose : bool, default: False
+        Print messages.
+    """
+    def __init__(self, folder, recording, get_traces_func, fingerprint, make_get_traces_func=None,
+                 chunk_duration=1.0, verbose=False):
+        self.folder = Path(folder)
+        self.get_traces_func = get_traces_func
+        self.make_get_traces_func = make_get_traces_func
+        self.fingerprint = fingerprint
+        self.verbose = verbose
+        self.chunk_size = max(1, int(chunk_duration * recording.sampling_frequency))
+        self.num_segments = recording.get_num_segments()
+        self.num_samples = [recording.get_num_samples(segment_index) for segment_index in range(self.num_segments)]
+        self.num_channels = recording.get_num_channels()
+
+        self._lock = threading.Lock()
+        self._chunk_locks = {}
+        self._cancel_event = threading.Event()
+        self._open()
+
+    def get_num_chunks(self, segment_index):
+        return -(-self.num_samples[segment_index] // self.chunk_size)
+
+    def _open(self):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        fingerprint_file = self.folder / "fingerprint.json"
+        valid = False
+        if fingerprint_file.is_file():
+            with open(fingerprint_file, "r") as f:
+                info = json.load(f)
+            valid = info.get("fingerprint") == self.fingerprint and info.get("chunk_size") == self.chunk_size
+            valid = valid and all(
+                (self.folder / f"{name}_seg{segment_index}.npy").is_file()
+                for name in ("traces", "filled")
+                for segment_index in range(self.num_segments)
+            )
+            if not valid and self.verbose:
+                print("\tTraces disk cache is outdated, it is reset")
+
+        if valid:
+            self.dtype = np.dtype(info["dtype"])
+            mode = "r+"
+        else:
+            if fingerprint_file.exists():
+                fingerprint_file.unlink()
+            self.dtype = np.asarray(self.get_traces_func(0, 0, 1)).dtype
+            mode = "w+"
+
+        self._traces = []
+        self._filled = []
+        for segment_index in range(self.num_segments):
+            traces_file = self.folder / f"traces_seg{segment_index}.npy"
+            filled_file = self.folder / f"filled_seg{segment_index}.npy"
+            shape = (self.num_samples[segment_index], self.num_channels)
+            num_chunks = self.get_num_chunks(segment_index)
+            if mode == "w+":
+                # the file is sparse on most file systems: it only grows when chunks are written
+                traces = np.lib.format.open_memmap(traces_file, mode="w+", dtype=self.dtype, shape=shape)
+                filled = np.lib.format.open_memmap(filled_file, mode="w+", dtype="bool", shape=(num_chunks,))
+            else:
+                traces = np.load(traces_file, mmap_mode="r+")
+                filled = np.load(filled_file, mmap_mode="r+")
+            self._traces.append(traces)
+            self._filled.append(filled)
+
+        if mode == "w+":
+            with open(fingerprint_file, "w") as f:
+                json.dump(dict(fingerprint=self.fingerprint, chunk_size=self.chunk_size, dtype=self.dtype.str), f)
+
+    def get_filled_fraction(self):
+        num_filled = sum(int(np.sum(filled)) for filled in self._filled)
+        num_chunks = sum(filled.size for filled in self._filled)
+        return num_filled / max(num_chunks, 1)
+
+    def _get_chunk_lock(self, segment_index, chunk_index):
+        with self._lock:
+            key = (segment_index, chunk_index)
+            lock = self._chunk_locks.get(key)
+            if lock is None:
+                lock = self._chunk_locks[key] = threading.Lock()
+            return lock
+
+    def _fill_chunk(self, segment_index, chunk_index, get_traces_func=None):
+        if self._filled[segment_index][chunk_index]:
+            return
+        if get_traces_func is None:
+            get_traces_func = self.get_traces_func
+        lock = self._get_chunk_lock(segment_index, chunk_index)
+        with lock:
+            # could have been written by another thread in the meantime
+            if not self._filled[segment_index][chunk_index]:
+                start = chunk_index * self.chunk_size
+                end = min(start + self.chunk_size, self.num_samples[segment_index])
+                self._traces[segment_index][start:end] = get_traces_func(segment_index, start, end)
+                self._traces[segment_index].flush()
+                # the flag is set after the data
+                self._filled[segment_index][chunk_index] = True
+                self._filled[segment_index].flush()
+        with self._lock:
+            self._chunk_locks.pop((segment_index, chunk_index), None)
+
+    def get_traces(self, segment_index, start_frame, end_frame):
+        """Get traces for [start_frame, end_frame[, computing and writing the missing chunks."""
+        first = start_frame // self.chunk_size
+        last = -(-end_frame // self.chunk_size)
+        for chunk_index in range(first, last):
+            self._fill_chunk(segment_index, chunk_index)
+        return np.array(self._traces[segment_index][start_frame:end_frame])
+
+    def warm(self, n_jobs=1):
+        """Compute and write all missing chunks with n_jobs threads (-1 for all cpus).
+
+        Returns False if it was cancelled.
+        """
+        import os
+        from concurrent.futures import ThreadPoolExecutor
+
+        keys = [
+            (segment_index, chunk_index)
+            for segment_index in range(self.num_segments)
+            for chunk_index in np.flatnonzero(~np.asarray(self._filled[segment_index]))
+        ]
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+
+        # one reader per worker thread
+        local = threading.local()
+
+        def fill(key):
+            if self._cancel_event.is_set():
+                return
+            if not hasattr(local, "get_traces_func"):
+                if self.make_get_traces_func is not None:
+                    local.get_traces_func = self.make_get_traces_func()
+                else:
+                    local.get_traces_func = self.get_traces_func
+            self._fill_chunk(*key, get_traces_func=local.get_traces_func)
+
+        if n_jobs <= 1:
+            for key in keys:
+                fill(key)
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs, thread_name_prefix="sigui_warm") as executor:
+                list(executor.map(fill, keys))
+
+        if self.verbose and not self._cancel_event.is_set():
+            print("\tTraces disk cache is complete")
+        return not self._cancel_event.is_set()
+
+    def warm_async(self, n_jobs=1):
+        """Start `warm()` in a background thread and return a `Future`."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._cancel_event.clear()
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.warm, n_jobs=n_jobs)
+        executor.shutdown(wait=False)
+        return future
+
+    def cancel(self):
+        """Stop the warm job, chunks already written are kept."""
+        self._cancel_event.set()
@@ -1,25 +1,33 @@
 import time
+import threading
 
 import numpy as np
 
 import json
 
 from copy import deepcopy
+from collections import OrderedDict
+from functools import partial
 
 from spikeinterface.widgets.utils import get_unit_colors
 from spikeinterface import compute_sparsity
 from spikeinterface.core import get_template_extremum_channel, BaseEvent
-from spikeinterface.core.sorting_tools import spike_vector_to_indices
 from spikeinterface.curation import validate_curation_dict
 from spikeinterface.curation.curation_model import Curation
 from spikeinterface.widgets.utils import make_units_table_from_analyzer
 
-from .curation_tools import add_merge, default_label_definitions, empty_curation_data
+from .curation_tools import add_merge, default_label_definitions, empty_curation_data, compute_merge_preview
 from .event_tools import parse_events
+from .extension_tools import LazyExtensionData
+from .spike_tools import SpikeTable, spike_dtype, find_in_sorted
+from .cache_tools import get_index_cache_fingerprint, load_index_cache, save_index_cache
+from .cache_tools import TracesDiskCache, get_recording_fingerprint
+from .utils_global import get_cache_folder
+from .trace_tools import TraceCache, TracePrefetcher, SegmentTimeIndex, extract_snippets
+from .overview_tools import TraceOverview
+from .pc_tools import PCProjectionReader
+from .correlogram_tools import CorrelogramCache
 
-spike_dtype =[('sample_index', 'int64'), ('unit_index', 'int64'), 
-    ('channel_index', 'int64'), ('segment_index', 'int64'),
-    ('visible', 'bool'), ('selected', 'bool'), ('rand_selected', 'bool')]
 
 
 _default_main_settings = dict(
@@ -52,6 +60,16 @@ class Controller():
         curation_callback=None,
         curation_callback_kwargs=None,
         user_main_settings=None,
+        extension_loading_n_jobs=None,
+        use_index_cache=True,
+        traces_cache_size_mb=512,
+        traces_cache_chunk_duration=0.5,
+        traces_prefetch_windows=2,
+        trace_overview=False,
+        trace_overview_bin_duration=0.01,
+        use_traces_disk_cache=False,
+        traces_disk_cache_folder=None,
+        traces_disk_cache_warm_n_jobs=None,
     ):
         self.views = []
         skip_extensions = skip_extensions if skip_extensions is not None else []
@@ -130,133 +148,44 @@ class Controller():
             ext = analyzer.compute_one_extension('noise_levels')
         self.noise_levels = ext.get_data() if ext is not None else None
 
-        if "quality_metrics" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping quality_metrics')
-            self.metrics = None
-        else:
-            if verbose:
-                print('\tLoading quality_metrics')
-            qm_ext = analyzer.get_extension('quality_metrics')
-            if qm_ext is not None:
-                self.metrics = qm_ext.get_data()
-            else:
-                self.metrics = None
-
-        if "spike_amplitudes" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping spike_amplitudes')
-            self.spike_amplitudes = None
-        else:
-            if verbose:
-                print('\tLoading spike_amplitudes')
-            sa_ext = analyzer.get_extension('spike_amplitudes')
-            if sa_ext is not None:
-                self.spike_amplitudes = sa_ext.get_data()
-            else:
-                self.spike_amplitudes = None
-
-        if "amplitude_scalings" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping amplitude_scalings')
-            self.amplitude_scalings = None
-        else:
-            if verbose:
-                print('\tLoading amplitude_scalings')
-            sa_ext = analyzer.get_extension('amplitude_scalings')
-            if sa_ext is not None:
-                self.amplitude_scalings = sa_ext.get_data()
-            else:
-                self.amplitude_scalings = None
-
-        if "spike_locations" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping spike_locations')
-            self.spike_depths = None
-        else:
-            if verbose:
-                print('\tLoading spike_locations')
-            sl_ext = analyzer.get_extension('spike_locations')
-            if sl_ext is not None:
-                self.spike_depths = sl_ext.get_data()["y"]
-            else:
-                self.spike_depths = None
-
-        if "correlograms" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping correlograms')
-            self.correlograms = None
-            self.correlograms_bins = None
-        else:
-            if verbose:
-                print('\tLoading correlograms')
-            ccg_ext = analyzer.get_extension('correlograms')
-            if ccg_ext is not None:
-                self.correlograms, self.correlograms_bins = ccg_ext.get_data()
-            else:
-                self.correlograms, self.correlograms_bins = None, None
-
-        if "isi_histograms" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping isi_histograms')
-            self.isi_histograms = None
-            self.isi_bins = None
+        # Optional extensions : they are loaded lazily on the first request of a view
+        if self.analyzer.format == "memory":
+            self._saved_extension_names = set()
         else:
-            if verbose:
-                print('\tLoading isi_histograms')
-            isi_ext = analyzer.get_extension('isi_histograms')
-            if isi_ext is not None:
-                self.isi_histograms, self.isi_bins = isi_ext.get_data()
-            else:
-                self.isi_histograms, self.isi_bins = None, None
-
-        self._similarity_by_method = {}
+            self._saved_extension_names = set(self.analyzer.get_saved_extension_names())
+        self._extension_data = LazyExtensionData(analyzer, skip_extensions=skip_extensions, verbose=verbose)
+        self._extension_data.register_extension('quality_metrics', 'quality_metrics')
+        self._extension_data.register_extension('spike_amplitudes', 'spike_amplitudes')
+        self._extension_data.register_extension('amplitude_scalings', 'amplitude_scalings')
+        self._extension_data.register_extension('spike_depths', 'spike_locations', getter=lambda ext: ext.get_data()["y"])
+        # the correlograms of all pairs can be huge: they are only sliced for the requested units
+        self._extension_data.register_extension('correlograms', 'correlograms', getter=lambda ext: ext, lazy=True)
+        self._extension_data.register_extension('isi_histograms', 'isi_histograms', default=(None, None))
+        self._extension_data.register_extension('waveforms', 'waveforms', getter=lambda ext: ext)
+        # the projections can be huge (num_spikes x num_components x num_channels): they are read on demand
+        self._extension_data.register_extension(
+            'principal_components', 'principal_components', getter=lambda ext: ext, lazy=True
+        )
+        self._extension_data.register_extension(
+            'valid_periods', 'valid_unit_periods', getter=lambda ext: ext.get_data(outputs="by_unit")
+        )
         if "template_similarity" in skip_extensions:
             if self.verbose:
                 print('\tSkipping template_similarity')
+            self._extension_data.set('template_similarity', {})
         else:
-            if verbose:
-                print('\tLoading template_similarity')
-            ts_ext = analyzer.get_extension('template_similarity')
-            if ts_ext is not None:
-                method = ts_ext.params["method"]
-                self._similarity_by_method[method] = ts_ext.get_data()
-            else:
-                if len(self.unit_ids) <= 64 and len(self.channel_ids) <= 64:
-                    # precompute similarity when low channel/units count
-                    method = 'l1'
-                    ts_ext = analyzer.compute_one_extension('template_similarity', method=method, save=save_on_compute)
-                    self._similarity_by_method[method] = ts_ext.get_data()
+            # a missing similarity can be computed on first access: this never happens in the preload pool
+            self._extension_data.register(
+                'template_similarity', self._load_template_similarity, preload=self.has_extension('template_similarity')
+            )
 
-        if "waveforms" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping waveforms')
-            self.waveforms_ext = None
-        else:
-            if verbose:
-                print('\tLoading waveforms')
-            wf_ext = analyzer.get_extension('waveforms')
-            if wf_ext is not None:
-                self.waveforms_ext = wf_ext
-            else:
-                self.waveforms_ext = None
-        self._pc_projections = None
-        if "principal_components" in skip_extensions:
-            if self.verbose:
-                print('\tSkipping principal_components')
-            self.pc_ext = None
-        else:
-            if verbose:
-                print('\tLoading principal_components')
-            pc_ext = analyzer.get_extension('principal_components')
-            self.pc_ext = pc_ext
-
-        if analyzer.has_extension("valid_unit_periods"):
-            valid_periods_ext = analyzer.get_extension("valid_unit_periods")
-            self.valid_periods = valid_periods_ext.get_data(outputs="by_unit")
+        # Optionally, all extensions are preloaded in a thread pool while the spikes are gathered
+        if extension_loading_n_jobs is not None:
+            extension_preloading = self._extension_data.load_all_async(n_jobs=extension_loading_n_jobs)
         else:
-            self.valid_periods = None
+            extension_preloading = None
 
+        self._pc_reader = None
         self._potential_merges = None
         # some direct attribute
         self.num_segments = self.analyzer.get_num_segments()
@@ -275,9 +204,6 @@ class Controller():
 
         t0 = time.perf_counter()
 
-        self._extremum_channel = get_template_extremum_channel(self.analyzer,
-                                    mode="extremum", peak_sign='both', outputs='index')
-
         # spikeinterface handle colors in matplotlib style tuple values in range (0,1)
         self.refresh_colors()
 
@@ -290,56 +216,88 @@ class Controller():
             self.visible_channel_inds = np.flatnonzero(self.external_sparsity.mask[0])
 
         t0 = time.perf_counter()
-        
-        # make internal spike vector
-        unit_ids = self.analyzer.unit_ids
-        num_seg = self.analyzer.get_num_segments()
-        self.num_spikes = self.analyzer.sorting.count_num_spikes_per_unit(outputs="dict")
-        # print("self.num_spikes", self.num_spikes)
 
-        spike_vector = self.analyzer.sorting.to_spike_vector(concatenated=True, extremum_channel_inds=self._extremum_channel)
-        # spike_vector = self.analyzer.sorting.to_spike_vector(concatenated=True)
-        
+        # make internal spike vector and spike index, or get them from the persistent cache
         self.random_spikes_indices = self.analyzer.get_extension("random_spikes").get_data()
-
-        self.spikes = np.zeros(spike_vector.size, dtype=spike_dtype)        
-        self.spikes['sample_index'] = spike_vector['sample_index']
-        self.spikes['unit_index'] = spike_vector['unit_index']
-        self.spikes['segment_index'] = spike_vector['segment_index']
-        self.spikes['channel_index'] = spike_vector['channel_index']
-        self.spikes['rand_selected'][:] = False
-        self.spikes['rand_selected'][self.random_spikes_indices] = True
-
-        # self.num_spikes = self.analyzer.sorting.count_num_spikes_per_unit(outputs="dict")
-        seg_limits = np.searchsorted(self.spikes["segment_index"], np.arange(num_seg + 1))
-        self.segment_slices = {segment_index: slice(seg_limits[segment_index], seg_limits[segment_index + 1]) for segment_index in range(num_seg)}
-        
-        spike_vector2 = self.analyzer.sorting.to_spike_vector(concatenated=False)
-        self.final_spike_samples = [segment_spike_vector[-1][0] for segment_spike_vector in spike_vector2]
-        # this is dict of list because per segment spike_indices[segment_index][unit_id]
-        spike_indices_abs = spike_vector_to_indices(spike_vector2, unit_ids, absolute_index=True)
-        spike_indices = spike_vector_to_indices(spike_vector2, unit_ids)
-        # this is flatten
-        spike_per_seg = [s.size for s in spike_vector2]
-        # dict[unit_id] -> all indices for this unit across segments
-        self._spike_index_by_units = {}
-        # dict[segment_index][unit_id] -> all indices for this unit for one segment
-        self._spike_index_by_segment_and_units = spike_indices_abs
-        for unit_id in unit_ids:
-            inds = []
-            for seg_ind in range(num_seg):
-                inds.append(spike_indices[seg_ind][unit_id] + int(np.sum(spike_per_seg[:seg_ind])))
-            self._spike_index_by_units[unit_id] = np.concatenate(inds)
+        cache_data = None
+        if use_index_cache:
+            fingerprint = get_index_cache_fingerprint(self.analyzer)
+            cache_data = load_index_cache(self.analyzer, fingerprint, verbose=verbose)
+            if cache_data is not None and verbose:
+                print('\tUsing GUI index cache')
+        if cache_data is None:
+            cache_data = self._compute_spike_index()
+            if use_index_cache:
+                save_index_cache(self.analyzer, fingerprint, cache_data, verbose=verbose)
+        self._set_spike_index(cache_data)
 
         t1 = time.perf_counter()
         if verbose:
             print('Gathering all spikes took', t1 - t0)
 
+        # correlograms computed on demand from the spike index, only for the pairs requested by the views
+        self._correlogram_cache = CorrelogramCache(
+            self._get_unit_spike_samples, self.num_segments, self.sampling_frequency
+        )
+
+        # merge previews, keyed by the set of units and the parameters
+        self._merge_preview_cache = OrderedDict()
+        self._max_merge_previews = 256
+
         self._spike_visible_indices = np.array([], dtype='int64')
         self._spike_selected_indices = np.array([], dtype='int64')
         self.update_visible_spikes()
 
-        self._traces_cached = {}
+        # the recording is read concurrently by the views, the prefetcher, the overview build and the
+        # waveforms extraction: all reads are serialized since recordings are not thread safe
+        self._recording_lock = threading.RLock()
+
+        # persistent cache of the preprocessed traces, filled while browsing (or warmed in background)
+        self._traces_disk_cache = None
+        self._traces_disk_cache_warming = None
+        if use_traces_disk_cache and self.has_extension('recording'):
+            self._traces_disk_cache = self._make_traces_disk_cache(traces_disk_cache_folder)
+            if self._traces_disk_cache is not None and traces_disk_cache_warm_n_jobs is not None:
+                self.warm_traces_disk_cache(n_jobs=traces_disk_cache_warm_n_jobs)
+
+        # LRU cache of chunk aligned trace blocks
+        if traces_cache_size_mb is not None and traces_cache_size_mb > 0 and self.has_extension('recording'):
+            self._traces_cache = TraceCache(
+                self._read_traces,
+                self.get_num_samples,
+                chunk_size=max(1, int(traces_cache_chunk_duration * self.sampling_frequency)),
+                max_bytes=int(traces_cache_size_mb * 1024**2),
+            )
+        else:
+            self._traces_cache = None
+        # read-ahead of the next windows when scrolling
+        self.traces_prefetch_windows = traces_prefetch_windows
+        if self._traces_cache is not None and traces_prefetch_windows > 0:
+            self._traces_prefetcher = TracePrefetcher(self._traces_cache)
+        else:
+            self._traces_prefetcher = None
+
+        # per segment time index for "use_times", built on first use
+        self._time_indices = {}
+        self._time_indices_lock = threading.Lock()
+
+        # multi-resolution overview of the traces, loaded from the analyzer folder or built in background
+        if trace_overview and self.has_extension('recording'):
+            self.trace_overview = TraceOverview(
+                self.analyzer,
+                self._read_traces,
+                recording_fingerprint=self._get_recording_fingerprint(),
+                bin_duration=trace_overview_bin_duration,
+                return_in_uV=self.return_in_uV,
+                verbose=verbose,
+            )
+            self.trace_overview.load_or_build_async()
+        else:
+            self.trace_overview = None
+
+        if extension_preloading is not None:
+            # join before views are built
+            extension_preloading.result()
 
         self.units_table = make_units_table_from_analyzer(analyzer, extra_properties=extra_unit_properties)
 
@@ -410,6 +368,68 @@ class Controller():
             curation_data = Curation(**curation_data).model_dump()
             self.curation_data = curation_data
 
+    def _compute_spike_index(self):
+        """Compute the spike vector and all derived index arrays (see cache_tools.index_cache_keys)"""
+        unit_ids = self.analyzer.unit_ids
+        num_seg = self.analyzer.get_num_segments()
+
+        extremum_channel = get_template_extremum_channel(self.analyzer,
+                                    mode="extremum", peak_sign='both', outputs='index')
+        spike_vector = self.analyzer.sorting.to_spike_vector(concatenated=True, extremum_channel_inds=extremum_channel)
+        spikes = SpikeTable.from_spike_vector(spike_vector, unit_ids.size, self.num_channels, num_seg)
+
+        segment_limits = np.searchsorted(spikes["segment_index"], np.arange(num_seg + 1))
+        final_spike_samples = np.array([
+            spikes['sample_index'][segment_limits[segment_index + 1] - 1] if segment_limits[segment_index + 1] > segment_limits[segment_index] else 0
+            for segment_index in range(num_seg)
+        ], dtype='int64')
+
+        # CSR-like spike index by (unit, segment):
+        #  * the permutation is a stable argsort on unit_index, so for each unit spikes stay sorted by (segment, sample)
+        #  * the offsets give the boundaries of each (unit, segment) block in the permutation
+        spike_order = np.argsort(spikes['unit_index'], kind='stable')
+        block_index = spikes['unit_index'].astype('int64') * num_seg + spikes['segment_index']
+        counts = np.bincount(block_index, minlength=unit_ids.size * num_seg)
+        spike_offsets = np.zeros(counts.size + 1, dtype='int64')
+        np.cumsum(counts, out=spike_offsets[1:])
+
+        return dict(
+            sample_index=spikes.sample_index,
+            unit_index=spikes.unit_index,
+            channel_index=spikes.channel_index,
+            segment_index=spikes.segment_index,
+            extremum_channel=np.array([extremum_channel[unit_id] for unit_id in unit_ids], dtype='int64'),
+            spike_order=spike_order,
+            spike_offsets=spike_offsets,
+            segment_limits=segment_limits,
+            final_spike_samples=final_spike_samples,
+        )
+
+    def _set_spike_index(self, cache_data):
+        unit_ids = self.analyzer.unit_ids
+        num_seg = self.analyzer.get_num_segments()
+
+        self._unit_id_to_index = {unit_id: unit_index for unit_index, unit_id in enumerate(unit_ids)}
+        self._extremum_channel = dict(zip(unit_ids, cache_data['extremum_channel'].tolist()))
+
+        # compact columnar spike table with a record-like facade
+        self.spikes = SpikeTable(
+            sample_index=cache_data['sample_index'],
+            unit_index=cache_data['unit_index'],
+            channel_index=cache_data['channel_index'],
+            segment_index=cache_data['segment_index'],
+        )
+        self.spikes.set_flag('rand_selected', self.random_spikes_indices)
+
+        seg_limits = cache_data['segment_limits']
+        self.segment_slices = {segment_index: slice(int(seg_limits[segment_index]), int(seg_limits[segment_index + 1])) for segment_index in range(num_seg)}
+        self.final_spike_samples = list(cache_data['final_spike_samples'])
+
+        self._spike_order = cache_data['spike_order']
+        self._spike_offsets = cache_data['spike_offsets']
+        counts = np.diff(self._spike_offsets[::num_seg]) if num_seg > 0 else np.zeros(unit_ids.size, dtype='int64')
+        self.num_spikes = dict(zip(unit_ids, counts.tolist()))
+
     def check_is_view_possible(self, view_name):
         from .viewlist import get_all_possible_views
         possible_class_views = get_all_possible_views()
@@ -435,6 +455,76 @@ class Controller():
     def unit_ids(self):
         return self.analyzer.unit_ids
 
+    # lazy extensions zone
+    @property
+    def metrics(self):
+        return self._extension_data.get('quality_metrics')
+
+    @property
+    def spike_amplitudes(self):
+        return self._extension_data.get('spike_amplitudes')
+
+    @property
+    def amplitude_scalings(self):
+        return self._extension_data.get('amplitude_scalings')
+
+    @property
+    def spike_depths(self):
+        return self._extension_data.get('spike_depths')
+
+    @property
+    def correlograms(self):
+        ext = self._extension_data.get('correlograms')
+        return ext.get_data()[0] if ext is not None else None
+
+    @property
+    def correlograms_bins(self):
+        ext = self._extension_data.get('correlograms')
+        return ext.get_data()[1] if ext is not None else None
+
+    @property
+    def isi_histograms(self):
+        return self._extension_data.get('isi_histograms')[0]
+
+    @property
+    def isi_bins(self):
+        return self._extension_data.get('isi_histograms')[1]
+
+    @property
+    def waveforms_ext(self):
+        return self._extension_data.get('waveforms')
+
+    @property
+    def pc_ext(self):
+        return self._extension_data.get('principal_components')
+
+    @property
+    def valid_periods(self):
+        return self._extension_data.get('valid_periods')
+
+    @property
+    def _similarity_by_method(self):
+        return self._extension_data.get('template_similarity')
+
+    def _load_template_similarity(self):
+        similarity_by_method = {}
+        ts_ext = self._extension_data.get_extension('template_similarity')
+        if ts_ext is not None:
+            method = ts_ext.params["method"]
+            similarity_by_method[method] = ts_ext.get_data()
+        elif len(self.unit_ids) <= 64 and len(self.channel_ids) <= 64:
+            # precompute similarity when low channel/units count
+            method = 'l1'
+            with self._extension_data.analyzer_lock:
+                ts_ext = self.analyzer.compute_one_extension('template_similarity', method=method, save=self.save_on_compute)
+            similarity_by_method[method] = ts_ext.get_data()
+        return similarity_by_method
+
+    def get_extension_load_times(self):
+        """Get a dict with the loading time in seconds of each lazy extension already loaded"""
+        return dict(self._extension_data.load_times)
+    ## end lazy extensions zone
+
     def get_time(self):
         """
         Returns selected time and segment index
@@ -457,12 +547,26 @@ class Controller():
         if time is not None:
             self.time_info['time_by_seg'][segment_index] = time
 
+    def get_time_index(self, segment_index):
+        """
+        Get the SegmentTimeIndex of the recording for one segment (built once).
+        It serves chunk times and time/sample conversions without materializing the full time vector.
+        """
+        time_index = self._time_indices.get(segment_index)
+        if time_index is None:
+            with self._time_indices_lock:
+                time_index = self._time_indices.get(segment_index)
+                if time_index is None:
+                    time_index = SegmentTimeIndex.from_recording(self.analyzer.recording, segment_index)
+                    self._time_indices[segment_index] = time_index
+        return time_index
+
     def update_time_info(self):
         # set default time info
         if self.main_settings["use_times"] and self.has_extension("recording"):
             time_by_seg=np.array(
                 [
-                    self.analyzer.recording.get_start_time(segment_index) for segment_index in range(self.num_segments)
+                    self.get_time_index(segment_index).t_start for segment_index in range(self.num_segments)
                 ],
                 dtype="float64"
             )
@@ -482,39 +586,36 @@ class Controller():
         if use_times is None:
             use_times = self.main_settings["use_times"]
         if use_times and self.has_extension("recording"):
-            t_start = self.analyzer.recording.get_start_time(segment_index=segment_index)
-            t_stop = self.analyzer.recording.get_end_time(segment_index=segment_index)
-            return t_start, t_stop
+            time_index = self.get_time_index(segment_index)
+            return time_index.t_start, time_index.t_stop
         else:
             return 0, self.get_num_samples(segment_index) / self.sampling_frequency
 
     def get_times_chunk(self, segment_index, t1, t2):
         ind1, ind2 = self.get_chunk_indices(t1, t2, segment_index)
         if self.main_settings["use_times"]:
-            recording = self.analyzer.recording
-            times_chunk = recording.get_times(segment_index=segment_index)[ind1:ind2]
+            times_chunk = self.get_time_index(segment_index).get_times(ind1, ind2)
         else:
             times_chunk = np.arange(ind2 - ind1, dtype='float64') / self.sampling_frequency + max(t1, 0)
         return times_chunk
 
     def get_chunk_indices(self, t1, t2, segment_index):
         if self.main_settings["use_times"]:
-            recording = self.analyzer.recording
-            ind1, ind2 = recording.time_to_sample_index([t1, t2], segment_index=segment_index)
+            ind1, ind2 = self.get_time_index(segment_index).time_to_sample_index(np.array([t1, t2]))
         else:
             t_start = 0.0
             sr = self.sampling_frequency
             ind1 = int((t1 - t_start) * sr)
             ind2 = int((t2 - t_start) * sr)
 
-        ind1 = max(0, ind1)
-        ind2 = min(self.get_num_samples(segment_index), ind2)
+        ind1 = max(0, int(ind1))
+        ind2 = min(self.get_num_samples(segment_index), int(ind2))
         return ind1, ind2
 
     def sample_index_to_time(self, sample_index):
         segment_index = self.time_info["segment_index"]
         if self.main_settings["use_times"] and self.has_extension("recording"):
-            time = self.analyzer.recording.sample_index_to_time(sample_index, segment_index=segment_index)
+            time = self.get_time_index(segment_index).sample_index_to_time(sample_index)
             return time
         else:
             return sample_index / self.sampling_frequency
@@ -525,7 +626,7 @@ class Controller():
         if use_times is None:
             use_times = self.main_settings["use_times"]
         if use_times and self.has_extension("recording"):
-            time = self.analyzer.recording.time_to_sample_index(time, segment_index=segment_index)
+            time = self.get_time_index(segment_index).time_to_sample_index(time)
             return time
         else:
             return int(time * self.sampling_frequency)
@@ -646,7 +747,7 @@ class Controller():
     def update_visible_spikes(self):
         inds = []
         for unit_index, unit_id in self.iter_visible_units():
-            inds.append(self._spike_index_by_units[unit_id])
+            inds.append(self.get_spike_indices(unit_id))
         
         if len(inds) > 0:
             inds = np.concatenate(inds)
@@ -655,16 +756,24 @@ class Controller():
             inds = np.array([], dtype='int64')
         self._spike_visible_indices = inds
         
-        self._spike_selected_indices = np.array([], dtype='int64')
+        self.set_indices_spike_selected([])
     
     def get_indices_spike_visible(self):
         return self._spike_visible_indices
 
     def get_indices_spike_selected(self):
+        """The selected spikes as a sorted array of indices in controller.spikes"""
         return self._spike_selected_indices
 
     def set_indices_spike_selected(self, inds):
-        self._spike_selected_indices = np.array(inds)
+        # the selection is kept sorted and unique, the "selected" flag of the spike table is the bitmap
+        inds = np.unique(np.asarray(inds, dtype='int64'))
+        previous = getattr(self, '_spike_selected_indices', None)
+        if previous is not None and previous.size > 0:
+            self.spikes.set_flag('selected', previous, False)
+        if inds.size > 0:
+            self.spikes.set_flag('selected', inds, True)
+        self._spike_selected_indices = inds
         # reset active split if needed
         if len(self._spike_selected_indices) == 1:
             # set time info 
@@ -672,58 +781,260 @@ class Controller():
             sample_index = self.spikes['sample_index'][self._spike_selected_indices[0]]
             self.set_time(time=self.sample_index_to_time(sample_index), segment_index=segment_index)
 
+    def is_spike_selected(self, spike_indices):
+        """Selection mask of some spikes, in O(len(spike_indices)) using the selection bitmap"""
+        return self.spikes.get_flag('selected', np.asarray(spike_indices, dtype='int64'))
+
+    def get_indices_spike_selected_in_range(self, start, stop):
+        """The selected spikes with index in [start, stop[, for instance a segment slice"""
+        sel = self._spike_selected_indices
+        i0, i1 = np.searchsorted(sel, [start, stop])
+        return sel[i0:i1]
+
+    def get_positions_spike_selected(self, sorted_spike_indices):
+        """
+        Positions of the selected spikes in a sorted array of spike indices (for instance the visible spikes).
+        Equivalent to np.nonzero(np.isin(sorted_spike_indices, selected)) but in O(num_selected * log(n)).
+        """
+        positions, _ = find_in_sorted(sorted_spike_indices, self._spike_selected_indices)
+        return positions
+
     def get_spike_indices(self, unit_id, segment_index=None):
+        """
+        Get the indices (in controller.spikes) of the spikes of one unit, sorted by segment and sample.
+        If segment_index is None, all segments are returned.
+        This returns a view on the internal index, so it must not be modified.
+        """
+        num_seg = self.num_segments
+        unit_index = self._unit_id_to_index[unit_id]
         if segment_index is None:
-            # dict[unit_id] -> all indices for this unit across segments
-            return self._spike_index_by_units[unit_id]
+            # all indices for this unit across segments
+            start = self._spike_offsets[unit_index * num_seg]
+            stop = self._spike_offsets[(unit_index + 1) * num_seg]
         else:
-            # dict[segment_index][unit_id] -> all indices for this unit for one segment
-            return self._spike_index_by_segment_and_units[segment_index][unit_id]
+            # all indices for this unit for one segment
+            start = self._spike_offsets[unit_index * num_seg + segment_index]
+            stop = self._spike_offsets[unit_index * num_seg + segment_index + 1]
+        return self._spike_order[start:stop]
+
+    def find_nearest_spike(self, sample_index, segment_index, max_distance_samples=None,
+                           visible_units_only=False, channel_inds=None):
+        """
+        Find the spike nearest to a sample index in one segment.
+
+        Spikes are sorted by sample index inside each segment, so this only uses binary searches
+        in the segment slice and a mask over the few candidates around the position.
+
+        Parameters
+        ----------
+        sample_index : int
+            The sample index.
+        segment_index : int
+            The segment index.
+        max_distance_samples : int | None, default: None
+            If not None, no spike is returned when the nearest one is farther than this.
+        visible_units_only : bool, default: False
+            Only consider spikes of visible units.
+        channel_inds : array | None, default: None
+            Only consider spikes on these channels (for instance the visible channels).
+
+        Returns
+        -------
+        spike_index : int | None
+            The index of the spike in `controller.spikes` or None.
+        """
+        sl = self.segment_slices[segment_index]
+        seg_samples = self.spikes["sample_index"][sl]
+        num_spikes = seg_samples.size
+        if num_spikes == 0:
+            return None
+
+        unit_mask = None
+        if visible_units_only:
+            unit_mask = np.zeros(self.unit_ids.size, dtype='bool')
+            unit_mask[self.get_visible_unit_indices()] = True
+        channel_mask = None
+        if channel_inds is not None:
+            channel_mask = np.zeros(self.num_channels, dtype='bool')
+            channel_mask[channel_inds] = True
+
+        def nearest_in(i0, i1):
+            # nearest allowed spike with position in [i0, i1[, relative to the segment
+            inds = np.arange(i0, i1)
+            if unit_mask is not None:
+                inds = inds[unit_mask[self.spikes["unit_index"][sl.start + inds]]]
+            if channel_mask is not None:
+                inds = inds[channel_mask[self.spikes["channel_index"][sl.start + inds]]]
+            if inds.size == 0:
+                return None, None
+            distances = np.abs(seg_samples[inds] - sample_index)
+            best = np.argmin(distances)
+            return inds[best], distances[best]
+
+        def search_around(max_distance):
+            i0 = np.searchsorted(seg_samples, sample_index - max_distance, side="left")
+            i1 = np.searchsorted(seg_samples, sample_index + max_distance, side="right")
+            return nearest_in(i0, i1)
+
+        if max_distance_samples is not None:
+            ind, _ = search_around(max_distance_samples)
+        else:
+            # find any candidate in growing windows of positions, then the exact nearest within its distance
+            pos = np.searchsorted(seg_samples, sample_index)
+            half_width = 16
+            while True:
+                i0, i1 = max(0, pos - half_width), min(num_spikes, pos + half_width)
+                ind, distance = nearest_in(i0, i1)
+                if ind is not None:
+                    ind, _ = search_around(distance)
+                    break
+                if i0 == 0 and i1 == num_spikes:
+                    break
+                half_width *= 4
+
+        if ind is None:
+            return None
+        return int(sl.start + ind)
 
     def get_num_samples(self, segment_index):
         return self.analyzer.get_num_samples(segment_index=segment_index)
     
+    def _get_traces_from_recording(self, segment_index, start_frame, end_frame):
+        rec = self.analyzer.recording
+        with self._recording_lock:
+            return rec.get_traces(segment_index=segment_index, start_frame=start_frame, end_frame=end_frame,
+                                  return_in_uV=self.return_in_uV)
+
+    def _make_recording_reader(self):
+        # an independent clone of the recording: its reads do not wait for the shared recording lock
+        recording = self.analyzer.recording.clone()
+
+        def get_traces(segment_index, start_frame, end_frame):
+            return recording.get_traces(segment_index=segment_index, start_frame=start_frame, end_frame=end_frame,
+                                        return_in_uV=self.return_in_uV)
+
+        return get_traces
+
+    def _get_recording_fingerprint(self):
+        # computed once, shared by the traces disk cache and the overview
+        if not hasattr(self, "_recording_fingerprint"):
+            self._recording_fingerprint = get_recording_fingerprint(self.analyzer.recording, return_in_uV=self.return_in_uV)
+        return self._recording_fingerprint
+
+    def _read_traces(self, segment_index, start_frame, end_frame):
+        # the disk cache (when enabled) sits between the recording and the memory cache
+        if self._traces_disk_cache is not None:
+            return self._traces_disk_cache.get_traces(segment_index, start_frame, end_frame)
+        return self._get_traces_from_recording(segment_index, start_frame, end_frame)
+
+    def _make_traces_disk_cache(self, folder=None):
+        fingerprint = self._get_recording_fingerprint()
+        if fingerprint is None:
+            if self.verbose:
+                print("\tThe recording cannot be fingerprinted (not serializable), the traces disk cache is disabled")
+            return None
+        if folder is None:
+            # user-local: one folder per recording, the analyzer folder is never written
+            folder = get_cache_folder() / "traces" / fingerprint
+        if self.verbose:
+            print(f'\tOpening traces disk cache in {folder}')
+        return TracesDiskCache(folder, self.analyzer.recording, self._get_traces_from_recording, fingerprint,
+                               make_get_traces_func=self._make_recording_reader, verbose=self.verbose)
+
+    def has_traces_disk_cache(self):
+        return self._traces_disk_cache is not None
+
+    def warm_traces_disk_cache(self, n_jobs=1):
+        """
+        Start to compute in background all the chunks of the traces disk cache with n_jobs threads.
+        Each thread reads from its own clone of the recording, so the interactive reads are not blocked.
+        Returns a Future or None if there is no disk cache.
+        """
+        if self._traces_disk_cache is None:
+            return None
+        if self._traces_disk_cache_warming is not None and not self._traces_disk_cache_warming.done():
+            return self._traces_disk_cache_warming
+        self._traces_disk_cache_warming = self._traces_disk_cache.warm_async(n_jobs=n_jobs)
+        return self._traces_disk_cache_warming
+
     def get_traces(self, trace_source='preprocessed', **kargs):
-        # assert trace_source in ['preprocessed', 'raw']
+        # assert trace_source in ['preprocessed', 'raw']
         assert trace_source in ['preprocessed']
 
-        cache_key = (kargs.get("segment_index", None), kargs.get("start_frame", None), kargs.get("end_frame", None))
-        if cache_key in self._traces_cached:
-            return self._traces_cached[cache_key]
-        else:
-            # check if start_frame and end_frame are a subset interval of a cached one
-            for cached_key in self._traces_cached.keys():
-                cached_seg = cached_key[0]
-                cached_start = cached_key[1]
-                cached_end = cached_key[2]
-                req_seg = kargs.get("segment_index", None)
-                req_start = kargs.get("start_frame", None)
-                req_end = kargs.get("end_frame", None)
-                if cached_seg is not None and req_seg is not None:
-                    if cached_seg != req_seg:
-                        continue
-                if cached_start is not None and cached_end is not None and req_start is not None and req_end is not None:
-                    if req_start >= cached_start and req_end <= cached_end:
-                        # subset found
-                        traces = self._traces_cached[cached_key]
-                        start_offset = req_start - cached_start
-                        end_offset = req_end - cached_start
-                        return traces[start_offset:end_offset, :]
-        
-        if len(self._traces_cached) > 4:
-            self._traces_cached.pop(list(self._traces_cached.keys())[0])
-        
-        if trace_source == 'preprocessed':
-            rec = self.analyzer.recording
-        elif trace_source == 'raw':
+        if trace_source == 'raw':
             raise NotImplementedError("Raw traces not implemented yet")
             # TODO get with parent recording the non process recording
-        kargs['return_in_uV'] = self.return_in_uV
-        traces = rec.get_traces(**kargs)
-        # put in cache for next call
-        self._traces_cached[cache_key] = traces
+
+        segment_index = kargs.get("segment_index", None)
+        if segment_index is None:
+            segment_index = 0
+        start_frame = kargs.get("start_frame", None)
+        if start_frame is None:
+            start_frame = 0
+        end_frame = kargs.get("end_frame", None)
+        num_samples = self.get_num_samples(segment_index)
+        if end_frame is None:
+            end_frame = num_samples
+
+        use_cache = (
+            self._traces_cache is not None
+            and 0 <= start_frame <= end_frame <= num_samples
+            and kargs.get("channel_ids", None) is None
+        )
+        if use_cache:
+            traces = self._traces_cache.get_traces(int(segment_index), int(start_frame), int(end_frame))
+        elif (
+            self._traces_disk_cache is not None
+            and 0 <= start_frame <= end_frame <= num_samples
+            and kargs.get("channel_ids", None) is None
+        ):
+            traces = self._traces_disk_cache.get_traces(int(segment_index), int(start_frame), int(end_frame))
+        else:
+            rec = self.analyzer.recording
+            kargs['return_in_uV'] = self.return_in_uV
+            with self._recording_lock:
+                traces = rec.get_traces(**kargs)
         return traces
-    
+
+    def prefetch_traces(self, segment_index, start_frame, end_frame, direction=1):
+        """
+        Read ahead in background the next windows after [start_frame, end_frame[ in the scroll direction.
+        direction is 1 (forward), -1 (backward) or 0 (after a jump: one window on both sides).
+        A new call cancels the previous read-ahead.
+        """
+        if self._traces_prefetcher is None:
+            return
+        window = end_frame - start_frame
+        num_samples = self.get_num_samples(segment_index)
+        if window <= 0:
+            return
+        if direction > 0:
+            start, end = end_frame, end_frame + self.traces_prefetch_windows * window
+        elif direction < 0:
+            start, end = start_frame - self.traces_prefetch_windows * window, start_frame
+        else:
+            start, end = start_frame - window, end_frame + window
+        start = max(0, start)
+        end = min(num_samples, end)
+        self._traces_prefetcher.prefetch(segment_index, start, end)
+
+    def get_traces_cache_info(self):
+        """Get the hits/misses counters and the memory usage of the traces cache"""
+        if self._traces_cache is None:
+            return None
+        return self._traces_cache.get_info()
+
+    def has_trace_overview(self):
+        """True if the traces overview exists and is fully built"""
+        return self.trace_overview is not None and self.trace_overview.is_ready()
+
+    def get_trace_overview(self, segment_index, start_frame, end_frame, num_pixels, mode="peak"):
+        """
+        Get the decimated overview of the traces for [start_frame, end_frame[ at a resolution of about
+        `num_pixels` bins. See TraceOverview.get_overview().
+        """
+        return self.trace_overview.get_overview(segment_index, start_frame, end_frame, num_pixels, mode=mode)
+
     def get_contact_location(self):
         location = self.analyzer.get_channel_locations()
         # for now, we only use information from the first two dimensions of channel location
@@ -739,6 +1050,62 @@ class Controller():
     def get_waveform_sweep(self):
         return self.nbefore, self.nafter
         
+    def get_spike_waveforms(self, spike_indices, channel_indices=None):
+        """
+        Extract the waveforms of many spikes directly from the traces.
+        Spikes are grouped by trace chunk so that each chunk is read once. Chunks already in the
+        traces cache are taken from it, otherwise only the span of the snippets is read.
+
+        Returns
+        -------
+        waveforms : np.array
+            shape (num_spikes, nbefore + nafter, num_channels), zeros for spikes crossing a segment border
+        valid : np.array
+            bool mask of spikes not crossing a segment border
+        """
+        spike_indices = np.asarray(spike_indices, dtype='int64')
+        num_channels = self.num_channels if channel_indices is None else len(channel_indices)
+        width = self.nbefore + self.nafter
+        if self._traces_cache is not None:
+            chunk_size = self._traces_cache.chunk_size
+        else:
+            chunk_size = int(self.sampling_frequency)
+
+        waveforms = None
+        valid = np.zeros(spike_indices.size, dtype='bool')
+        segment_indices = self.spikes["segment_index"][spike_indices]
+        for segment_index in np.unique(segment_indices):
+            segment_index = int(segment_index)
+            mask = segment_indices == segment_index
+            get_traces_func = partial(self._read_traces_for_snippets, segment_index)
+            snippets, seg_valid = extract_snippets(
+                get_traces_func,
+                self.spikes["sample_index"][spike_indices[mask]],
+                self.nbefore,
+                self.nafter,
+                self.get_num_samples(segment_index),
+                chunk_size,
+                channel_indices=channel_indices,
+            )
+            valid[mask] = seg_valid
+            if not np.any(seg_valid):
+                continue
+            if waveforms is None:
+                waveforms = np.zeros((spike_indices.size, width, num_channels), dtype=snippets.dtype)
+            waveforms[mask] = snippets
+        if waveforms is None:
+            waveforms = np.zeros((spike_indices.size, width, num_channels), dtype='float32')
+        return waveforms, valid
+
+    def _read_traces_for_snippets(self, segment_index, start_frame, end_frame):
+        # sparse spikes must not fill the traces cache with full chunks
+        cache = self._traces_cache
+        if cache is not None:
+            first_block, last_block = cache.get_block_range(start_frame, end_frame)
+            if all(cache.has_block(segment_index, b) for b in range(first_block, last_block)):
+                return cache.get_traces(segment_index, start_frame, end_frame)
+        return self._read_traces(segment_index, start_frame, end_frame)
+
     def get_waveforms_range(self):
         return np.nanmin(self.templates_average), np.nanmax(self.templates_average)
     
@@ -796,11 +1163,11 @@ class Controller():
         elif extension_name == 'events':
             return self.events is not None
         else:
-            # extension needs to be loaded
+            # extensions are loaded lazily, so also look at the ones saved in the folder
             if extension_name in self.skip_extensions:
                 return False
             else:
-                return extension_name in self.analyzer.extensions
+                return extension_name in self.analyzer.extensions or extension_name in self._saved_extension_names
 
     def handle_metrics(self):
         return self.metrics is not None
@@ -808,17 +1175,26 @@ class Controller():
     def get_units_table(self):
         return self.units_table
 
-    def get_all_pcs(self):
-
-        if self._pc_projections is None and self.pc_ext is not None:
-            self._pc_projections, self._pc_indices = self.pc_ext.get_some_projections(
-                channel_ids=self.analyzer.channel_ids,
-                unit_ids=self.analyzer.unit_ids
+    def get_pc_reader(self):
+        """Get the PCProjectionReader giving on-demand access to the principal components (None if not computed)"""
+        if self._pc_reader is None and self.pc_ext is not None:
+            spike_unit_indices = self.spikes['unit_index'][self.random_spikes_indices]
+            self._pc_reader = PCProjectionReader(
+                self.pc_ext, spike_unit_indices, self.analyzer.unit_ids, sparsity=self.analyzer.sparsity
             )
+        return self._pc_reader
 
-            return self._pc_indices, self._pc_projections
-        else:
+    def get_all_pcs(self):
+        """Get the unit index and the projections on all channels of all random spikes.
+
+        This materializes the full (num_spikes, num_components, num_channels) array, views should
+        rather read the units and channels they need with `get_pc_reader()`.
+        """
+        pc_reader = self.get_pc_reader()
+        if pc_reader is None:
             return None, None
+        pc_projections = pc_reader.get_projections(np.arange(pc_reader.num_spikes))
+        return pc_reader.spike_unit_indices, pc_projections
 
     def get_sparsity_mask(self):
         if self.external_sparsity is not None:
@@ -850,15 +1226,46 @@ class Controller():
 
     def compute_correlograms(self, window_ms, bin_ms):
         ext = self.analyzer.compute("correlograms", save=self.save_on_compute, window_ms=window_ms, bin_ms=bin_ms)
-        self.correlograms, self.correlograms_bins = ext.get_data()
+        self._extension_data.set('correlograms', ext)
         return self.correlograms, self.correlograms_bins
+
+    def _get_unit_spike_samples(self, unit_index, segment_index):
+        inds = self.get_spike_indices(self.unit_ids[unit_index], segment_index=segment_index)
+        return self.spikes['sample_index'][inds]
+
+    def get_unit_correlograms(self, unit_ids, window_ms, bin_ms):
+        """Get the correlograms between some units.
+
+        When the correlograms extension was computed with the same window and bin, its data is used.
+        Otherwise only the pairs of these units are computed from the spike index, and cached
+        (so changing the visible units only computes the new pairs).
+
+        Returns
+        -------
+        correlograms : np.array
+            The counts of shape (num_units, num_units, num_bins), in the order of `unit_ids`.
+        bins : np.array
+            The bin edges in ms.
+        """
+        unit_indices = np.array([self._unit_id_to_index[unit_id] for unit_id in unit_ids], dtype='int64')
+        # the extension is loaded lazily: only its params are read here, and the sub-block of the units
+        ext = self._extension_data.get('correlograms')
+        if ext is not None and ext.params['window_ms'] == window_ms and ext.params['bin_ms'] == bin_ms:
+            ccg, bins = ext.get_data()
+            if isinstance(ccg, np.ndarray):
+                sub_ccg = np.asarray(ccg[np.ix_(unit_indices, unit_indices)])
+            else:
+                # zarr array
+                sub_ccg = ccg.oindex[unit_indices, unit_indices]
+            return sub_ccg, np.asarray(bins)
+        return self._correlogram_cache.get_correlograms(unit_indices, window_ms, bin_ms)
     
     def get_isi_histograms(self):
         return self.isi_histograms, self.isi_bins
 
     def compute_isi_histograms(self, window_ms, bin_ms):
         ext = self.analyzer.compute("isi_histograms", save=self.save_on_compute, window_ms=window_ms, bin_ms=bin_ms)
-        self.isi_histograms, self.isi_bins = ext.get_data()
+        self._extension_data.set('isi_histograms', ext.get_data())
         return self.isi_histograms, self.isi_bins
 
     def get_units_table(self):
@@ -1008,6 +1415,41 @@ class Controller():
         return True
 
 
+    def get_merge_preview(self, merge_unit_ids, window_ms=50., bin_ms=1., isi_threshold_ms=1.5, summary_only=False):
+        """
+        Get summaries of the unit that would result from the merge of some units, without applying the curation.
+
+        The spike trains of the units are merged from the spike index and the auto-correlogram,
+        the firing rate, the ISI violations and the amplitude histogram (if spike amplitudes are available)
+        of the merged unit are computed. The result is cached per set of units.
+
+        With `summary_only=True` (for instance for a table of all the merge groups), only the firing rate
+        and the ISI violations are computed. A full preview in the cache also serves summary requests.
+
+        See `compute_merge_preview()` for the content of the returned dict.
+        """
+        unit_indices = tuple(sorted(self._unit_id_to_index[unit_id] for unit_id in merge_unit_ids))
+        key = (unit_indices, float(window_ms), float(bin_ms), float(isi_threshold_ms))
+        preview = self._merge_preview_cache.get(key)
+        if preview is not None and (summary_only or preview["auto_correlogram"] is not None):
+            self._merge_preview_cache.move_to_end(key)
+            return preview
+
+        spike_indices_list = [self.get_spike_indices(self.unit_ids[unit_index]) for unit_index in unit_indices]
+        total_duration_s = sum(self.get_num_samples(seg_index) for seg_index in range(self.num_segments)) / self.sampling_frequency
+        amplitudes = self.spike_amplitudes if self.has_extension('spike_amplitudes') else None
+        preview = compute_merge_preview(
+            spike_indices_list, self.spikes, self.num_segments, self.sampling_frequency, total_duration_s,
+            amplitudes=amplitudes, window_ms=window_ms, bin_ms=bin_ms, isi_threshold_ms=isi_threshold_ms,
+            summary_only=summary_only,
+        )
+
+        self._merge_preview_cache[key] = preview
+        self._merge_preview_cache.move_to_end(key)
+        while len(self._merge_preview_cache) > self._max_merge_previews:
+            self._merge_preview_cache.popitem(last=False)
+        return preview
+
     def remove_units_from_merge_if_possible(self, merge_unit_ids):
         """
         Check if selected units are in a merge group. If they are, remove them.
@@ -1062,11 +1504,11 @@ class Controller():
         if len(indices) == 0:
             return False
         spike_inds = self.get_spike_indices(unit_id, segment_index=None)
-        if not np.all(np.isin(indices, spike_inds)):
+        # convert selected indices to indices within the spike train of the unit (both are sorted)
+        positions, found = find_in_sorted(spike_inds, indices)
+        if not np.all(found):
             return False
-
-        # convert selected indices to indices within the spike train of the unit
-        indices = [np.where(spike_inds == ind)[0][0] for ind in indices]
+        indices = positions.tolist()
 
         new_split = {
             "unit_id": unit_id,
@@ -0,0 +1,156 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def make_correlogram_bins(sampling_frequency, window_ms, bin_ms):
+    """Make the bins of the correlograms exactly like the `correlograms` extension.
+
+    Returns
+    -------
+    bins : np.array
+        The bin edges in ms.
+    window_size : int
+        The half window in samples.
+    bin_size : int
+        The bin size in samples.
+    """
+    window_size = int(round(sampling_frequency * window_ms / 2 * 1e-3))
+    bin_size = int(round(sampling_frequency * bin_ms * 1e-3))
+    assert bin_size > 0, "bin_ms is too small"
+    window_size -= window_size % bin_size
+    num_bins = 2 * int(window_size / bin_size)
+    assert num_bins >= 1, "Number of bins must be >= 1"
+    bins = np.arange(-window_size, window_size + bin_size, bin_size) * 1e3 / sampling_frequency
+    return bins, window_size, bin_size
+
+
+def compute_pair_correlogram(times1, times2, window_size, bin_size, auto=False, chunk_size=100_000):
+    """Cross-correlogram between two sorted spike trains of one segment.
+
+    For each spike of `times1`, the spikes of `times2` in the window are found with a binary search
+    (a sorted merge of the two trains) and all the lags are binned at once.
+    The convention is the one of the `correlograms` extension: the lag is `t1 - t2`,
+    in [-window_size, window_size[ and binned with a floor division by `bin_size`.
+
+    Parameters
+    ----------
+    times1, times2 : np.array
+        The sorted spike sample indices.
+    window_size : int
+        The half window in samples.
+    bin_size : int
+        The bin size in samples.
+    auto : bool, default: False
+        If True, the trains are the same and the lag of each spike with itself is not counted.
+    chunk_size : int, default: 100_000
+        The spikes of `times1` are processed by chunks to bound the memory of the lags.
+
+    Returns
+    -------
+    counts : np.array
+        The counts of shape (num_bins,).
+    """
+    num_half_bins = int(window_size // bin_size)
+    num_bins = 2 * num_half_bins
+    counts = np.zeros(num_bins, dtype="int64")
+    times1 = np.asarray(times1, dtype="int64")
+    times2 = np.asarray(times2, dtype="int64")
+    if times1.size == 0 or times2.size == 0:
+        return counts
+
+    for start in range(0, times1.size, chunk_size):
+        t1 = times1[start:start + chunk_size]
+        # -window_size <= t1 - t2 < window_size
+        lo = np.searchsorted(times2, t1 - window_size, side="right")
+        hi = np.searchsorted(times2, t1 + window_size, side="right")
+        num_lags = hi - lo
+        total = int(num_lags.sum())
+        if total == 0:
+            continue
+        # index in times2 of each lag: lo of its spike + rank inside the window
+        run_starts = np.cumsum(num_lags) - num_lags
+        inds2 = np.arange(total) - np.repeat(run_starts - lo, num_lags)
+        lags = np.repeat(t1, num_lags) - times2[inds2]
+        counts += np.bincount(lags // bin_size + num_half_bins, minlength=num_bins)[:num_bins]
+
+    if auto:
+        # each spike with itself
+        counts[num_half_bins] -= times1.size
+    return counts
+
+
+class CorrelogramCache:
+    """Correlograms computed on demand, pair by pair, and cached.
+
+    Only the pairs of units requested by a view are computed (for instance the visible units), the
+    other pairs are computed lazily when they are requested. The correlograms are cached per
+    (pair, window, bin), so changing the visible units only computes the new pairs.
+
+    Parameters
+    ----------
+    get_spike_times_func : callable
+        Function with signature `(unit_index, segment_index) -> sorted sample indices`.
+    num_segments : int
+        The number of segments.
+    sampling_frequency : float
+        The sampling frequency.
+    max_pairs : int, default: 10000
+        The maximum number of cached correlograms, least recently used ones are evicted above it.
+    """
+    def __init__(self, get_spike_times_func, num_segments, sampling_frequency, max_pairs=10000):
+        self.get_spike_times_func = get_spike_times_func
+        self.num_segments = num_segments
+        self.sampling_frequency = sampling_frequency
+        self.max_pairs = int(max_pairs)
+
+        # (unit_index1, unit_index2, window_size, bin_size) -> counts
+        self._pairs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._pairs.clear()
+
+    def get_pair_correlogram(self, unit_index1, unit_index2, window_size, bin_size):
+        key = (int(unit_index1), int(unit_index2), int(window_size), int(bin_size))
+        with self._lock:
+            counts = self._pairs.get(key)
+            if counts is not None:
+                self._pairs.move_to_end(key)
+                return counts
+
+        auto = unit_index1 == unit_index2
+        counts = None
+        for segment_index in range(self.num_segments):
+            times1 = self.get_spike_times_func(unit_index1, segment_index)
+            times2 = times1 if auto else self.get_spike_times_func(unit_index2, segment_index)
+            c = compute_pair_correlogram(times1, times2, window_size, bin_size, auto=auto)
+            counts = c if counts is None else counts + c
+
+        with self._lock:
+            self._pairs[key] = counts
+            self._pairs.move_to_end(key)
+            while len(self._pairs) > self.max_pairs:
+                self._pairs.popitem(last=False)
+        return counts
+
+    def get_correlograms(self, unit_indices, window_ms, bin_ms):
+        """Get the correlograms between some units.
+
+        Returns
+        -------
+        correlograms : np.array
+            The counts of shape (num_units, num_units, num_bins), in the order of `unit_indices`.
+        bins : np.array
+            The bin edges in ms.
+        """
+        bins, window_size, bin_size = make_correlogram_bins(self.sampling_frequency, window_ms, bin_ms)
+        num_bins = bins.size - 1
+        n = len(unit_indices)
+        correlograms = np.zeros((n, n, num_bins), dtype="int64")
+        for r in range(n):
+            for c in range(n):
+                correlograms[r, c, :] = self.get_pair_correlogram(unit_indices[r], unit_indices[c], window_size, bin_size)
+        return correlograms, bins
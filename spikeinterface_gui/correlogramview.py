@@ -7,32 +7,31 @@ from .view_base import ViewBase
 class CorrelogramView(ViewBase):
     id = "correlogram"
     _supported_backend = ['qt', 'panel']
-    _depend_on = ["correlograms"]
     _settings = [
         {'name': 'window_ms', 'type': 'float', 'value' : 50. },
         {'name': 'bin_ms', 'type': 'float', 'value' : 1.0 },
         {'name': 'display_axis', 'type': 'bool', 'value' : True },
     ]
-    _need_compute = True
+    _need_compute = False
 
     def __init__(self, controller=None, parent=None, backend="qt"):
         ViewBase.__init__(self, controller=controller, parent=parent,  backend=backend)
 
-        self.ccg, self.bins = self.controller.get_correlograms()
         self.figure_cache = {}
         self.max_cache_size = 20
 
     
     def _on_settings_changed(self):
-        self.ccg = None
+        # clear cache
+        self.figure_cache = {}
         self.refresh()
 
-    def _compute(self):
-        self.ccg, self.bins = self.controller.compute_correlograms(
-            self.settings['window_ms'],  self.settings['bin_ms']
+    def get_visible_correlograms(self):
+        """Correlograms of the visible units, only the missing pairs are computed."""
+        visible_unit_ids = self.controller.get_visible_unit_ids()
+        return self.controller.get_unit_correlograms(
+            visible_unit_ids, self.settings['window_ms'], self.settings['bin_ms']
         )
-        # clear cache
-        self.figure_cache = {}
 
     ## Qt ##
 
@@ -54,18 +53,13 @@ class CorrelogramView(ViewBase):
 
         self.grid.clear()
         
-        if self.ccg is None:
-            return
-        
         visible_unit_ids = self.controller.get_visible_unit_ids()
 
         n = len(visible_unit_ids)
-        unit_ids = list(self.controller.unit_ids)
         colors = {
             unit_id: self.get_unit_color(unit_id) for unit_id in visible_unit_ids
         }
-        ccg = self.ccg
-        bins = self.bins
+        ccg, bins = self.get_visible_correlograms()
         
         for r in range(n):
             for c in range(r, n):
@@ -75,9 +69,7 @@ class CorrelogramView(ViewBase):
                     plot = self.figure_cache[(unit_id1, unit_id2)]
                 else:
                     # create new plot
-                    i = unit_ids.index(visible_unit_ids[r])
-                    j = unit_ids.index(visible_unit_ids[c])
-                    count = ccg[i, j, :]
+                    count = ccg[r, c, :]
 
                     plot = pg.PlotItem()
                     if not self.settings['display_axis']:
@@ -123,18 +115,13 @@ class CorrelogramView(ViewBase):
         from bokeh.layouts import gridplot
         from .utils_panel import _bg_color
 
-        if self.ccg is None:
-            return
-
         visible_unit_ids = self.controller.get_visible_unit_ids()
 
         n = len(visible_unit_ids)
-        unit_ids = list(self.controller.unit_ids)
         colors = {
             unit_id: self.get_unit_color(unit_id) for unit_id in visible_unit_ids
         }
-        ccg = self.ccg
-        bins = self.bins
+        ccg, bins = self.get_visible_correlograms()
         figures = []
         first_fig = None
         for r in range(n):
@@ -147,9 +134,7 @@ class CorrelogramView(ViewBase):
                     fig = self.figure_cache[(unit1, unit2)]
                 else:
                     # create new figure
-                    i = unit_ids.index(unit1)
-                    j = unit_ids.index(unit2)
-                    count = ccg[i, j, :]
+                    count = ccg[r, c, :]
 
                     # Create Bokeh figure
                     if first_fig is not None:
@@ -211,4 +196,5 @@ CorrelogramView._gui_help_txt = """
 ## Correlograms View
 
 This view shows the auto-correlograms and cross-correlograms of the selected units.
+Changing the window or the bin only computes the correlograms of the visible units (on demand).
 """
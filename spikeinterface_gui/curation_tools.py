@@ -1,5 +1,7 @@
 import numpy as np
 
+from .correlogram_tools import make_correlogram_bins, compute_pair_correlogram
+
 
 default_label_definitions = {
     "quality": {
@@ -38,3 +40,82 @@ def add_merge(previous_merges, new_merge_unit_ids):
     # Ensure the uniqueness
     new_merges = [{"unit_ids": list(set(gp))} for gp in new_merge_units]
     return new_merges
+
+
+def compute_merge_preview(spike_indices_list, spikes, num_segments, sampling_frequency, total_duration_s,
+                          amplitudes=None, window_ms=50., bin_ms=1., isi_threshold_ms=1.5, min_isi_ms=0.,
+                          num_amplitude_bins=100, summary_only=False):
+    """Summaries of the unit that would result from the merge of some units, from their spike trains.
+
+    Parameters
+    ----------
+    spike_indices_list : list of np.array
+        The indices (in `spikes`) of the spikes of each unit of the group.
+    spikes : SpikeTable | np.array
+        The spikes, sorted by segment and sample.
+    num_segments : int
+        The number of segments.
+    sampling_frequency : float
+        The sampling frequency.
+    total_duration_s : float
+        The total duration of all segments, in seconds.
+    amplitudes : np.array | None, default: None
+        The amplitude of every spike, the amplitude histogram is not computed if None.
+    window_ms, bin_ms : float, default: 50., 1.
+        The window and the bin of the auto-correlogram.
+    isi_threshold_ms, min_isi_ms : float, default: 1.5, 0.
+        The ISI violation thresholds, like the `isi_violation` quality metric.
+    num_amplitude_bins : int, default: 100
+        The number of bins of the amplitude histogram.
+    summary_only : bool, default: False
+        If True, only the cheap summaries (number of spikes, firing rate and ISI violations) are
+        computed, the auto-correlogram and the amplitude histogram are None.
+
+    Returns
+    -------
+    preview : dict
+        With keys "num_spikes", "firing_rate", "isi_violations_ratio", "isi_violations_count",
+        "auto_correlogram", "correlogram_bins", "amplitude_histogram" and "amplitude_bins".
+    """
+    # spikes are sorted by segment and sample: sorting the indices merges the spike trains
+    merged_inds = np.sort(np.concatenate(spike_indices_list))
+    num_spikes = merged_inds.size
+    segment_indices = spikes["segment_index"][merged_inds]
+    sample_indices = spikes["sample_index"][merged_inds]
+    segment_bounds = np.searchsorted(segment_indices, np.arange(num_segments + 1))
+
+    if summary_only:
+        bins, auto_correlogram = None, None
+    else:
+        bins, window_size, bin_size = make_correlogram_bins(sampling_frequency, window_ms, bin_ms)
+        auto_correlogram = np.zeros(bins.size - 1, dtype="int64")
+    isi_threshold = isi_threshold_ms * sampling_frequency / 1000.
+    isi_violations_count = 0
+    for segment_index in range(num_segments):
+        samples = sample_indices[segment_bounds[segment_index]:segment_bounds[segment_index + 1]]
+        if not summary_only:
+            auto_correlogram += compute_pair_correlogram(samples, samples, window_size, bin_size, auto=True)
+        isi_violations_count += int(np.count_nonzero(np.diff(samples) < isi_threshold))
+
+    firing_rate = num_spikes / total_duration_s
+    if num_spikes > 0:
+        violation_time = 2 * num_spikes * (isi_threshold_ms - min_isi_ms) / 1000.
+        isi_violations_ratio = (isi_violations_count / violation_time) / firing_rate
+    else:
+        isi_violations_ratio = np.nan
+
+    amplitude_histogram, amplitude_bins = None, None
+    if amplitudes is not None and num_spikes > 0 and not summary_only:
+        amplitude_histogram, amplitude_bins = np.histogram(amplitudes[merged_inds], bins=num_amplitude_bins)
+
+    preview = dict(
+        num_spikes=num_spikes,
+        firing_rate=firing_rate,
+        isi_violations_ratio=isi_violations_ratio,
+        isi_violations_count=isi_violations_count,
+        auto_correlogram=auto_correlogram,
+        correlogram_bins=bins,
+        amplitude_histogram=amplitude_histogram,
+        amplitude_bins=amplitude_bins,
+    )
+    return preview
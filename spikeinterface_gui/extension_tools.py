@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from spikeinterface.core.sortinganalyzer import get_extension_class
+
+
+class LazyExtensionData:
+    """Lazy accessor for the data of analyzer extensions.
+
+    Each entry is registered with a loading function that is only called the first time
+    the entry is requested by a view. The loading time of each entry is kept in `load_times`.
+    Entries can also be preloaded concurrently with `load_all(n_jobs=...)`: the reads
+    are independent so the total time is bound by the slowest extension.
+
+    The analyzer is not thread safe: `analyzer.extensions` is only modified while holding
+    `analyzer_lock`. The extension files are read outside of the lock (an extension object is
+    loaded on its own, then inserted in the analyzer), so only the reads run in parallel.
+
+    Parameters
+    ----------
+    analyzer : SortingAnalyzer
+        The sorting analyzer holding the extensions.
+    skip_extensions : list | None, default: None
+        Extensions that must never be loaded: their entries always return the default value.
+    verbose : bool, default: False
+        If True, print the loading time of every entry.
+    """
+    def __init__(self, analyzer, skip_extensions=None, verbose=False):
+        self.analyzer = analyzer
+        self.skip_extensions = skip_extensions if skip_extensions is not None else []
+        self.verbose = verbose
+
+        self.analyzer_lock = threading.RLock()
+
+        self._loaders = {}
+        self._preload = {}
+        self._data = {}
+        # one lock per entry, so that different entries can be loaded in parallel
+        self._locks = {}
+        self.load_times = {}
+
+    def register(self, name, loader, preload=True):
+        """Register a custom loading function (without arguments) for the entry `name`.
+
+        Entries with `preload=False` are skipped by `load_all()` and only loaded on first access,
+        this is needed for loaders that can compute an extension.
+        """
+        self._loaders[name] = loader
+        self._preload[name] = preload
+        self._locks[name] = threading.Lock()
+        self._data.pop(name, None)
+
+    def register_extension(self, name, extension_name, getter=None, default=None, lazy=False):
+        """Register an entry `name` that reads the data of the extension `extension_name`.
+
+        Parameters
+        ----------
+        name : str
+            The name of the entry.
+        extension_name : str
+            The analyzer extension to read from.
+        getter : callable | None, default: None
+            Function applied to the extension object. If None, `ext.get_data()` is used.
+        default : object, default: None
+            Value returned when the extension is skipped or not computed.
+        lazy : bool, default: False
+            If True, a saved extension is loaded lazily: its arrays stay memmaps (or zarr arrays)
+            and only the parts accessed by the getter or the views are read.
+            The memmaps are closed when the extension is garbage collected, so the getter must
+            return the extension itself (not only its arrays).
+        """
+        if extension_name in self.skip_extensions:
+            if self.verbose:
+                print(f'\tSkipping {extension_name}')
+            self._loaders.pop(name, None)
+            self._data[name] = default
+            return
+
+        def loader():
+            ext = self.get_extension(extension_name, lazy=lazy)
+            if ext is None:
+                return default
+            if getter is None:
+                return ext.get_data()
+            return getter(ext)
+
+        self.register(name, loader)
+
+    def get_extension(self, extension_name, lazy=False):
+        """Thread safe `analyzer.get_extension()`.
+
+        The extension is read outside of `analyzer_lock` and inserted in `analyzer.extensions` under it.
+        With `lazy=True`, a saved extension is loaded lazily and not inserted: a later
+        `analyzer.get_extension()` loads it fully.
+        """
+        with self.analyzer_lock:
+            if self.analyzer.format == "memory" or extension_name in self.analyzer.extensions:
+                return self.analyzer.get_extension(extension_name)
+            if not self.analyzer.has_extension(extension_name):
+                return None
+        # like analyzer.load_extension(), which also loads lazily for a lazy analyzer
+        analyzer_lazy = getattr(self.analyzer, "_lazy", False)
+        ext = get_extension_class(extension_name).load(self.analyzer, lazy=lazy or analyzer_lazy)
+        if ext is None or (lazy and not analyzer_lazy):
+            return ext
+        with self.analyzer_lock:
+            # another thread could have inserted it in the meantime
+            return self.analyzer.extensions.setdefault(extension_name, ext)
+
+    def is_loaded(self, name):
+        return name in self._data
+
+    def get(self, name):
+        """Get the data of the entry `name`, loading it on first access."""
+        if name in self._data:
+            return self._data[name]
+        with self._locks[name]:
+            # another thread could have loaded it in the meantime
+            if name not in self._data:
+                t0 = time.perf_counter()
+                self._data[name] = self._loaders[name]()
+                t1 = time.perf_counter()
+                self.load_times[name] = t1 - t0
+                if self.verbose:
+                    print(f'\tLoading {name} took {t1 - t0:.3f} s')
+        return self._data[name]
+
+    def set(self, name, value):
+        """Replace the data of the entry `name`, for instance after a re-computation."""
+        self._data[name] = value
+
+    def load_all(self, n_jobs=1):
+        """Load all the registered entries that are not loaded yet (except the ones registered with `preload=False`).
+
+        Parameters
+        ----------
+        n_jobs : int, default: 1
+            Number of threads used to load the entries. -1 means the number of cpus.
+
+        Returns
+        -------
+        load_times : dict
+            The loading time in seconds of the entries loaded by this call.
+        """
+        names = [name for name in self._loaders.keys() if name not in self._data and self._preload[name]]
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        n_jobs = min(n_jobs, len(names))
+
+        t0 = time.perf_counter()
+        if n_jobs <= 1:
+            for name in names:
+                self.get(name)
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                # consume results to join and propagate errors
+                list(executor.map(self.get, names))
+        t1 = time.perf_counter()
+        if self.verbose and len(names) > 0:
+            print(f'\tLoading {len(names)} extensions with n_jobs={max(n_jobs, 1)} took {t1 - t0:.3f} s')
+
+        return {name: self.load_times[name] for name in names if name in self.load_times}
+
+    def load_all_async(self, n_jobs=1):
+        """Start `load_all()` in a background thread and return a `Future` to join it."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.load_all, n_jobs=n_jobs)
+        executor.shutdown(wait=False)
+        return future
@@ -41,6 +41,13 @@ def run_mainwindow(
     verbose: bool = False,
     user_settings: dict | None = None,
     disable_save_settings_button: bool = False,
+    extension_loading_n_jobs: int | None = None,
+    use_index_cache: bool = True,
+    traces_cache_size_mb: float | None = 512,
+    trace_overview: bool = False,
+    use_traces_disk_cache: bool = False,
+    traces_disk_cache_folder: str | Path | None = None,
+    traces_disk_cache_warm_n_jobs: int | None = None,
 ):
     """
     Create the main window and start the QT app loop.
@@ -109,6 +116,29 @@ def run_mainwindow(
         A dictionary of user settings for each view, which overwrite the default settings.
     disable_save_settings_button: bool, default: False
         If True, disables the "save default settings" button, so that user cannot do this.
+    extension_loading_n_jobs: int | None, default: None
+        If None, extensions are loaded lazily when a view needs them.
+        Otherwise, all extensions are preloaded at startup with a pool of this number of threads
+        (-1 means the number of cpus). This is useful for slow file systems (NFS).
+    use_index_cache: bool, default: True
+        If True, the spike index built by the GUI is saved in the user cache folder
+        ("~/.cache/spikeinterface_gui/index") and memory-mapped on the next launch of the same analyzer.
+    traces_cache_size_mb: float | None, default: 512
+        The memory budget of the LRU cache of traces used when scrolling. None or 0 disables the cache.
+    trace_overview: bool, default: False
+        If True, a multi-resolution overview (min/max/rms pyramid) of the traces is used by the trace map
+        view for long windows. It is built once in background and stored in the analyzer folder (or zarr
+        group) in "spikeinterface_gui/overview".
+    use_traces_disk_cache: bool, default: False
+        If True, the preprocessed traces are written to a local binary cache the first time they are read
+        and read back from disk afterwards (also in the next sessions). The cache is invalidated when the
+        recording or its preprocessing changes.
+    traces_disk_cache_folder: str | Path | None, default: None
+        The folder of the traces disk cache. If None, a folder per recording in the user cache folder
+        ("~/.cache/spikeinterface_gui/traces") is used.
+    traces_disk_cache_warm_n_jobs: int | None, default: None
+        If not None, the whole recording is written to the traces disk cache in background at startup
+        with this number of threads (-1 means the number of cpus).
     """
 
     if mode == "desktop":
@@ -165,7 +195,14 @@ def run_mainwindow(
         external_data=external_data,
         curation_callback=curation_callback,
         curation_callback_kwargs=curation_callback_kwargs,
-        user_main_settings=user_main_settings
+        user_main_settings=user_main_settings,
+        extension_loading_n_jobs=extension_loading_n_jobs,
+        use_index_cache=use_index_cache,
+        traces_cache_size_mb=traces_cache_size_mb,
+        trace_overview=trace_overview,
+        use_traces_disk_cache=use_traces_disk_cache,
+        traces_disk_cache_folder=traces_disk_cache_folder,
+        traces_disk_cache_warm_n_jobs=traces_disk_cache_warm_n_jobs,
     )
     if verbose:
         t1 = time.perf_counter()
@@ -323,6 +360,12 @@ def run_mainwindow_cli():
     parser.add_argument('--curation-file', help='Path to json file defining a curation', default=None)
     parser.add_argument('--settings-file', help='Path to json file specifying the settings of each view', default=None)
     parser.add_argument('--disable_save_settings_button', help='Disables button allowing for user to save default settings', action='store_true', default=False)
+    parser.add_argument('--no-index-cache', help='Do not use the GUI index cache stored in the user cache folder', action='store_true', default=False)
+    parser.add_argument('--trace-overview', help='Build (or use) the multi-resolution traces overview stored in the analyzer folder', action='store_true', default=False)
+    parser.add_argument('--traces-disk-cache', help='Cache the preprocessed traces on disk while browsing', action='store_true', default=False)
+    parser.add_argument('--traces-disk-cache-folder', help='Folder of the traces disk cache (default in the user cache folder)', default=None)
+    parser.add_argument('--warm-traces-cache-n-jobs', help='Fill the whole traces disk cache in background with this number of threads (-1 for all cpus)', default=None, type=int)
+    parser.add_argument('--extension-loading-n-jobs', help='Preload all extensions at startup with this number of threads (-1 for all cpus)', default=None, type=int)
 
     args = parser.parse_args(argv)
 
@@ -391,6 +434,12 @@ def run_mainwindow_cli():
             curation_dict=curation_data,
             user_settings=user_settings,
             disable_save_settings_button=disable_save_settings_button,
+            extension_loading_n_jobs=args.extension_loading_n_jobs,
+            use_index_cache=not(args.no_index_cache),
+            trace_overview=args.trace_overview,
+            use_traces_disk_cache=args.traces_disk_cache or args.traces_disk_cache_folder is not None,
+            traces_disk_cache_folder=args.traces_disk_cache_folder,
+            traces_disk_cache_warm_n_jobs=args.warm_traces_cache_n_jobs,
         )
 
 def find_skippable_extensions(layout_dict):
@@ -398,6 +447,10 @@ def find_skippable_extensions(layout_dict):
     Returns the extensions which don't need to be loaded, depending on which views the user
     wants to load. Does this by taking all possible extensions, then removing any which are
     needed by a view.
+
+    Note that the controller loads extensions lazily on the first request of a view, so
+    skipping extensions is only an optimization (it avoids the loading of an extension
+    by a view which is not displayed).
     """
     possible_class_views = get_all_possible_views()
     all_extensions = set(get_available_analyzer_extensions())
@@ -107,7 +107,8 @@ class MergeView(ViewBase):
             else:
                 more_labels.append([lbl + "_min", lbl + "_max"])
 
-        labels = [f"unit_id{i}" for i in range(max_group_size)] + more_labels + ["group_ids"]
+        preview_labels = ["merged_firing_rate", "merged_isi_violations_ratio"]
+        labels = [f"unit_id{i}" for i in range(max_group_size)] + more_labels + preview_labels + ["group_ids"]
 
         rows = []
         unit_ids = list(self.controller.unit_ids)
@@ -142,6 +143,12 @@ class MergeView(ViewBase):
                     elif f"{info_name}_min" in labels:
                         labels.remove(f"{info_name}_min")
                         labels.remove(f"{info_name}_max")
+
+            # summaries of the merged unit (cached by the controller)
+            # only the cheap columns, the full preview is computed for the selected row
+            preview = self.controller.get_merge_preview(group_ids, summary_only=True)
+            row["merged_firing_rate"] = f"{preview['firing_rate']:.2f}"
+            row["merged_isi_violations_ratio"] = f"{preview['isi_violations_ratio']:.2f}"
             rows.append(row)
         return labels, rows
 
@@ -190,9 +197,33 @@ class MergeView(ViewBase):
             return
         
         self.controller.set_visible_unit_ids(group_ids)
+        self._qt_update_merge_preview(group_ids)
 
         self.notify_unit_visibility_changed()
 
+    def _qt_update_merge_preview(self, group_ids):
+        import pyqtgraph as pg
+
+        self.preview_acg_plot.clear()
+        self.preview_amplitude_plot.clear()
+        if group_ids is None:
+            return
+
+        preview = self.controller.get_merge_preview(group_ids)
+        color = (200, 200, 200, 180)
+        curve = pg.PlotCurveItem(preview["correlogram_bins"], preview["auto_correlogram"], stepMode='center',
+                                 fillLevel=0, brush=color, pen=color)
+        self.preview_acg_plot.addItem(curve)
+        self.preview_acg_plot.setTitle(
+            f"merged n={preview['num_spikes']} rate={preview['firing_rate']:.2f}Hz "
+            f"ISI viol.={preview['isi_violations_ratio']:.2f}"
+        )
+        if preview["amplitude_histogram"] is not None:
+            curve = pg.PlotCurveItem(preview["amplitude_bins"], preview["amplitude_histogram"], stepMode='center',
+                                     fillLevel=0, brush=color, pen=color)
+            self.preview_amplitude_plot.addItem(curve)
+            self.preview_amplitude_plot.setTitle("merged amplitudes")
+
     def _qt_on_double_click(self, item):
         self.accept_group_merge(item.group_ids)
 
@@ -262,6 +293,13 @@ class MergeView(ViewBase):
         self.layout.addWidget(self.table)
         self.table.itemSelectionChanged.connect(self._qt_on_item_selection_changed)
 
+        # preview of the merged unit of the selected group
+        self.preview_view = pg.GraphicsLayoutWidget()
+        self.preview_view.setMaximumHeight(200)
+        self.preview_acg_plot = self.preview_view.addPlot()
+        self.preview_amplitude_plot = self.preview_view.addPlot()
+        self.layout.addWidget(self.preview_view)
+
         shortcut_accept = QT.QShortcut(self.qt_widget)
         shortcut_accept.setKey(QT.QKeySequence('ctrl+a'))
         shortcut_accept.activated.connect(self._qt_on_accept_shorcut)
@@ -331,6 +369,7 @@ class MergeView(ViewBase):
     ## PANEL
     def _panel_make_layout(self):
         import panel as pn
+        from bokeh.models import ColumnDataSource
         from .utils_panel import KeyboardShortcut, KeyboardShortcuts
         from .backend_panel import create_dynamic_parameterized, SettingsProxy
 
@@ -377,18 +416,71 @@ class MergeView(ViewBase):
             calculate_list.append(self.include_deleted)
         calculate_row = pn.Row(*calculate_list, sizing_mode="stretch_width")
 
+        # preview of the merged unit of the selected group
+        self.preview_acg_source = ColumnDataSource({"left": [], "right": [], "top": []})
+        self.preview_amplitude_source = ColumnDataSource({"left": [], "right": [], "top": []})
+        self.preview_acg_fig = self._panel_make_preview_figure(self.preview_acg_source, "Lag (ms)")
+        self.preview_amplitude_fig = self._panel_make_preview_figure(self.preview_amplitude_source, "Amplitude")
+        preview_row = pn.Row(
+            pn.pane.Bokeh(self.preview_acg_fig, sizing_mode="stretch_width"),
+            pn.pane.Bokeh(self.preview_amplitude_fig, sizing_mode="stretch_width"),
+            sizing_mode="stretch_width",
+        )
+
         self.layout = pn.Column(
             # add params
             self.preset_selector, 
             self.preset_params_selectors[self.preset],
             calculate_row,
             self.table_area,
+            preview_row,
             shortcuts_component,
             scroll=True,
             sizing_mode="stretch_width",
         )
 
 
+    def _panel_make_preview_figure(self, source, x_axis_label):
+        import bokeh.plotting as bpl
+        from .utils_panel import _bg_color
+
+        fig = bpl.figure(
+            height=200,
+            sizing_mode="stretch_width",
+            tools="pan,wheel_zoom,reset",
+            x_axis_label=x_axis_label,
+            background_fill_color=_bg_color,
+            border_fill_color=_bg_color,
+            outline_line_color="white",
+        )
+        fig.toolbar.logo = None
+        fig.quad(left="left", right="right", top="top", bottom=0, source=source,
+                 fill_color="lightgray", line_color="lightgray", alpha=0.7)
+        return fig
+
+    def _panel_update_merge_preview(self, group_ids):
+        import panel as pn
+
+        preview = self.controller.get_merge_preview(group_ids)
+        bins = preview["correlogram_bins"]
+        acg_data = {"left": bins[:-1], "right": bins[1:], "top": preview["auto_correlogram"]}
+        if preview["amplitude_histogram"] is not None:
+            bins = preview["amplitude_bins"]
+            amplitude_data = {"left": bins[:-1], "right": bins[1:], "top": preview["amplitude_histogram"]}
+        else:
+            amplitude_data = {"left": [], "right": [], "top": []}
+        title = (
+            f"merged n={preview['num_spikes']} rate={preview['firing_rate']:.2f}Hz "
+            f"ISI viol.={preview['isi_violations_ratio']:.2f}"
+        )
+
+        def _do_update():
+            self.preview_acg_source.data = acg_data
+            self.preview_amplitude_source.data = amplitude_data
+            self.preview_acg_fig.title.text = title
+
+        pn.state.execute(_do_update, schedule=True)
+
     def _panel_refresh(self):
         """Update the table with current data"""
         import pandas as pd
@@ -462,6 +554,7 @@ class MergeView(ViewBase):
                 unit_id = value["id"]
                 visible_unit_ids.append(unit_id)
         self.controller.set_visible_unit_ids(visible_unit_ids)
+        self._panel_update_merge_preview(visible_unit_ids)
         self.notify_unit_visibility_changed()
 
     def _panel_handle_shortcut(self, event):
@@ -519,6 +612,10 @@ The available presets are inherited from spikeinterface.
 Click "Calculate merges" to compute the potential merges. When finished, the table will be populated 
 with the potential merges.
 
+The table also gives the firing rate and the ISI violation ratio of the merged unit. When a group is selected,
+the auto-correlogram and the amplitude distribution of the merged unit are displayed below the table.
+They are computed from the spike trains, before the merge is accepted.
+
 ### Controls
 - **left click** : select a potential merge group
 - **arrow up/down** : navigate through the potential merge groups
@@ -4,9 +4,9 @@ This try to mimic `RGGobi viewer package <http://www.ggobi.org/rggobi/>`_.
 
 import itertools
 import numpy as np
-from matplotlib.path import Path as mpl_path
 
 from .view_base import ViewBase
+from .selection_tools import select_points_in_polygons
 
 
 class NDScatterView(ViewBase):
@@ -24,29 +24,40 @@ class NDScatterView(ViewBase):
         
         assert controller.has_extension('principal_components')
 
-        self.pc_unit_index, self.pc_data = controller.get_all_pcs()
-        self.data = self.pc_data.swapaxes(1,2).reshape(self.pc_data.shape[0], -1)
+        # the projections are read on demand, only for the visible units and channels
+        self.pc_reader = controller.get_pc_reader()
+        self.pc_unit_index = self.pc_reader.spike_unit_indices
         self.random_spikes_indices = controller.random_spikes_indices
-        
-        if self.data.shape[1] == 1:
-            # corner case one PC and one channel only, then force 2D
-            data = np.zeros((self.data.shape[0], 2), dtype=self.data.dtype)
-            data[:, 0] = self.data[:, 0]
-            data[:, 1] = self.data[:, 0]
-            self.data = data
-
-        ndim = self.data.shape[1]
+        self.num_components = self.pc_reader.num_components
+
+        # features are ordered channel by channel: feature = channel_index * num_components + pc
+        ndim = self.pc_reader.num_channels * self.num_components
+        # corner case one PC and one channel only, then force 2D (the same feature twice)
+        self._force_2d = ndim == 1
+        self.ndim = max(ndim, 2)
+
+        # block of the visible units restricted to the selected components and the output buffer
+        # of the projection, rebuilt only when the unit or channel visibility changes
+        self._block_key = None
+        self._block_data = None
+        self._block_spike_indices = None
+        self._block_unit_slices = None
+        self._projected_buffer = None
+
+        ndim = self.ndim
         self.selected_comp = np.ones((ndim), dtype='bool')
         self.projection = self.get_one_random_projection()
 
         #estimate limits
-        data = self.data
-        if data.shape[0] > 1000:
-            inds = np.random.choice(data.shape[0], 1000, replace=False)
-            data = data[inds, :]
+        num_spikes = self.pc_reader.num_spikes
+        if num_spikes > 1000:
+            rows = np.sort(np.random.choice(num_spikes, 1000, replace=False))
+        else:
+            rows = np.arange(num_spikes)
+        data = self.get_features(self.pc_reader.get_projections(rows))
         projected = self.apply_dot(data)
         projected_2d = projected[:, :2]
-        self.limit = float(np.percentile(np.abs(projected_2d), 95) * 2.)
+        self.limit = float(np.percentile(np.abs(projected_2d), 95) * 2.) if projected_2d.size > 0 else 0.
         self.limit = max(self.limit, 0.1)  # ensure limit is at least 0.1
 
 
@@ -63,7 +74,7 @@ class NDScatterView(ViewBase):
         
     def new_tour_step(self):
         num_step = self.settings['num_step']
-        ndim = self.data.shape[1]
+        ndim = self.ndim
         
         if self.tour_step == 0:
             self.tour_steps = np.empty( (ndim , 2 ,  num_step))
@@ -87,7 +98,7 @@ class NDScatterView(ViewBase):
     def next_face(self):
         self.n_face += 1
         self.n_face = self.n_face%len(self.hyper_faces)
-        ndim = self.data.shape[1]
+        ndim = self.ndim
         self.projection = np.zeros( (ndim, 2))
         i, j = self.hyper_faces[self.n_face]
         self.projection[i,0] = 1.
@@ -96,7 +107,7 @@ class NDScatterView(ViewBase):
         self.refresh()
 
     def get_one_random_projection(self):
-        ndim = self.data.shape[1]
+        ndim = self.ndim
         projection = np.random.rand(ndim,2)*2-1.
         projection[~self.selected_comp] = 0
         m = np.sqrt(np.sum(projection**2, axis=0))
@@ -117,10 +128,77 @@ class NDScatterView(ViewBase):
     def on_channel_visibility_changed(self):
         self.random_projection()
 
+    def get_features(self, projections, comp_inds=None):
+        """Flatten projections of shape (num_spikes, num_components, num_channels) to features.
+
+        If `comp_inds` is given, the projections must be restricted to the channels of these features.
+        """
+        if comp_inds is None:
+            data = projections.swapaxes(1, 2).reshape(projections.shape[0], -1)
+            if self._force_2d:
+                data = np.repeat(data, 2, axis=1)
+            return data
+        chan_inds, pc_inds = np.divmod(comp_inds, self.num_components)
+        local_chan_inds = np.searchsorted(np.unique(chan_inds), chan_inds)
+        return projections[:, pc_inds, local_chan_inds]
+
     def apply_dot(self, data):
         projected = np.dot(data[:, self.selected_comp], self.projection[self.selected_comp, :])
         return projected
 
+    def get_visible_block(self):
+        """
+        Get the pc data of the visible units restricted to the selected components.
+
+        The block is cached and only rebuilt when the visible units or the selected components change.
+
+        Returns
+        -------
+        block_data : np.array
+            The data of shape (num_spikes, num_selected_components), grouped by unit.
+        block_spike_indices : np.array
+            The spike indices of the rows of the block.
+        block_unit_slices : dict
+            The slice of rows of each visible unit.
+        """
+        visible_unit_inds = tuple(int(unit_ind) for unit_ind, _ in self.controller.iter_visible_units())
+        key = (visible_unit_inds, self.selected_comp.tobytes())
+        if key != self._block_key:
+            comp_inds = np.flatnonzero(self.selected_comp)
+            if self._force_2d:
+                comp_inds = np.zeros_like(comp_inds)
+            channel_indices = np.unique(comp_inds // self.num_components)
+            blocks = []
+            spike_indices = []
+            self._block_unit_slices = {}
+            start = 0
+            for unit_ind, unit_id in self.controller.iter_visible_units():
+                projections = self.pc_reader.get_unit_projections(unit_ind, channel_indices)
+                blocks.append(self.get_features(projections, comp_inds))
+                spike_indices.append(self.random_spikes_indices[self.pc_reader.get_unit_rows(unit_ind)])
+                self._block_unit_slices[unit_id] = slice(start, start + projections.shape[0])
+                start += projections.shape[0]
+            if len(blocks) > 0:
+                self._block_data = np.ascontiguousarray(np.concatenate(blocks, axis=0))
+                self._block_spike_indices = np.concatenate(spike_indices)
+            else:
+                self._block_data = np.zeros((0, comp_inds.size), dtype=self.pc_reader.dtype)
+                self._block_spike_indices = np.array([], dtype='int64')
+            self._projected_buffer = np.empty((start, 2), dtype=self._block_data.dtype)
+            self._block_key = key
+        return self._block_data, self._block_spike_indices, self._block_unit_slices
+
+    def project_visible_units(self):
+        """
+        Project the visible units on the current projection with a single matrix product.
+
+        The result is written in a preallocated buffer which is overwritten by the next call.
+        """
+        block_data, _, _ = self.get_visible_block()
+        projection = self.projection[self.selected_comp, :].astype(block_data.dtype, copy=False)
+        np.dot(block_data, projection, out=self._projected_buffer)
+        return self._projected_buffer
+
     def get_plotting_data(self, return_spike_indices=False):
         """
         Get the data to plot in the scatter plot.
@@ -139,31 +217,27 @@ class NDScatterView(ViewBase):
         scatter_y = {}
         all_limits = []
         spike_indices = {}
+        all_projected = self.project_visible_units()
+        _, block_spike_indices, block_unit_slices = self.get_visible_block()
         for unit_ind, unit_id in self.controller.iter_visible_units():
-            mask = np.flatnonzero(self.pc_unit_index == unit_ind)
-            projected = self.apply_dot(self.data[mask, :])
+            unit_slice = block_unit_slices[unit_id]
+            projected = all_projected[unit_slice]
             scatter_x[unit_id] = projected[:, 0]
             scatter_y[unit_id] = projected[:, 1]
             if self.auto_update_limit and len(projected) > 0:
                 projected_2d = projected[:, :2]
                 all_limits.append(float(np.percentile(np.abs(projected_2d), 95) * 2.))
             if return_spike_indices:
-                # TODO: Alessio double check this
-                spike_indices[unit_id] = self.random_spikes_indices[mask]
+                spike_indices[unit_id] = block_spike_indices[unit_slice]
         if len(all_limits) > 0 and self.auto_update_limit:
             self.limit = max(all_limits)
         
         self.limit = max(self.limit, 0.1)  # ensure limit is at least 0.1
 
-        mask = np.isin(self.random_spikes_indices, self.controller.get_indices_spike_selected())
-        data_sel = self.data[mask, :]
-        if len(data_sel) == 0:
-            selected_scatter_x = np.array([])
-            selected_scatter_y = np.array([])
-        else:
-            projected_select = self.apply_dot(data_sel)
-            selected_scatter_x = projected_select[:, 0]
-            selected_scatter_y = projected_select[:, 1]
+        # selected spikes among the visible ones, already projected
+        mask = self.controller.is_spike_selected(block_spike_indices)
+        selected_scatter_x = all_projected[mask, 0]
+        selected_scatter_y = all_projected[mask, 1]
 
         if return_spike_indices:
             return scatter_x, scatter_y, selected_scatter_x, selected_scatter_y, spike_indices
@@ -172,7 +246,7 @@ class NDScatterView(ViewBase):
     
 
     def update_selected_components(self):
-        n_pc_per_chan = self.pc_data.shape[1]
+        n_pc_per_chan = self.num_components
         n = min(self.settings['num_pc_per_channel'], n_pc_per_chan)
         self.selected_comp[:] = False
         for i in range(n):
@@ -235,7 +309,7 @@ class NDScatterView(ViewBase):
         self.lasso = pg.PlotCurveItem(pen='#7FFF00')
         self.plot.addItem(self.lasso)
         
-        ndim = self.data.shape[1]
+        ndim = self.ndim
 
         self.direction_lines = pg.PlotCurveItem(x=[], y=[], pen=(255,255,255))
         self.direction_data = np.zeros( (ndim*2, 2))
@@ -267,7 +341,7 @@ class NDScatterView(ViewBase):
         
         # self.graphicsview2.setMaximumSize(200, 200)
         
-        self.settings.param('num_pc_per_channel').setLimits((1, self.pc_data.shape[1]))
+        self.settings.param('num_pc_per_channel').setLimits((1, self.num_components))
 
         # the color vector is precomputed
         # spike_colors = self.controller.get_spike_colors(self.pc_unit_index)
@@ -369,11 +443,11 @@ class NDScatterView(ViewBase):
         self._lasso_vertices.append(vertices)
         
         # inside lasso and visible
-        ind_visibles,   = np.nonzero(np.isin(self.random_spikes_indices, self.controller.get_indices_spike_visible()))
-        projected = self.apply_dot(self.data[ind_visibles, :])
-        inside = inside_poly(projected, vertices)
+        projected = self.project_visible_units()
+        _, block_spike_indices, _ = self.get_visible_block()
+        inside = select_points_in_polygons(projected[:, 0], projected[:, 1], [vertices])
         
-        new_selected_inds = self.random_spikes_indices[ind_visibles[inside]]
+        new_selected_inds = block_spike_indices[inside]
         
         if shift_held:
             # Extend existing selection
@@ -492,7 +566,7 @@ class NDScatterView(ViewBase):
 
         # handle selection with lasso
         plotted_spike_indices = self.scatter_source.data.get("spike_indices", [])
-        ind_selected, = np.nonzero(np.isin(plotted_spike_indices, self.controller.get_indices_spike_selected()))
+        ind_selected, = np.nonzero(self.controller.is_spike_selected(plotted_spike_indices))
 
         def _do_update():
             self.scatter_source.selected.indices = ind_selected
@@ -569,9 +643,9 @@ class NDScatterView(ViewBase):
             else:
                 self._lasso_vertices = [polygon]
 
-            # inside lasso and visible
-            ind_visibles, = np.nonzero(np.isin(self.random_spikes_indices, self.controller.get_indices_spike_visible()))
-            inds = self.random_spikes_indices[ind_visibles[selected]]
+            # inside lasso and visible: the plotted points are grouped by unit like the visible block
+            plotted_spike_indices = np.asarray(self.scatter_source.data["spike_indices"], dtype='int64')
+            inds = plotted_spike_indices[selected]
             self.controller.set_indices_spike_selected(inds)
 
             self.notify_spike_selection_changed()
@@ -579,7 +653,9 @@ class NDScatterView(ViewBase):
 
 
 def inside_poly(data, vertices):
-    return mpl_path(vertices).contains_points(data)
+    inside = np.zeros(data.shape[0], dtype=bool)
+    inside[select_points_in_polygons(data[:, 0], data[:, 1], [vertices])] = True
+    return inside
 
 
 NDScatterView._gui_help_txt = """
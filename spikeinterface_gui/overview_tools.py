@@ -0,0 +1,398 @@
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# increase this when the content of the overview changes
+_overview_version = 2
+
+overview_stats = ("min", "max", "rms")
+
+
+class TraceOverview:
+    """Multi-resolution overview (pyramid) of the traces.
+
+    For every segment and every level, each channel is summarized by bins of
+    `bin_size * level_factor ** level` samples with the min, the max and the rms.
+    The pyramid is built once by a background job reading the recording chunk by chunk, and
+    stored next to the analyzer (binary folder or zarr) so that it is reused at the next opening.
+    For in-memory analyzers, if the folder is read-only or if the recording has no fingerprint,
+    it is kept in memory.
+
+    The background job calls `get_traces_func` concurrently with the reads of the views, so this
+    function must be thread safe (the controller serializes the reads of the recording).
+
+    Overviews of minutes to hours are then read from the level with roughly one bin per pixel
+    instead of reading the raw traces.
+
+    Parameters
+    ----------
+    analyzer : SortingAnalyzer
+        The sorting analyzer, used to find where the pyramid is stored.
+    get_traces_func : callable
+        Function with signature `(segment_index, start_frame, end_frame) -> traces`, thread safe.
+    recording_fingerprint : str | None, default: None
+        The fingerprint of the recording and its preprocessing chain (see `get_recording_fingerprint()`),
+        part of the fingerprint of the pyramid. If None, the pyramid is not saved nor loaded.
+    bin_duration : float, default: 0.01
+        The bin duration in seconds of the finest level.
+    level_factor : int, default: 4
+        The decimation factor between 2 levels.
+    min_num_bins : int, default: 1000
+        Levels are added until the coarsest one has less bins than this (for the longest segment).
+    chunk_duration : float, default: 1.0
+        The duration in seconds of the chunks read when building.
+    return_in_uV : bool, default: False
+        Only used for the fingerprint: traces in uV or not.
+    verbose : bool, default: False
+        Print the building progress.
+    """
+    def __init__(
+        self,
+        analyzer,
+        get_traces_func,
+        recording_fingerprint=None,
+        bin_duration=0.01,
+        level_factor=4,
+        min_num_bins=1000,
+        chunk_duration=1.0,
+        return_in_uV=False,
+        verbose=False,
+    ):
+        self.analyzer = analyzer
+        self.get_traces_func = get_traces_func
+        self.recording_fingerprint = recording_fingerprint
+        self.level_factor = int(level_factor)
+        self.return_in_uV = return_in_uV
+        self.verbose = verbose
+
+        sampling_frequency = analyzer.sampling_frequency
+        self.bin_size = max(1, int(bin_duration * sampling_frequency))
+        self.num_channels = analyzer.get_num_channels()
+        self.num_segments = analyzer.get_num_segments()
+        self.num_samples = [analyzer.get_num_samples(segment_index) for segment_index in range(self.num_segments)]
+        # chunks are a multiple of the bin size
+        self.chunk_size = max(1, int(chunk_duration * sampling_frequency) // self.bin_size) * self.bin_size
+
+        self.num_levels = 1
+        while max(self.num_samples) / self.get_level_bin_size(self.num_levels - 1) > min_num_bins:
+            self.num_levels += 1
+
+        self.fingerprint = self._compute_fingerprint()
+
+        # self._levels[segment_index][level][stat] -> array of shape (num_bins, num_channels)
+        self._levels = None
+        self._ready = False
+        self.progress = 0.
+        self._cancel_event = threading.Event()
+        self._future = None
+
+    def _compute_fingerprint(self):
+        info = dict(
+            overview_version=_overview_version,
+            recording_fingerprint=self.recording_fingerprint,
+            bin_size=self.bin_size,
+            level_factor=self.level_factor,
+            num_levels=self.num_levels,
+            num_samples=self.num_samples,
+            channel_ids=[str(channel_id) for channel_id in self.analyzer.channel_ids],
+            sampling_frequency=float(self.analyzer.sampling_frequency),
+            return_in_uV=bool(self.return_in_uV),
+        )
+        txt = json.dumps(info, sort_keys=True, default=str)
+        return hashlib.sha1(txt.encode("utf8")).hexdigest()
+
+    def get_level_bin_size(self, level):
+        return self.bin_size * self.level_factor ** level
+
+    def get_num_bins(self, segment_index, level):
+        return -(-self.num_samples[segment_index] // self.get_level_bin_size(level))
+
+    def is_ready(self):
+        return self._ready
+
+    ## storage ##
+    def _can_persist(self):
+        # without a recording fingerprint a saved pyramid could belong to other traces
+        return self.recording_fingerprint is not None
+
+    def _get_folder(self):
+        if self.analyzer.format == "binary_folder":
+            return self.analyzer.folder / "spikeinterface_gui" / "overview"
+        return None
+
+    def load(self):
+        """Load the pyramid from the analyzer folder if it exists and matches the fingerprint."""
+        if not self._can_persist():
+            return False
+        try:
+            if self.analyzer.format == "binary_folder":
+                folder = self._get_folder()
+                fingerprint_file = folder / "fingerprint.json"
+                if not fingerprint_file.is_file():
+                    return False
+                with open(fingerprint_file, "r") as f:
+                    if json.load(f).get("fingerprint") != self.fingerprint:
+                        if self.verbose:
+                            print("\tTrace overview is outdated")
+                        return False
+                levels = [
+                    [
+                        {stat: np.load(folder / f"seg{segment_index}_level{level}_{stat}.npy", mmap_mode="r")
+                         for stat in overview_stats}
+                        for level in range(self.num_levels)
+                    ]
+                    for segment_index in range(self.num_segments)
+                ]
+            elif self.analyzer.format == "zarr":
+                import zarr
+
+                zarr_root = zarr.open(self.analyzer.folder, mode="r")
+                if "spikeinterface_gui" not in zarr_root.keys() or "overview" not in zarr_root["spikeinterface_gui"].keys():
+                    return False
+                group = zarr_root["spikeinterface_gui"]["overview"]
+                if group.attrs.get("fingerprint") != self.fingerprint:
+                    if self.verbose:
+                        print("\tTrace overview is outdated")
+                    return False
+                levels = [
+                    [
+                        {stat: group[f"seg{segment_index}_level{level}_{stat}"] for stat in overview_stats}
+                        for level in range(self.num_levels)
+                    ]
+                    for segment_index in range(self.num_segments)
+                ]
+            else:
+                return False
+        except Exception as e:
+            if self.verbose:
+                print(f"\tTrace overview could not be loaded: {e}")
+            return False
+
+        self._levels = levels
+        self.progress = 1.
+        self._ready = True
+        return True
+
+    def _create_storage(self, dtype):
+        """Allocate all arrays, on disk when possible. Return (levels, finalize_func)."""
+        shapes = {
+            (segment_index, level): (self.get_num_bins(segment_index, level), self.num_channels)
+            for segment_index in range(self.num_segments)
+            for level in range(self.num_levels)
+        }
+        stat_dtypes = dict(min=dtype, max=dtype, rms="float32")
+
+        def make_levels(create_func):
+            return [
+                [
+                    {stat: create_func(f"seg{segment_index}_level{level}_{stat}", shapes[(segment_index, level)], stat_dtypes[stat])
+                     for stat in overview_stats}
+                    for level in range(self.num_levels)
+                ]
+                for segment_index in range(self.num_segments)
+            ]
+
+        try:
+            if not self._can_persist():
+                pass
+            elif self.analyzer.format == "binary_folder":
+                folder = self._get_folder()
+                folder.mkdir(exist_ok=True, parents=True)
+                fingerprint_file = folder / "fingerprint.json"
+                if fingerprint_file.exists():
+                    fingerprint_file.unlink()
+
+                def create_func(name, shape, dtype):
+                    return np.lib.format.open_memmap(folder / f"{name}.npy", mode="w+", dtype=dtype, shape=shape)
+
+                def finalize():
+                    for seg_levels in levels:
+                        for level_arrays in seg_levels:
+                            for arr in level_arrays.values():
+                                arr.flush()
+                    with open(fingerprint_file, "w") as f:
+                        json.dump(dict(fingerprint=self.fingerprint), f)
+
+                levels = make_levels(create_func)
+                return levels, finalize
+
+            elif self.analyzer.format == "zarr":
+                import zarr
+
+                zarr_root = zarr.open(self.analyzer.folder, mode="r+")
+                if "spikeinterface_gui" not in zarr_root.keys():
+                    zarr_root.create_group("spikeinterface_gui", overwrite=True)
+                group = zarr_root["spikeinterface_gui"].create_group("overview", overwrite=True)
+                chunk_bins = max(1, self.chunk_size // self.bin_size)
+
+                def create_func(name, shape, dtype):
+                    return group.create_dataset(name=name, shape=shape, dtype=dtype,
+                                                chunks=(max(1, min(shape[0], chunk_bins)), shape[1]), overwrite=True)
+
+                def finalize():
+                    group.attrs["fingerprint"] = self.fingerprint
+
+                levels = make_levels(create_func)
+                return levels, finalize
+        except Exception as e:
+            if self.verbose:
+                print(f"\tTrace overview cannot be saved, it is kept in memory: {e}")
+
+        levels = make_levels(lambda name, shape, dtype: np.zeros(shape, dtype=dtype))
+        return levels, None
+
+    ## build ##
+    def build(self):
+        """Compute the full pyramid (blocking). Return False if it was cancelled."""
+        dtype = np.asarray(self.get_traces_func(0, 0, 1)).dtype
+        levels, finalize = self._create_storage(dtype)
+
+        total = sum(self.num_samples)
+        done = 0
+        for segment_index in range(self.num_segments):
+            num_samples = self.num_samples[segment_index]
+            level0 = levels[segment_index][0]
+            for start in range(0, num_samples, self.chunk_size):
+                if self._cancel_event.is_set():
+                    return False
+                end = min(start + self.chunk_size, num_samples)
+                traces = np.asarray(self.get_traces_func(segment_index, start, end))
+                num_bins = -(-(end - start) // self.bin_size)
+                pad = num_bins * self.bin_size - (end - start)
+                squares = traces.astype("float32") ** 2
+                if pad > 0:
+                    # the padding does not change the min/max, and adds nothing to the sum of squares
+                    traces = np.pad(traces, ((0, pad), (0, 0)), mode="edge")
+                    squares = np.pad(squares, ((0, pad), (0, 0)))
+                blocks = traces.reshape(num_bins, self.bin_size, self.num_channels)
+                b0 = start // self.bin_size
+                level0["min"][b0:b0 + num_bins] = blocks.min(axis=1)
+                level0["max"][b0:b0 + num_bins] = blocks.max(axis=1)
+                counts = self._get_bin_counts(segment_index, 0, b0, b0 + num_bins)
+                sums = squares.reshape(num_bins, self.bin_size, self.num_channels).sum(axis=1)
+                level0["rms"][b0:b0 + num_bins] = np.sqrt(sums / counts[:, None])
+
+                done += end - start
+                self.progress = done / total
+
+            # coarser levels are reduced from the previous one
+            for level in range(1, self.num_levels):
+                if self._cancel_event.is_set():
+                    return False
+                self._reduce_level(segment_index, level, levels[segment_index][level - 1], levels[segment_index][level])
+
+        if finalize is not None:
+            finalize()
+
+        self._levels = levels
+        self.progress = 1.
+        self._ready = True
+        if self.verbose:
+            print("\tTrace overview is built")
+        return True
+
+    def _get_bin_counts(self, segment_index, level, b0, b1):
+        # the number of samples of the bins [b0, b1[ of a level: only the last bin of a segment can be partial
+        bin_size = self.get_level_bin_size(level)
+        counts = np.full(b1 - b0, bin_size, dtype="float32")
+        if b1 == self.get_num_bins(segment_index, level):
+            counts[-1] = self.num_samples[segment_index] - (b1 - 1) * bin_size
+        return counts
+
+    def _reduce_level(self, segment_index, level, src, dst):
+        # the bins of `level` from the bins of `level - 1`
+        factor = self.level_factor
+        num_src_bins = src["min"].shape[0]
+        step = factor * max(1, self.chunk_size // self.bin_size)
+        for i0 in range(0, num_src_bins, step):
+            i1 = min(i0 + step, num_src_bins)
+            num_bins = -(-(i1 - i0) // factor)
+            pad = num_bins * factor - (i1 - i0)
+            b0 = i0 // factor
+            for stat in ("min", "max"):
+                values = np.asarray(src[stat][i0:i1])
+                if pad > 0:
+                    values = np.pad(values, ((0, pad), (0, 0)), mode="edge")
+                values = values.reshape(num_bins, factor, self.num_channels)
+                if stat == "min":
+                    dst[stat][b0:b0 + num_bins] = values.min(axis=1)
+                else:
+                    dst[stat][b0:b0 + num_bins] = values.max(axis=1)
+            # the rms is weighted by the number of samples of each bin (the last one can be partial)
+            counts = self._get_bin_counts(segment_index, level - 1, i0, i1)
+            squares = np.asarray(src["rms"][i0:i1]).astype("float32") ** 2 * counts[:, None]
+            if pad > 0:
+                squares = np.pad(squares, ((0, pad), (0, 0)))
+                counts = np.pad(counts, (0, pad))
+            sums = squares.reshape(num_bins, factor, self.num_channels).sum(axis=1)
+            dst["rms"][b0:b0 + num_bins] = np.sqrt(sums / counts.reshape(num_bins, factor).sum(axis=1)[:, None])
+
+    def load_or_build_async(self):
+        """Load the pyramid, or build it in a background thread if missing. Return immediately."""
+        if self.load():
+            if self.verbose:
+                print("\tUsing trace overview")
+            return
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sigui_overview")
+        self._future = executor.submit(self.build)
+        executor.shutdown(wait=False)
+
+    def wait(self):
+        """Join the background build (if any)."""
+        if self._future is not None:
+            self._future.result()
+
+    def cancel(self):
+        """Stop the background build at the next chunk, nothing is saved."""
+        self._cancel_event.set()
+
+    ## read ##
+    def get_level_for(self, num_samples, num_pixels):
+        """The coarsest level with at least one bin per pixel for `num_samples` samples."""
+        samples_per_pixel = num_samples / max(int(num_pixels), 1)
+        level = 0
+        while level + 1 < self.num_levels and self.get_level_bin_size(level + 1) <= samples_per_pixel:
+            level += 1
+        return level
+
+    def get_overview(self, segment_index, start_frame, end_frame, num_pixels, mode="peak"):
+        """Get the overview of [start_frame, end_frame[ with about `num_pixels` bins.
+
+        Parameters
+        ----------
+        segment_index : int
+            The segment index.
+        start_frame, end_frame : int
+            The frame range.
+        num_pixels : int
+            The number of pixels (the level is chosen to have at least one bin per pixel).
+        mode : "peak" | "min" | "max" | "rms", default: "peak"
+            "peak" is the signed extremum (min or max with the largest absolute value) of each bin.
+
+        Returns
+        -------
+        bin_start_frames : np.array
+            The first frame of each bin, shape (num_bins, ).
+        bin_size : int
+            The bin size in samples of the level used.
+        values : np.array
+            shape (num_bins, num_channels)
+        """
+        assert self._ready, "The trace overview is not ready"
+        level = self.get_level_for(end_frame - start_frame, num_pixels)
+        bin_size = self.get_level_bin_size(level)
+        arrays = self._levels[segment_index][level]
+        b0 = start_frame // bin_size
+        b1 = min(-(-end_frame // bin_size), arrays["min"].shape[0])
+        b1 = max(b0, b1)
+        if mode == "peak":
+            min_values = np.asarray(arrays["min"][b0:b1]).astype("float32")
+            max_values = np.asarray(arrays["max"][b0:b1]).astype("float32")
+            values = np.where(-min_values > max_values, min_values, max_values)
+        else:
+            values = np.asarray(arrays[mode][b0:b1]).astype("float32")
+        bin_start_frames = np.arange(b0, b1, dtype="int64") * bin_size
+        return bin_start_frames, bin_size, values
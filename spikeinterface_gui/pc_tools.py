@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PCProjectionReader:
+    """On-demand access to the principal component projections of the random spikes.
+
+    The projections of the extension are kept as they are stored (a memmap or a zarr array when
+    the extension is loaded lazily), only the rows of the requested units are read and only the
+    requested channels are kept. When the extension is sparse, the projections are realigned on the
+    requested channels (zeros where a channel is not in the sparsity of a unit), like
+    `ComputePrincipalComponents.get_some_projections()`.
+
+    The blocks of each unit are kept in a LRU cache under a memory budget.
+
+    Parameters
+    ----------
+    pc_ext : ComputePrincipalComponents
+        The principal_components extension.
+    spike_unit_indices : np.array
+        The unit index of each random spike (the rows of the projections).
+    unit_ids : np.array
+        The unit ids of the analyzer.
+    sparsity : ChannelSparsity | None
+        The sparsity of the analyzer, None when the projections are dense.
+    max_bytes : int, default: 256 MB
+        The memory budget of the unit blocks cache.
+    """
+    def __init__(self, pc_ext, spike_unit_indices, unit_ids, sparsity=None, max_bytes=256 * 1024**2):
+        self.projections = pc_ext.data["pca_projection"]
+        self.mode = pc_ext.params["mode"]
+        self.unit_ids = np.asarray(unit_ids)
+        self.sparsity = sparsity
+        self.max_bytes = int(max_bytes)
+
+        self.spike_unit_indices = np.asarray(spike_unit_indices)
+        self.num_spikes = self.spike_unit_indices.size
+        self.num_components = self.projections.shape[1]
+        if self.mode == "concatenated":
+            self.num_channels = 1
+        else:
+            self.num_channels = self.projections.shape[2] if sparsity is None else sparsity.mask.shape[1]
+        self.dtype = self.projections.dtype
+
+        # rows grouped by unit: the rows of unit i are order[bounds[i]:bounds[i + 1]] (sorted)
+        self._order = np.argsort(self.spike_unit_indices, kind="stable")
+        self._bounds = np.searchsorted(self.spike_unit_indices[self._order], np.arange(self.unit_ids.size + 1))
+
+        # (unit_index, channel_indices bytes) -> projections
+        self._unit_blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._unit_blocks.clear()
+            self.nbytes = 0
+
+    def get_unit_rows(self, unit_index):
+        """The sorted rows of the random spikes of one unit."""
+        return self._order[self._bounds[unit_index]:self._bounds[unit_index + 1]]
+
+    def _read_rows(self, rows):
+        rows = np.asarray(rows, dtype="int64")
+        if rows.size == 0:
+            return np.zeros((0,) + tuple(self.projections.shape[1:]), dtype=self.dtype)
+        if isinstance(self.projections, np.ndarray):
+            # a memmap only touches the pages of the requested rows, a contiguous run is a slice
+            if rows[-1] - rows[0] + 1 == rows.size:
+                return np.asarray(self.projections[rows[0]:rows[-1] + 1])
+            return self.projections[rows]
+        # zarr array
+        return self.projections.oindex[rows]
+
+    def get_projections(self, rows, channel_indices=None):
+        """Read the projections of some rows aligned on some channels.
+
+        Parameters
+        ----------
+        rows : np.array
+            The sorted rows (indices in the random spikes).
+        channel_indices : np.array | None, default: None
+            The channels to keep, all channels if None.
+
+        Returns
+        -------
+        projections : np.array
+            The projections of shape (num_rows, num_components, num_channels).
+            In "concatenated" mode, channels are ignored and the shape is (num_rows, num_components).
+        """
+        rows = np.asarray(rows, dtype="int64")
+        raw = self._read_rows(rows)
+        if self.mode == "concatenated":
+            return raw
+
+        if channel_indices is None:
+            channel_indices = np.arange(self.num_channels)
+        channel_indices = np.asarray(channel_indices, dtype="int64")
+
+        if self.sparsity is None:
+            return raw[:, :, channel_indices]
+
+        projections = np.zeros((rows.size, self.num_components, channel_indices.size), dtype=self.dtype)
+        row_unit_indices = self.spike_unit_indices[rows]
+        for unit_index in np.unique(row_unit_indices):
+            unit_id = self.unit_ids[unit_index]
+            local_chan_inds = self.sparsity.unit_id_to_channel_indices[unit_id]
+            if local_chan_inds.size == 0:
+                continue
+            # position of each requested channel in the (sorted) sparse channels of the unit
+            local_pos = np.clip(np.searchsorted(local_chan_inds, channel_indices), 0, local_chan_inds.size - 1)
+            found = np.flatnonzero(local_chan_inds[local_pos] == channel_indices)
+            if found.size == 0:
+                continue
+            (mask,) = np.nonzero(row_unit_indices == unit_index)
+            projections[np.ix_(mask, np.arange(self.num_components), found)] = raw[mask][:, :, local_pos[found]]
+        return projections
+
+    def get_unit_projections(self, unit_index, channel_indices=None):
+        """Get the projections of the random spikes of one unit on some channels (cached).
+
+        See `get_projections()` for the shape.
+        """
+        if channel_indices is None:
+            channel_indices = np.arange(self.num_channels)
+        channel_indices = np.asarray(channel_indices, dtype="int64")
+        key = (int(unit_index), channel_indices.tobytes())
+        with self._lock:
+            projections = self._unit_blocks.get(key)
+            if projections is not None:
+                self._unit_blocks.move_to_end(key)
+                return projections
+
+        projections = self.get_projections(self.get_unit_rows(unit_index), channel_indices)
+
+        with self._lock:
+            if key not in self._unit_blocks:
+                self._unit_blocks[key] = projections
+                self.nbytes += projections.nbytes
+                while self.nbytes > self.max_bytes and len(self._unit_blocks) > 1:
+                    _, evicted = self._unit_blocks.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+        return projections
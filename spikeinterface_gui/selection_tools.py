@@ -0,0 +1,94 @@
+import numpy as np
+from matplotlib.path import Path as mpl_path
+
+
+class SortedPointIndex:
+    """Index of 2D points sorted on x for fast bounding box queries.
+
+    Points in a bounding box are found with a binary search on x followed by a
+    vectorized test on y in the x range. This is used to restrict point-in-polygon
+    tests to the few candidates inside the bounding box of a lasso.
+
+    Parameters
+    ----------
+    x, y : np.array
+        The coordinates of the points.
+    assume_sorted : bool, default: False
+        If True, x is already sorted (for instance spike times of one unit in one segment)
+        and no sort is done.
+    """
+    def __init__(self, x, y, assume_sorted=False):
+        x = np.asarray(x)
+        y = np.asarray(y)
+        if assume_sorted:
+            self.order = None
+            self.x = x
+            self.y = y
+        else:
+            self.order = np.argsort(x, kind="stable")
+            self.x = x[self.order]
+            self.y = y[self.order]
+
+    @property
+    def size(self):
+        return self.x.size
+
+    def query_bbox(self, x_min, x_max, y_min, y_max):
+        """Return the indices (in the original order) and the coordinates of the points in
+        [x_min, x_max] x [y_min, y_max]."""
+        i0 = np.searchsorted(self.x, x_min, side="left")
+        i1 = np.searchsorted(self.x, x_max, side="right")
+        y = self.y[i0:i1]
+        positions = np.flatnonzero((y >= y_min) & (y <= y_max)) + i0
+        points = np.column_stack((self.x[positions], self.y[positions]))
+        if self.order is not None:
+            positions = self.order[positions]
+        return positions, points
+
+    def select_in_polygons(self, polygons):
+        """Return the sorted indices of the points inside at least one of the polygons."""
+        return select_points_in_polygons(None, None, polygons, index=self)
+
+
+def select_points_in_polygons(x, y, polygons, index=None):
+    """Find the points inside at least one polygon (a lasso possibly made of several polygons).
+
+    For each polygon, candidates are first restricted to its bounding box (with `index` if given,
+    otherwise with a vectorized mask) and the exact point-in-polygon test is only run on them.
+
+    Parameters
+    ----------
+    x, y : np.array | None
+        The coordinates of the points, can be None if `index` is given.
+    polygons : list of np.array
+        The polygons, each of shape (num_vertices, 2).
+    index : SortedPointIndex | None, default: None
+        A prebuilt index of the points.
+
+    Returns
+    -------
+    indices : np.array
+        The sorted indices of the points inside.
+    """
+    if index is None:
+        x = np.asarray(x)
+        y = np.asarray(y)
+    selected = []
+    for polygon in polygons:
+        polygon = np.asarray(polygon, dtype="float64")
+        if polygon.shape[0] < 3:
+            continue
+        x_min, y_min = np.min(polygon, axis=0)
+        x_max, y_max = np.max(polygon, axis=0)
+        if index is not None:
+            candidates, points = index.query_bbox(x_min, x_max, y_min, y_max)
+        else:
+            candidates = np.flatnonzero((x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max))
+            points = np.column_stack((x[candidates], y[candidates]))
+        if candidates.size == 0:
+            continue
+        inside = mpl_path(polygon).contains_points(points)
+        selected.append(candidates[inside])
+    if len(selected) == 0:
+        return np.array([], dtype="int64")
+    return np.unique(np.concatenate(selected))
@@ -0,0 +1,176 @@
+import numpy as np
+
+
+# bits of the "flags" column
+_flag_bits = dict(
+    visible=np.uint8(1),
+    selected=np.uint8(2),
+    rand_selected=np.uint8(4),
+)
+
+# equivalent record dtype, used when a single spike (or a record array) is requested
+spike_dtype = [('sample_index', 'int64'), ('unit_index', 'int64'),
+    ('channel_index', 'int64'), ('segment_index', 'int64'),
+    ('visible', 'bool'), ('selected', 'bool'), ('rand_selected', 'bool')]
+
+
+def _smallest_int_dtype(max_value, dtypes=("int16", "int32", "int64")):
+    for dtype in dtypes:
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(dtypes[-1])
+
+
+def find_in_sorted(sorted_indices, values):
+    """Find values in a sorted array of unique indices with binary searches.
+
+    Equivalent to `np.isin` but in O(len(values) * log(len(sorted_indices))), without building
+    anything over `sorted_indices`.
+
+    Returns
+    -------
+    positions : np.array
+        The positions in sorted_indices of the values found (in the order of values).
+    found : np.array
+        bool mask over values.
+    """
+    sorted_indices = np.asarray(sorted_indices)
+    values = np.asarray(values, dtype=sorted_indices.dtype if sorted_indices.size > 0 else 'int64')
+    if sorted_indices.size == 0 or values.size == 0:
+        return np.array([], dtype='int64'), np.zeros(values.size, dtype='bool')
+    positions = np.searchsorted(sorted_indices, values)
+    clipped = np.minimum(positions, sorted_indices.size - 1)
+    found = sorted_indices[clipped] == values
+    return positions[found], found
+
+
+class SpikeTable:
+    """Compact struct-of-arrays store for all spikes.
+
+    Every column is a contiguous array with the smallest suitable dtype:
+      * sample_index : int64
+      * unit_index : int16 or int32
+      * channel_index : int16 or int32
+      * segment_index : uint8 or uint16
+      * flags : uint8 bitfield packing "visible", "selected" and "rand_selected"
+
+    The table keeps a record-like facade so that it can be used as the previous numpy
+    structured array (`spike_dtype`):
+      * `spikes["sample_index"]` gives a column (a read-only boolean array for flags, use
+        `set_flag()` or `spikes["selected"] = mask` to change them)
+      * `spikes[slice]`, `spikes[indices]` or `spikes[mask]` give a sub table (slices are views)
+      * `spikes[i]` gives a single spike as a dict of scalars (see `get_spike()`)
+
+    Parameters
+    ----------
+    sample_index, unit_index, channel_index, segment_index : np.array
+        The columns.
+    flags : np.array | None, default: None
+        The packed flags, all False if None.
+    """
+    columns = ('sample_index', 'unit_index', 'channel_index', 'segment_index', 'flags')
+
+    def __init__(self, sample_index, unit_index, channel_index, segment_index, flags=None):
+        self.sample_index = sample_index
+        self.unit_index = unit_index
+        self.channel_index = channel_index
+        self.segment_index = segment_index
+        if flags is None:
+            flags = np.zeros(sample_index.size, dtype='uint8')
+        self.flags = flags
+
+    @classmethod
+    def from_spike_vector(cls, spike_vector, num_units, num_channels, num_segments):
+        """Make the table from a spikeinterface spike vector (concatenated)."""
+        return cls(
+            sample_index=spike_vector['sample_index'].astype('int64', copy=True),
+            unit_index=spike_vector['unit_index'].astype(_smallest_int_dtype(num_units)),
+            channel_index=spike_vector['channel_index'].astype(_smallest_int_dtype(num_channels)),
+            segment_index=spike_vector['segment_index'].astype(_smallest_int_dtype(num_segments, ("uint8", "uint16", "uint32"))),
+        )
+
+    @property
+    def size(self):
+        return self.sample_index.size
+
+    def __len__(self):
+        return self.sample_index.size
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.columns)
+
+    @property
+    def dtype(self):
+        return np.dtype(spike_dtype)
+
+    def get_flag(self, name, indices=None):
+        flags = self.flags if indices is None else self.flags[indices]
+        values = (flags & _flag_bits[name]) != 0
+        if isinstance(values, np.ndarray):
+            # a computed copy: writing into it would silently not change the flags
+            values.flags.writeable = False
+        return values
+
+    def get_value(self, index, name):
+        """Get one field of one spike (a column or a flag) without building a record."""
+        if name in _flag_bits:
+            return bool(self.flags[index] & _flag_bits[name])
+        if name not in self.columns:
+            raise KeyError(name)
+        return getattr(self, name)[index]
+
+    def get_spike(self, index):
+        """Get one spike as a dict with the fields of `spike_dtype`."""
+        spike = {name: getattr(self, name)[index] for name in self.columns if name != 'flags'}
+        for name in _flag_bits:
+            spike[name] = bool(self.flags[index] & _flag_bits[name])
+        return spike
+
+    def set_flag(self, name, indices, value=True):
+        """Set (or unset) one flag for some spikes, indices can be a slice, int array or bool mask."""
+        if value:
+            self.flags[indices] |= _flag_bits[name]
+        else:
+            self.flags[indices] &= ~_flag_bits[name]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key in _flag_bits:
+                return self.get_flag(key)
+            if key not in self.columns:
+                raise KeyError(key)
+            return getattr(self, key)
+        elif isinstance(key, (int, np.integer)):
+            return self.get_spike(key)
+        else:
+            return SpikeTable(*(getattr(self, name)[key] for name in self.columns))
+
+    def __setitem__(self, key, value):
+        if key in _flag_bits:
+            self.set_flag(key, slice(None), False)
+            self.set_flag(key, np.asarray(value, dtype='bool'), True)
+        elif key in self.columns:
+            getattr(self, key)[:] = value
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    def copy(self):
+        return SpikeTable(*(getattr(self, name).copy() for name in self.columns))
+
+    def to_records(self, indices=None):
+        """Make a numpy structured array with `spike_dtype` (for all spikes or some indices)."""
+        if indices is None:
+            indices = slice(None)
+        sample_index = self.sample_index[indices]
+        records = np.zeros(sample_index.size, dtype=spike_dtype)
+        records['sample_index'] = sample_index
+        records['unit_index'] = self.unit_index[indices]
+        records['channel_index'] = self.channel_index[indices]
+        records['segment_index'] = self.segment_index[indices]
+        for name in _flag_bits:
+            records[name] = self.get_flag(name, indices)
+        return records
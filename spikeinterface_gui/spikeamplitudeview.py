@@ -157,4 +157,6 @@ comparing the distribution of ampltidues to the noise levels.
 ### Controls
 - **select** : activate lasso selection to select individual spikes
 - **split** or **ctrl+s** : split the selected spikes into a new unit (only if one unit is visible)
+- **display_mode** : 'scatter' (decimated points) or 'density' (all spikes rasterized in an image,
+  spikes in low density regions are kept as points)
 """
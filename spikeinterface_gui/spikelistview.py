@@ -52,8 +52,9 @@ def get_qt_spike_model():
             row = index.row()
             
             abs_ind = self.visible_ind[row]
-            spike = self.controller.spikes[abs_ind]
-            unit_id = self.controller.unit_ids[spike['unit_index']]
+            # column access: this is called for every cell
+            spikes = self.controller.spikes
+            unit_id = self.controller.unit_ids[spikes.unit_index[abs_ind]]
             
             if role ==QT.Qt.DisplayRole :
                 if col == 0:
@@ -61,13 +62,13 @@ def get_qt_spike_model():
                 elif col == 1:
                     return '{}'.format(unit_id)
                 elif col == 2:
-                    return '{}'.format(spike['segment_index'])
+                    return '{}'.format(spikes.segment_index[abs_ind])
                 elif col == 3:
-                    return '{}'.format(spike['sample_index'])
+                    return '{}'.format(spikes.sample_index[abs_ind])
                 elif col == 4:
-                    return '{}'.format(spike['channel_index'])
+                    return '{}'.format(spikes.channel_index[abs_ind])
                 elif col == 5:
-                    return '{}'.format(spike['rand_selected'])
+                    return '{}'.format(spikes.get_value(abs_ind, 'rand_selected'))
                 else:
                     return None
             elif role == QT.Qt.DecorationRole :
@@ -221,9 +222,8 @@ class SpikeListView(ViewBase):
         from .myqt import QT
         self.tree.selectionModel().selectionChanged.disconnect(self._qt_on_tree_selection)
         
-        selected_inds  = self.controller.get_indices_spike_selected()
         visible_inds = self.controller.get_indices_spike_visible()
-        row_selected,  = np.nonzero(np.isin(visible_inds, selected_inds))
+        row_selected = self.controller.get_positions_spike_selected(visible_inds)
         
         if row_selected.size > 100:  #otherwise this is very slow
             row_selected = row_selected[:10]
@@ -338,7 +338,7 @@ class SpikeListView(ViewBase):
             self.table.selection = []
         else:
             # Find the rows corresponding to the selected indices
-            row_selected, = np.nonzero(np.isin(visible_inds, selected_inds))
+            row_selected = self.controller.get_positions_spike_selected(visible_inds)
             self.table.selection = [int(r) for r in row_selected]
             
         self._panel_refresh_label()
@@ -397,9 +397,8 @@ class SpikeListView(ViewBase):
 
         if len(self.table.value) == 0:
             return
-        selected_inds = self.controller.get_indices_spike_selected()
         visible_inds = self.controller.get_indices_spike_visible()
-        row_selected, = np.nonzero(np.isin(visible_inds, selected_inds))
+        row_selected = self.controller.get_positions_spike_selected(visible_inds)
         row_selected = [int(r) for r in row_selected]
 
         def _do_update():
@@ -0,0 +1,146 @@
+import threading
+
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.cache_tools import (
+    get_index_cache_fingerprint,
+    load_index_cache,
+    save_index_cache,
+    get_index_cache_folder,
+    index_cache_keys,
+    get_recording_fingerprint,
+    TracesDiskCache,
+)
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def test_index_cache(monkeypatch):
+    # the cache is written in the user cache folder, never in the analyzer folder
+    monkeypatch.setenv("XDG_CACHE_HOME", str((test_folder / "user_cache").absolute()))
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+
+    fingerprint = get_index_cache_fingerprint(sorting_analyzer)
+    assert fingerprint is not None
+    assert get_index_cache_fingerprint(si.load_sorting_analyzer(test_folder / "sorting_analyzer")) == fingerprint
+    # no cache for in memory analyzers
+    assert get_index_cache_fingerprint(sorting_analyzer.copy()) is None
+
+    # round trip
+    controller = Controller(sorting_analyzer, backend="none", use_index_cache=False)
+    cache_data = controller._compute_spike_index()
+    save_index_cache(sorting_analyzer, fingerprint, cache_data)
+    cache_folder = get_index_cache_folder(sorting_analyzer)
+    assert (test_folder / "user_cache").absolute() in cache_folder.parents
+    assert not (test_folder / "sorting_analyzer" / "spikeinterface_gui" / "cache").exists()
+    loaded = load_index_cache(sorting_analyzer, fingerprint)
+    assert loaded is not None
+    for key in index_cache_keys:
+        assert np.array_equal(loaded[key], cache_data[key])
+    assert load_index_cache(sorting_analyzer, "another fingerprint") is None
+
+    # the controller uses the cache and gets the same index
+    controller_cached = Controller(sorting_analyzer, backend="none", use_index_cache=True)
+    assert np.array_equal(controller_cached.spikes.to_records(), controller.spikes.to_records())
+    for unit_id in controller.unit_ids:
+        assert np.array_equal(controller_cached.get_spike_indices(unit_id), controller.get_spike_indices(unit_id))
+
+    # the fingerprint changes with the random spikes
+    sorting_analyzer.compute("random_spikes", method="uniform", max_spikes_per_unit=100)
+    assert get_index_cache_fingerprint(sorting_analyzer) != fingerprint
+
+
+def test_index_cache_fingerprint_zarr():
+    import zarr
+
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    zarr_folder = test_folder / "sorting_analyzer.zarr"
+    zarr_analyzer = sorting_analyzer.save_as(format="zarr", folder=zarr_folder)
+    fingerprint = get_index_cache_fingerprint(zarr_analyzer)
+    assert fingerprint is not None
+    assert get_index_cache_fingerprint(si.load_sorting_analyzer(zarr_folder)) == fingerprint
+
+    # another sorting with the same shapes (a re-sorting) is detected
+    zarr_root = zarr.open(zarr_folder, mode="r+")
+    sample_index = zarr_root["sorting"]["spikes"]["sample_index"]
+    sample_index[:] = sample_index[:] + 1
+    assert get_index_cache_fingerprint(si.load_sorting_analyzer(zarr_folder)) != fingerprint
+
+
+def test_recording_fingerprint():
+    recording = si.generate_recording(num_channels=4, durations=[5.], seed=0)
+    fingerprint = get_recording_fingerprint(recording)
+    assert fingerprint is not None
+    assert get_recording_fingerprint(si.generate_recording(num_channels=4, durations=[5.], seed=0)) == fingerprint
+    # the preprocessing chain and the parameters are part of the fingerprint
+    assert get_recording_fingerprint(si.generate_recording(num_channels=4, durations=[5.], seed=1)) != fingerprint
+    filtered = si.bandpass_filter(recording, freq_min=300.)
+    assert get_recording_fingerprint(filtered) != fingerprint
+    assert get_recording_fingerprint(si.bandpass_filter(recording, freq_min=400.)) != get_recording_fingerprint(filtered)
+    assert get_recording_fingerprint(recording, return_in_uV=True) != fingerprint
+
+    # no stable description: no fingerprint
+    traces = recording.get_traces()
+    in_memory = si.NumpyRecording([traces], sampling_frequency=recording.sampling_frequency)
+    assert get_recording_fingerprint(in_memory) is None
+
+
+def test_traces_disk_cache_warm():
+    recording = si.generate_recording(num_channels=4, durations=[5., 3.], seed=0)
+    fingerprint = get_recording_fingerprint(recording)
+
+    interactive_calls = []
+    def get_traces_func(segment_index, start_frame, end_frame):
+        interactive_calls.append((segment_index, start_frame, end_frame))
+        return recording.get_traces(segment_index=segment_index, start_frame=start_frame, end_frame=end_frame)
+
+    # one reader per warm worker, each on its own clone
+    readers = []
+    def make_get_traces_func():
+        clone = recording.clone()
+        reader_threads = set()
+        readers.append(reader_threads)
+        def get_traces(segment_index, start_frame, end_frame):
+            reader_threads.add(threading.get_ident())
+            return clone.get_traces(segment_index=segment_index, start_frame=start_frame, end_frame=end_frame)
+        return get_traces
+
+    cache = TracesDiskCache(test_folder / "traces_cache", recording, get_traces_func, fingerprint,
+                            make_get_traces_func=make_get_traces_func, chunk_duration=0.25)
+    # the dtype probe only
+    num_probe_calls = len(interactive_calls)
+    assert cache.warm(n_jobs=3)
+    assert cache.get_filled_fraction() == 1.
+    assert len(interactive_calls) == num_probe_calls
+    assert 1 <= len(readers) <= 3
+    assert all(len(reader_threads) == 1 for reader_threads in readers)
+    for segment_index in range(recording.get_num_segments()):
+        expected = recording.get_traces(segment_index=segment_index)
+        assert np.array_equal(cache.get_traces(segment_index, 0, expected.shape[0]), expected)
+    # served from disk
+    assert len(interactive_calls) == num_probe_calls
+
+    # later sessions reuse the written chunks
+    cache = TracesDiskCache(test_folder / "traces_cache", recording, get_traces_func, fingerprint, chunk_duration=0.25)
+    assert cache.get_filled_fraction() == 1.
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_index_cache_fingerprint_zarr()
+    test_recording_fingerprint()
+    test_traces_disk_cache_warm()
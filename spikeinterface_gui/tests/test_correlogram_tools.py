@@ -0,0 +1,71 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.correlogram_tools import compute_pair_correlogram, make_correlogram_bins
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+from spikeinterface.postprocessing.correlograms import _compute_correlograms_on_sorting
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def test_compute_pair_correlogram():
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    sorting = sorting_analyzer.sorting
+    unit_ids = sorting.unit_ids
+    fs = sorting.sampling_frequency
+
+    for window_ms, bin_ms in [(50., 1.), (100., 0.5), (30., 2.), (20., 1 / 30.)]:
+        expected, expected_bins = _compute_correlograms_on_sorting(sorting, window_ms=window_ms, bin_ms=bin_ms, method="numpy")
+        bins, window_size, bin_size = make_correlogram_bins(fs, window_ms, bin_ms)
+        assert np.array_equal(bins, expected_bins)
+        for i, unit_id1 in enumerate(unit_ids):
+            for j, unit_id2 in enumerate(unit_ids):
+                counts = np.zeros(bins.size - 1, dtype="int64")
+                for segment_index in range(sorting.get_num_segments()):
+                    times1 = sorting.get_unit_spike_train(unit_id1, segment_index=segment_index)
+                    times2 = sorting.get_unit_spike_train(unit_id2, segment_index=segment_index)
+                    counts += compute_pair_correlogram(times1, times2, window_size, bin_size, auto=i == j, chunk_size=50)
+                assert np.array_equal(counts, expected[i, j]), (window_ms, bin_ms, unit_id1, unit_id2)
+
+
+def test_unit_correlograms():
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none")
+    unit_ids = list(controller.unit_ids[[3, 0, 5]])
+    unit_indices = [list(controller.unit_ids).index(unit_id) for unit_id in unit_ids]
+
+    # same params as the extension: its data is used
+    ext = sorting_analyzer.get_extension("correlograms")
+    expected, expected_bins = ext.get_data()
+    ccg, bins = controller.get_unit_correlograms(unit_ids, ext.params["window_ms"], ext.params["bin_ms"])
+    assert np.array_equal(ccg, expected[np.ix_(unit_indices, unit_indices)])
+    assert np.array_equal(bins, expected_bins)
+
+    # other params: computed on demand from the spike index
+    expected, expected_bins = _compute_correlograms_on_sorting(sorting_analyzer.sorting, window_ms=30., bin_ms=0.5, method="numba")
+    ccg, bins = controller.get_unit_correlograms(unit_ids, 30., 0.5)
+    assert np.array_equal(ccg, expected[np.ix_(unit_indices, unit_indices)])
+    assert np.array_equal(bins, expected_bins)
+
+    # without the extension
+    controller = Controller(sorting_analyzer, backend="none", skip_extensions=["correlograms"])
+    ccg, bins = controller.get_unit_correlograms(unit_ids, 30., 0.5)
+    assert np.array_equal(ccg, expected[np.ix_(unit_indices, unit_indices)])
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_compute_pair_correlogram()
+    test_unit_correlograms()
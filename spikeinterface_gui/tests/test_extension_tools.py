@@ -0,0 +1,157 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.extension_tools import LazyExtensionData
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def test_lazy_extension_data():
+    analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer", load_extensions=False)
+    eager_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+
+    extension_data = LazyExtensionData(analyzer, skip_extensions=["isi_histograms"])
+    num_calls = dict(spike_amplitudes=0)
+
+    def load_spike_amplitudes():
+        num_calls["spike_amplitudes"] += 1
+        return analyzer.get_extension("spike_amplitudes").get_data()
+
+    extension_data.register("spike_amplitudes", load_spike_amplitudes)
+    extension_data.register_extension("spike_depths", "spike_locations", getter=lambda ext: ext.get_data()["y"])
+    extension_data.register_extension("isi_histograms", "isi_histograms", default=(None, None))
+    extension_data.register_extension("not_computed", "amplitude_scalings", default="default")
+
+    # nothing is read at registration
+    assert "spike_amplitudes" not in analyzer.extensions
+    assert "spike_locations" not in analyzer.extensions
+    assert not extension_data.is_loaded("spike_amplitudes")
+    assert num_calls["spike_amplitudes"] == 0
+
+    # read on first access only
+    spike_amplitudes = extension_data.get("spike_amplitudes")
+    assert num_calls["spike_amplitudes"] == 1
+    assert np.array_equal(spike_amplitudes, eager_analyzer.get_extension("spike_amplitudes").get_data())
+    assert extension_data.get("spike_amplitudes") is spike_amplitudes
+    assert num_calls["spike_amplitudes"] == 1
+    assert "spike_amplitudes" in extension_data.load_times
+    assert "spike_locations" not in analyzer.extensions
+
+    spike_depths = extension_data.get("spike_depths")
+    assert np.array_equal(spike_depths, eager_analyzer.get_extension("spike_locations").get_data()["y"])
+    assert "spike_locations" in analyzer.extensions
+
+    # skipped or not computed: the default
+    assert extension_data.get("isi_histograms") == (None, None)
+    assert "isi_histograms" not in analyzer.extensions
+    assert extension_data.get("not_computed") == "default"
+
+    # lazy: the arrays stay memmaps and the extension is not inserted in the analyzer
+    extension_data.register_extension("principal_components", "principal_components", getter=lambda ext: ext, lazy=True)
+    pc_ext = extension_data.get("principal_components")
+    assert isinstance(pc_ext.data["pca_projection"], np.memmap)
+    assert "principal_components" not in analyzer.extensions
+
+
+def test_controller_lazy_extensions():
+    analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer", load_extensions=False)
+    controller = Controller(analyzer, backend="none")
+    assert not controller._extension_data.is_loaded("spike_amplitudes")
+    assert "spike_amplitudes" not in analyzer.extensions
+    # but known as computed
+    assert controller.has_extension("spike_amplitudes")
+
+    eager_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    assert np.array_equal(controller.spike_amplitudes, eager_analyzer.get_extension("spike_amplitudes").get_data())
+    assert controller._extension_data.is_loaded("spike_amplitudes")
+
+
+def register_entries(extension_data):
+    extension_data.register_extension("quality_metrics", "quality_metrics")
+    extension_data.register_extension("spike_amplitudes", "spike_amplitudes")
+    extension_data.register_extension("spike_depths", "spike_locations", getter=lambda ext: ext.get_data()["y"])
+    extension_data.register_extension("spike_locations", "spike_locations", getter=lambda ext: ext)
+    extension_data.register_extension("isi_histograms", "isi_histograms")
+    extension_data.register_extension("template_similarity", "template_similarity")
+    extension_data.register_extension("principal_components", "principal_components", getter=lambda ext: ext, lazy=True)
+
+
+def test_load_all():
+    eager_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    expected = LazyExtensionData(eager_analyzer)
+    register_entries(expected)
+
+    for n_jobs in (1, 4):
+        analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer", load_extensions=False)
+        extension_data = LazyExtensionData(analyzer)
+        register_entries(extension_data)
+        load_times = extension_data.load_all(n_jobs=n_jobs)
+        assert set(load_times.keys()) == set(extension_data._loaders.keys())
+
+        for name in ("spike_amplitudes", "spike_depths", "template_similarity"):
+            assert np.array_equal(extension_data.get(name), expected.get(name))
+        assert extension_data.get("quality_metrics").equals(expected.get("quality_metrics"))
+        for data, expected_data in zip(extension_data.get("isi_histograms"), expected.get("isi_histograms")):
+            assert np.array_equal(data, expected_data)
+        assert np.array_equal(extension_data.get("principal_components").data["pca_projection"],
+                              expected.get("principal_components").data["pca_projection"])
+        # one extension object per extension, inserted in the analyzer
+        assert extension_data.get("spike_locations") is analyzer.extensions["spike_locations"]
+        assert "principal_components" not in analyzer.extensions
+
+    # in background
+    analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer", load_extensions=False)
+    extension_data = LazyExtensionData(analyzer)
+    register_entries(extension_data)
+    future = extension_data.load_all_async(n_jobs=4)
+    load_times = future.result(timeout=60)
+    assert future.done()
+    assert all(extension_data.is_loaded(name) for name in load_times.keys())
+    assert np.array_equal(extension_data.get("spike_amplitudes"), expected.get("spike_amplitudes"))
+
+
+def test_load_all_without_compute():
+    extension_data = LazyExtensionData(si.load_sorting_analyzer(test_folder / "sorting_analyzer", load_extensions=False))
+    num_calls = dict(computed=0)
+
+    def compute():
+        num_calls["computed"] += 1
+        return "computed"
+
+    extension_data.register("computed", compute, preload=False)
+    extension_data.register_extension("spike_amplitudes", "spike_amplitudes")
+    extension_data.load_all(n_jobs=2)
+    assert extension_data.is_loaded("spike_amplitudes")
+    assert not extension_data.is_loaded("computed")
+    assert num_calls["computed"] == 0
+    assert extension_data.get("computed") == "computed"
+
+    # a missing template similarity is computed on first access, not by the preload pool
+    analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer").copy()
+    analyzer.delete_extension("template_similarity")
+    controller = Controller(analyzer, backend="none", extension_loading_n_jobs=4)
+    assert not controller._extension_data.is_loaded("template_similarity")
+    assert "template_similarity" not in analyzer.extensions
+    assert controller.get_similarity() is not None
+    assert "template_similarity" in analyzer.extensions
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_lazy_extension_data()
+    test_controller_lazy_extensions()
+    test_load_all()
+    test_load_all_without_compute()
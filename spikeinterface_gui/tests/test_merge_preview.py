@@ -0,0 +1,61 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+from spikeinterface.postprocessing.correlograms import _compute_correlograms_on_sorting
+from spikeinterface.metrics.quality.misc_metrics import isi_violations
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def test_merge_preview():
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none", curation=True)
+    sorting = sorting_analyzer.sorting
+    fs = sorting.sampling_frequency
+    num_segments = sorting.get_num_segments()
+    total_duration = sum(sorting_analyzer.get_num_samples(segment_index) for segment_index in range(num_segments)) / fs
+
+    for group in (list(controller.unit_ids[[0, 1]]), list(controller.unit_ids[[2, 4, 5]])):
+        summary = controller.get_merge_preview(group, summary_only=True)
+        assert summary["auto_correlogram"] is None
+        assert summary["amplitude_histogram"] is None
+        preview = controller.get_merge_preview(group)
+        # cached per set of units
+        assert controller.get_merge_preview(group[::-1]) is preview
+        assert controller.get_merge_preview(group, summary_only=True) is preview
+
+        # the unit that apply_curation() would make (no spikes removed)
+        merged = si.MergeUnitsSorting(sorting, [group], new_unit_ids=["merged"], delta_time_ms=None)
+        assert preview["num_spikes"] == merged.count_num_spikes_per_unit()["merged"]
+
+        expected, expected_bins = _compute_correlograms_on_sorting(merged, window_ms=50., bin_ms=1., method="numpy")
+        merged_index = list(merged.unit_ids).index("merged")
+        assert np.array_equal(preview["auto_correlogram"], expected[merged_index, merged_index])
+        assert np.array_equal(preview["correlogram_bins"], expected_bins)
+
+        spike_trains = [merged.get_unit_spike_train("merged", segment_index=segment_index) / fs for segment_index in range(num_segments)]
+        isi_violations_ratio, _, isi_violations_count = isi_violations(spike_trains, total_duration, isi_threshold_s=0.0015, min_isi_s=0)
+        for p in (summary, preview):
+            assert np.isclose(p["isi_violations_ratio"], isi_violations_ratio)
+            assert p["isi_violations_count"] == isi_violations_count
+            assert np.isclose(p["firing_rate"], preview["num_spikes"] / total_duration)
+
+        assert preview["amplitude_histogram"].sum() == preview["num_spikes"]
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_merge_preview()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.ndscatterview import NDScatterView
+from spikeinterface_gui.view_base import ViewBase
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def project_with_unit_loop(view, all_pcs, pc_unit_index):
+    # the previous implementation: the features of each unit are projected one by one
+    projected = {}
+    spike_indices = {}
+    for unit_ind, unit_id in view.controller.iter_visible_units():
+        mask = pc_unit_index == unit_ind
+        data = view.get_features(all_pcs[mask])
+        projected[unit_id] = view.apply_dot(data)
+        spike_indices[unit_id] = view.random_spikes_indices[mask]
+    return projected, spike_indices
+
+
+def test_ndscatter_projection(monkeypatch):
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none")
+
+    # the view without the UI
+    monkeypatch.setattr(ViewBase, "__init__", lambda self, controller=None, parent=None, backend="qt": setattr(self, "controller", controller))
+    view = NDScatterView(controller=controller)
+
+    pc_unit_index, all_pcs = controller.get_all_pcs()
+    unit_ids = controller.unit_ids
+    rng = np.random.default_rng(0)
+    for visible_unit_ids in (unit_ids[:1], unit_ids[:3], unit_ids[::2], unit_ids):
+        controller.set_visible_unit_ids(list(visible_unit_ids))
+        for selected_comp in (np.ones(view.ndim, dtype='bool'), rng.random(view.ndim) > 0.6):
+            if not np.any(selected_comp):
+                selected_comp[0] = True
+            view.selected_comp = selected_comp
+            view.projection = view.get_one_random_projection()
+
+            all_projected = view.project_visible_units()
+            _, block_spike_indices, block_unit_slices = view.get_visible_block()
+            expected, expected_spike_indices = project_with_unit_loop(view, all_pcs, pc_unit_index)
+            for unit_id in visible_unit_ids:
+                unit_slice = block_unit_slices[unit_id]
+                assert np.allclose(all_projected[unit_slice], expected[unit_id], atol=1e-5)
+                assert np.array_equal(block_spike_indices[unit_slice], expected_spike_indices[unit_id])
+
+            # a new projection reuses the block
+            block_data = view.get_visible_block()[0]
+            view.projection = view.get_one_random_projection()
+            view.project_visible_units()
+            assert view.get_visible_block()[0] is block_data
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
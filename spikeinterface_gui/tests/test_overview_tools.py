@@ -0,0 +1,101 @@
+import numpy as np
+
+from spikeinterface_gui.overview_tools import TraceOverview
+from spikeinterface_gui.cache_tools import get_recording_fingerprint
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def make_overview(analyzer, recording, recording_fingerprint):
+    def get_traces_func(segment_index, start_frame, end_frame):
+        return recording.get_traces(segment_index=segment_index, start_frame=start_frame, end_frame=end_frame)
+
+    # the bin size (369 samples) does not divide the segments: every level has a trailing partial bin
+    return TraceOverview(analyzer, get_traces_func, recording_fingerprint=recording_fingerprint,
+                         bin_duration=0.0123, min_num_bins=50)
+
+
+def check_overview(overview, recording):
+    assert overview.is_ready()
+    assert overview.num_levels > 2
+    for segment_index in range(recording.get_num_segments()):
+        traces = recording.get_traces(segment_index=segment_index).astype("float64")
+        num_samples = traces.shape[0]
+        for level in range(overview.num_levels):
+            bin_size = overview.get_level_bin_size(level)
+            num_bins = overview.get_num_bins(segment_index, level)
+            assert num_samples % bin_size != 0
+            # brute force: full bins with a reshape, the trailing partial bin apart
+            num_full = num_samples // bin_size
+            full = traces[:num_full * bin_size].reshape(num_full, bin_size, -1)
+            tail = traces[num_full * bin_size:]
+            expected_min = np.concatenate([full.min(axis=1), tail.min(axis=0, keepdims=True)])
+            expected_max = np.concatenate([full.max(axis=1), tail.max(axis=0, keepdims=True)])
+            expected_rms = np.concatenate([np.sqrt(np.mean(full ** 2, axis=1)), np.sqrt(np.mean(tail ** 2, axis=0, keepdims=True))])
+
+            arrays = overview._levels[segment_index][level]
+            assert arrays["min"].shape[0] == num_bins == num_full + 1
+            assert np.array_equal(np.asarray(arrays["min"]), expected_min)
+            assert np.array_equal(np.asarray(arrays["max"]), expected_max)
+            assert np.allclose(np.asarray(arrays["rms"]), expected_rms, rtol=1e-4)
+
+        # the read API picks the level and the bins of a range
+        start_frame, end_frame = 1000, num_samples - 10
+        bin_start_frames, bin_size, values = overview.get_overview(segment_index, start_frame, end_frame, 100, mode="peak")
+        level = overview.get_level_for(end_frame - start_frame, 100)
+        assert bin_size == overview.get_level_bin_size(level)
+        assert bin_start_frames[0] <= start_frame < bin_start_frames[0] + bin_size
+        assert bin_start_frames[-1] < end_frame <= bin_start_frames[-1] + bin_size
+        b0 = bin_start_frames[0] // bin_size
+        min_values = np.asarray(overview._levels[segment_index][level]["min"])[b0:b0 + values.shape[0]]
+        max_values = np.asarray(overview._levels[segment_index][level]["max"])[b0:b0 + values.shape[0]]
+        assert np.array_equal(values, np.where(-min_values > max_values, min_values, max_values))
+
+
+def test_trace_overview():
+    binary_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    zarr_analyzer = binary_analyzer.save_as(format="zarr", folder=test_folder / "sorting_analyzer.zarr")
+    recording = si.generate_recording(num_channels=binary_analyzer.get_num_channels(), durations=[30., 10.], seed=0)
+    recording_fingerprint = get_recording_fingerprint(recording)
+
+    for analyzer in (binary_analyzer, zarr_analyzer):
+        overview = make_overview(analyzer, recording, recording_fingerprint)
+        assert not overview.load()
+        assert overview.build()
+        check_overview(overview, recording)
+
+        # stored with the analyzer and reloaded
+        overview = make_overview(analyzer, recording, recording_fingerprint)
+        assert overview.load()
+        check_overview(overview, recording)
+
+        # other traces: not reused
+        other_recording = si.generate_recording(num_channels=analyzer.get_num_channels(), durations=[30., 10.], seed=1)
+        overview = make_overview(analyzer, other_recording, get_recording_fingerprint(other_recording))
+        assert not overview.load()
+
+    # in memory
+    overview = make_overview(binary_analyzer, recording, None)
+    assert not overview.load()
+    assert overview.build()
+    assert isinstance(overview._levels[0][0]["min"], np.ndarray)
+    assert not isinstance(overview._levels[0][0]["min"], np.memmap)
+    check_overview(overview, recording)
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_trace_overview()
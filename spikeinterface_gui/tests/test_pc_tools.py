@@ -0,0 +1,63 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.pc_tools import PCProjectionReader
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def test_pc_projection_reader():
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    pc_ext = sorting_analyzer.get_extension("principal_components")
+    # the analyzer of the tests is sparse: projections are realigned on the requested channels
+    assert sorting_analyzer.sparsity is not None
+
+    controller = Controller(sorting_analyzer, backend="none")
+    reader = controller.get_pc_reader()
+    channel_ids = sorting_analyzer.channel_ids
+    unit_ids = sorting_analyzer.unit_ids
+
+    # all spikes on all channels
+    pc_unit_index, all_pcs = controller.get_all_pcs()
+    expected, expected_unit_index = pc_ext.get_some_projections()
+    assert np.array_equal(pc_unit_index, expected_unit_index)
+    assert np.array_equal(all_pcs, expected)
+
+    rng = np.random.default_rng(0)
+    for channel_indices in (np.arange(channel_ids.size), np.array([0, 3]), np.sort(rng.choice(channel_ids.size, 3, replace=False))):
+        for unit_index, unit_id in enumerate(unit_ids):
+            expected, _ = pc_ext.get_some_projections(channel_ids=channel_ids[channel_indices], unit_ids=[unit_id])
+            projections = reader.get_unit_projections(unit_index, channel_indices)
+            assert np.array_equal(projections, expected)
+            # cached
+            assert reader.get_unit_projections(unit_index, channel_indices) is projections
+        # several units at once
+        rows = np.sort(np.concatenate([reader.get_unit_rows(0), reader.get_unit_rows(2)]))
+        expected, _ = pc_ext.get_some_projections(channel_ids=channel_ids[channel_indices], unit_ids=unit_ids[[0, 2]])
+        assert np.array_equal(reader.get_projections(rows, channel_indices), expected)
+
+    # the cache stays under the memory budget
+    block_nbytes = reader.get_unit_projections(0).nbytes
+    small_reader = PCProjectionReader(pc_ext, reader.spike_unit_indices, unit_ids,
+                                      sparsity=sorting_analyzer.sparsity, max_bytes=2 * block_nbytes)
+    for unit_index in range(unit_ids.size):
+        small_reader.get_unit_projections(unit_index)
+        assert small_reader.nbytes <= small_reader.max_bytes or len(small_reader._unit_blocks) == 1
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_pc_projection_reader()
@@ -0,0 +1,247 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.spikeamplitudeview import SpikeAmplitudeView
+from spikeinterface_gui.view_base import ViewBase
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+class NotifierRecorder:
+    # records the notifications of a view without UI
+    def __init__(self):
+        self.events = []
+
+    def __getattr__(self, name):
+        return lambda: self.events.append(name)
+
+
+def make_view_without_ui(monkeypatch, controller):
+    def init_without_ui(self, controller=None, parent=None, backend="qt"):
+        self.controller = controller
+        self.backend = backend
+        self.settings = {p['name']: p['value'] for p in self._settings}
+        self.notifier = NotifierRecorder()
+    monkeypatch.setattr(ViewBase, "__init__", init_without_ui)
+    return SpikeAmplitudeView(controller=controller, backend="none")
+
+
+def assert_unit_data_equal(unit_data, expected):
+    assert len(unit_data) == len(expected)
+    for value, expected_value in zip(unit_data, expected):
+        assert np.array_equal(value, expected_value)
+
+
+def test_unit_stats_cache(monkeypatch):
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none", curation=True)
+    view = make_view_without_ui(monkeypatch, controller)
+    unit_ids = controller.unit_ids
+
+    # the cache gives the output of the computation (the previous get_unit_data())
+    view.settings["max_spikes_per_unit"] = 50
+    for segment_index in range(controller.num_segments):
+        for unit_id in unit_ids:
+            unit_data = view.get_unit_data(unit_id, segment_index=segment_index)
+            assert_unit_data_equal(unit_data, view._compute_unit_data(unit_id, segment_index))
+            # computed once
+            assert view.get_unit_data(unit_id, segment_index=segment_index) is unit_data
+    assert len(view._unit_stats_cache) == unit_ids.size * controller.num_segments
+
+    # the settings are part of the key
+    unit_id = unit_ids[0]
+    unit_data = view.get_unit_data(unit_id)
+    for name, value in (("num_bins", 12), ("display_high_percentiles", 90.), ("auto_decimate", False)):
+        view.settings[name] = value
+        new_unit_data = view.get_unit_data(unit_id)
+        assert new_unit_data is not unit_data
+        assert_unit_data_equal(new_unit_data, view._compute_unit_data(unit_id, 0))
+        unit_data = new_unit_data
+    controller.main_settings["use_times"] = not controller.main_settings["use_times"]
+    assert view.get_unit_data(unit_id) is not unit_data
+
+    # changing the settings clears the cache
+    view.on_settings_changed()
+    assert len(view._unit_stats_cache) == 0
+
+    # a split clears the cache
+    controller.set_visible_unit_ids([unit_id])
+    for segment_index in range(controller.num_segments):
+        unit_data = view.get_unit_data(unit_id, segment_index=segment_index)
+    spike_times, spike_data = unit_data[0], unit_data[1]
+    t_mid = np.median(spike_times)
+    polygon = np.array([
+        [spike_times.min() - 1., spike_data.min() - 1.],
+        [t_mid, spike_data.min() - 1.],
+        [t_mid, spike_data.max() + 1.],
+        [spike_times.min() - 1., spike_data.max() + 1.],
+    ])
+    view._lasso_vertices = {segment_index: [polygon] for segment_index in range(controller.num_segments)}
+    view.select_all_spikes_from_lasso()
+    assert controller.get_indices_spike_selected().size > 0
+    view.split()
+    assert controller.get_split_unit_ids() == [unit_id]
+    assert "notify_manual_curation_updated" in view.notifier.events
+    assert len(view._unit_stats_cache) == 0
+    assert_unit_data_equal(view.get_unit_data(unit_id), view._compute_unit_data(unit_id, 0))
+
+    # and so does a curation done in another view
+    assert len(view._unit_stats_cache) == 1
+    view.on_manual_curation_updated()
+    assert len(view._unit_stats_cache) == 0
+
+
+def get_density_with_spike_loop(view, segment_index):
+    # reference: spikes binned one by one, pixels colored one by one
+    controller = view.controller
+    num_bins_x, num_bins_y = view.settings['density_num_bins_x'], view.settings['density_num_bins_y']
+    t_start, t_stop = controller.get_t_start_t_stop(segment_index=segment_index)
+    units = []
+    for unit_id in controller.get_visible_unit_ids():
+        inds = controller.get_spike_indices(unit_id, segment_index=segment_index)
+        if inds.size > 0:
+            units.append((unit_id, inds))
+    data_min = min(np.min(view.spike_data[inds]) for _, inds in units)
+    data_max = max(np.max(view.spike_data[inds]) for _, inds in units)
+
+    counts = np.zeros((len(units), num_bins_y, num_bins_x), dtype='int64')
+    spike_pixels = {}
+    for k, (unit_id, inds) in enumerate(units):
+        spike_pixels[unit_id] = []
+        for ind in inds:
+            t = controller.sample_index_to_time(controller.spikes["sample_index"][ind])
+            ix = int(np.floor((t - t_start) / (t_stop - t_start) * num_bins_x))
+            iy = int(np.floor((view.spike_data[ind] - data_min) / (data_max - data_min) * num_bins_y))
+            ix = min(max(ix, 0), num_bins_x - 1)
+            iy = min(max(iy, 0), num_bins_y - 1)
+            counts[k, iy, ix] += 1
+            spike_pixels[unit_id].append((iy, ix))
+    total = counts.sum(axis=0)
+
+    sparse_inds = {}
+    for unit_id, inds in units:
+        sparse_inds[unit_id] = [ind for ind, (iy, ix) in zip(inds, spike_pixels[unit_id])
+                                if total[iy, ix] <= view.settings['density_sparse_count']]
+
+    unit_rgb = np.array([controller.get_unit_color(unit_id)[:3] for unit_id, _ in units])
+    max_log_total = np.log1p(total.max())
+    rgb = np.zeros((num_bins_y, num_bins_x, 3))
+    alpha = np.zeros((num_bins_y, num_bins_x))
+    for iy in range(num_bins_y):
+        for ix in range(num_bins_x):
+            if total[iy, ix] <= view.settings['density_sparse_count']:
+                continue
+            weights = np.log1p(counts[:, iy, ix])
+            rgb[iy, ix] = weights @ unit_rgb / weights.sum()
+            alpha[iy, ix] = (0.3 + 0.7 * np.log1p(total[iy, ix]) / max_log_total) * view.settings['alpha']
+    return rgb * 255, alpha * 255, (t_start, t_stop, data_min, data_max), sparse_inds
+
+
+def test_density_image(monkeypatch):
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none")
+    view = make_view_without_ui(monkeypatch, controller)
+    view.settings['display_mode'] = 'density'
+    unit_ids = controller.unit_ids
+
+    for segment_index in range(controller.num_segments):
+        for visible_unit_ids in (unit_ids[:1], unit_ids[::2], unit_ids):
+            controller.set_visible_unit_ids(list(visible_unit_ids))
+            # coarse bins with dense pixels, then the default ones where all spikes are sparse
+            for num_bins_x, num_bins_y in ((8, 4), (800, 300)):
+                view.settings['density_num_bins_x'] = num_bins_x
+                view.settings['density_num_bins_y'] = num_bins_y
+                density = view.get_density_data(segment_index=segment_index)
+                expected_rgb, expected_alpha, expected_extent, expected_sparse = get_density_with_spike_loop(view, segment_index)
+
+                image = density['image']
+                assert image.shape == (num_bins_y, num_bins_x, 4)
+                assert np.allclose(density['extent'], expected_extent)
+                assert np.all(np.abs(image[:, :, 3] - expected_alpha) <= 1)
+                visible = expected_alpha > 0
+                assert np.all(np.abs(image[:, :, :3][visible] - expected_rgb[visible]) <= 1)
+
+                num_spikes = 0
+                for unit_id in visible_unit_ids:
+                    spike_times, spike_data, inds = density['sparse'][unit_id]
+                    assert np.array_equal(inds, expected_sparse[unit_id])
+                    assert np.array_equal(spike_data, view.spike_data[inds])
+                    num_spikes += controller.get_spike_indices(unit_id, segment_index=segment_index).size
+                if num_bins_x == 8:
+                    if visible_unit_ids.size == unit_ids.size:
+                        assert np.any(visible)
+                else:
+                    assert not np.any(visible)
+                    assert sum(density['sparse'][unit_id][2].size for unit_id in visible_unit_ids) == num_spikes
+
+    # nothing to display
+    controller.set_visible_unit_ids([])
+    assert view.get_density_data(segment_index=0) is None
+
+
+def test_panel_lasso_selection(monkeypatch):
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none")
+    view = make_view_without_ui(monkeypatch, controller)
+    unit_id = controller.unit_ids[0]
+    controller.set_visible_unit_ids([unit_id])
+    spike_times, spike_data = view._compute_unit_data(unit_id, 0)[:2]
+    t0, t1 = spike_times.min(), spike_times.max()
+
+    def finish_lasso(xs, ys, selected_in_scatter):
+        # a final lasso on the bokeh figure, with the indices bokeh found in the scatter
+        view.scatter_source = SimpleNamespace(selected=SimpleNamespace(indices=selected_in_scatter))
+        event = SimpleNamespace(final=True, geometry=dict(x=list(xs), y=list(ys)))
+        view._on_panel_selection_geometry(event)
+
+    around_spikes = ([t0 - 1., t1 + 1., t1 + 1., t0 - 1.], [spike_data.min() - 1.] * 2 + [spike_data.max() + 1.] * 2)
+    above_spikes = ([t0 - 1., t1 + 1., t1 + 1., t0 - 1.], [spike_data.max() + 10.] * 2 + [spike_data.max() + 20.] * 2)
+    for display_mode in ("scatter", "density"):
+        view.settings["display_mode"] = display_mode
+        view._current_selected = 0
+
+        # all the spikes of the unit; in density mode they are in the image, not in the scatter
+        selected_in_scatter = [] if display_mode == "density" else list(range(spike_times.size))
+        finish_lasso(*around_spikes, selected_in_scatter)
+        assert np.array_equal(controller.get_indices_spike_selected(), controller.get_spike_indices(unit_id, segment_index=0))
+
+        lasso_vertices = view._lasso_vertices[0]
+        assert len(lasso_vertices) == 1
+
+        # an empty lasso clears the selection in both modes, without keeping the polygon
+        view.notifier.events.clear()
+        finish_lasso(*above_spikes, [])
+        assert controller.get_indices_spike_selected().size == 0
+        assert view.notifier.events == ["notify_spike_selection_changed"]
+        assert view._lasso_vertices[0] is lasso_vertices and len(lasso_vertices) == 1
+
+        # also when several units are visible (no lasso selection possible)
+        controller.set_visible_unit_ids(list(controller.unit_ids[:2]))
+        controller.set_indices_spike_selected(controller.get_spike_indices(unit_id, segment_index=0)[:3])
+        warnings = []
+        view.warning = warnings.append
+        finish_lasso(*above_spikes, [])
+        assert controller.get_indices_spike_selected().size == 0
+        assert len(warnings) == 0
+        del view.warning
+        controller.set_visible_unit_ids([unit_id])
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
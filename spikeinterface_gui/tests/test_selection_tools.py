@@ -0,0 +1,50 @@
+import numpy as np
+from matplotlib.path import Path as mpl_path
+
+from spikeinterface_gui.selection_tools import SortedPointIndex, select_points_in_polygons
+
+
+def select_points_brute_force(x, y, polygons):
+    points = np.column_stack((x, y))
+    inside = np.zeros(x.size, dtype='bool')
+    for polygon in polygons:
+        if len(polygon) < 3:
+            continue
+        inside |= mpl_path(polygon).contains_points(points)
+    return np.flatnonzero(inside)
+
+
+def test_select_points_in_polygons():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 100, 20_000)
+    y = rng.normal(0, 20, 20_000)
+    # a lasso, a triangle overlapping it, a degenerated polygon and one far away
+    theta = np.linspace(0, 2 * np.pi, 50)
+    lasso = np.column_stack((30 + 15 * np.cos(theta), 5 + 25 * np.sin(theta) * np.abs(np.cos(3 * theta))))
+    triangle = np.array([[20., -10.], [60., 0.], [25., 30.]])
+    line = np.array([[0., 0.], [10., 10.]])
+    far = np.array([[500., 500.], [510., 500.], [505., 510.]])
+
+    for polygons in ([lasso], [lasso, triangle], [line], [far], [lasso, line, far, triangle]):
+        expected = select_points_brute_force(x, y, polygons)
+        assert np.array_equal(select_points_in_polygons(x, y, polygons), expected)
+        index = SortedPointIndex(x, y)
+        assert np.array_equal(index.select_in_polygons(polygons), expected)
+
+    # sorted x (spike times): no sort
+    order = np.argsort(x)
+    index = SortedPointIndex(x[order], y[order], assume_sorted=True)
+    assert index.order is None
+    expected = select_points_brute_force(x[order], y[order], [lasso, triangle])
+    assert np.array_equal(index.select_in_polygons([lasso, triangle]), expected)
+
+    # bounding box query
+    index = SortedPointIndex(x, y)
+    positions, points = index.query_bbox(10., 20., -5., 5.)
+    expected = np.flatnonzero((x >= 10.) & (x <= 20.) & (y >= -5.) & (y <= 5.))
+    assert np.array_equal(np.sort(positions), expected)
+    assert np.array_equal(points, np.column_stack((x[positions], y[positions])))
+
+
+if __name__ == '__main__':
+    test_select_points_in_polygons()
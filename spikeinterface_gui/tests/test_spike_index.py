@@ -0,0 +1,62 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def make_spike_index_with_dict(spikes, num_units, num_segments):
+    # the per unit dict of the previous implementation
+    spike_index = {}
+    for segment_index in range(num_segments):
+        for unit_index in range(num_units):
+            mask = (spikes['segment_index'] == segment_index) & (spikes['unit_index'] == unit_index)
+            spike_index[(segment_index, unit_index)] = np.flatnonzero(mask)
+    return spike_index
+
+
+def test_spike_index():
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none", use_index_cache=False)
+
+    spikes = controller.spikes
+    # same spikes as the spike vector of the sorting
+    spike_vector = sorting_analyzer.sorting.to_spike_vector(concatenated=True)
+    assert np.array_equal(spikes['sample_index'], spike_vector['sample_index'])
+    assert np.array_equal(spikes['unit_index'], spike_vector['unit_index'])
+    assert np.array_equal(spikes['segment_index'], spike_vector['segment_index'])
+
+    num_units = controller.unit_ids.size
+    num_segments = controller.num_segments
+    spike_index = make_spike_index_with_dict(spikes, num_units, num_segments)
+    for unit_index, unit_id in enumerate(controller.unit_ids):
+        all_inds = []
+        for segment_index in range(num_segments):
+            inds = controller.get_spike_indices(unit_id, segment_index=segment_index)
+            assert np.array_equal(inds, spike_index[(segment_index, unit_index)])
+            all_inds.append(inds)
+        # all segments: concatenated in segment order
+        assert np.array_equal(controller.get_spike_indices(unit_id), np.concatenate(all_inds))
+        assert controller.num_spikes[unit_id] == sum(inds.size for inds in all_inds)
+
+    for segment_index in range(num_segments):
+        sl = controller.segment_slices[segment_index]
+        assert np.all(spikes['segment_index'][sl] == segment_index)
+
+
+if __name__ == '__main__':
+    setup_module()
+    test_spike_index()
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from spikeinterface_gui.spike_tools import SpikeTable, spike_dtype, find_in_sorted
+
+
+def make_spike_table(num_spikes=1000, num_units=7, num_segments=2, seed=0):
+    rng = np.random.default_rng(seed)
+    segment_index = np.sort(rng.integers(0, num_segments, num_spikes))
+    sample_index = np.sort(rng.integers(0, 100_000, num_spikes))
+    unit_index = rng.integers(0, num_units, num_spikes)
+    channel_index = rng.integers(0, 32, num_spikes)
+    spike_vector = np.zeros(num_spikes, dtype=[('sample_index', 'int64'), ('unit_index', 'int64'), ('segment_index', 'int64'), ('channel_index', 'int64')])
+    spike_vector['sample_index'] = sample_index
+    spike_vector['unit_index'] = unit_index
+    spike_vector['segment_index'] = segment_index
+    spike_vector['channel_index'] = channel_index
+    spikes = SpikeTable.from_spike_vector(spike_vector, num_units, 32, num_segments)
+    return spikes, spike_vector
+
+
+def test_spike_table_flags():
+    spikes, spike_vector = make_spike_table()
+    num_spikes = spikes.size
+
+    # the previous structured array
+    records = np.zeros(num_spikes, dtype=spike_dtype)
+    for name in ('sample_index', 'unit_index', 'channel_index', 'segment_index'):
+        records[name] = spike_vector[name]
+        assert np.array_equal(spikes[name], records[name])
+
+    rng = np.random.default_rng(1)
+    for name in ('visible', 'selected', 'rand_selected'):
+        indices = np.sort(rng.choice(num_spikes, 100, replace=False))
+        spikes.set_flag(name, indices)
+        records[name][indices] = True
+    # unset some, flags are independent
+    spikes.set_flag('visible', slice(0, 50), False)
+    records['visible'][:50] = False
+    mask = rng.random(num_spikes) > 0.5
+    spikes['selected'] = mask
+    records['selected'] = mask
+
+    for name in ('visible', 'selected', 'rand_selected'):
+        assert np.array_equal(spikes[name], records[name])
+    assert np.array_equal(spikes.to_records(), records)
+
+    # flags are computed copies: they are read only
+    with pytest.raises(ValueError):
+        spikes['selected'][0] = True
+
+    # sub tables and single spikes
+    sub = spikes[10:20]
+    assert np.array_equal(sub.to_records(), records[10:20])
+    inds = np.array([3, 30, 300])
+    assert np.array_equal(spikes[inds].to_records(), records[inds])
+    for i in (0, 57, num_spikes - 1):
+        spike = spikes[i]
+        for name in records.dtype.names:
+            assert spike[name] == records[i][name]
+            assert spikes.get_value(i, name) == records[i][name]
+
+    # compact dtypes
+    assert spikes.nbytes < records.nbytes
+
+
+def test_find_in_sorted():
+    rng = np.random.default_rng(0)
+    sorted_indices = np.unique(rng.integers(0, 100_000, 5000))
+    for values in (
+        rng.integers(-10, 100_010, 1000),
+        sorted_indices[::7],
+        np.array([sorted_indices[0], sorted_indices[-1], -1, 100_001]),
+        np.array([], dtype='int64'),
+    ):
+        positions, found = find_in_sorted(sorted_indices, values)
+        # same as np.isin
+        assert np.array_equal(found, np.isin(values, sorted_indices))
+        assert np.array_equal(sorted_indices[positions], values[found])
+        if np.all(np.diff(values) > 0):
+            assert np.array_equal(positions, np.flatnonzero(np.isin(sorted_indices, values)))
+
+    positions, found = find_in_sorted(np.array([], dtype='int64'), np.array([1, 2]))
+    assert positions.size == 0
+    assert not np.any(found)
+
+
+if __name__ == '__main__':
+    test_spike_table_flags()
+    test_find_in_sorted()
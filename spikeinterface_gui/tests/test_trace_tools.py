@@ -0,0 +1,349 @@
+import threading
+import time
+
+import numpy as np
+
+from spikeinterface_gui.trace_tools import (
+    TraceCache,
+    TracePrefetcher,
+    AsyncTraceFetcher,
+    SegmentTimeIndex,
+    decimate_min_max,
+    extract_snippets,
+)
+
+import spikeinterface.full as si
+
+
+def make_traces(num_samples=100_000, num_channels=4, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(num_samples, num_channels)).astype("float32")
+
+
+class CountingReader:
+    def __init__(self, traces, delay=0.):
+        self.traces = traces
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_traces(self, segment_index, start_frame, end_frame):
+        with self.lock:
+            self.calls.append((segment_index, start_frame, end_frame))
+        if self.delay > 0:
+            time.sleep(self.delay)
+        return self.traces[start_frame:end_frame]
+
+
+def test_trace_cache():
+    traces = make_traces()
+    reader = CountingReader(traces)
+    chunk_size = 1000
+    block_bytes = chunk_size * traces.shape[1] * traces.itemsize
+    cache = TraceCache(reader.get_traces, lambda segment_index: traces.shape[0], chunk_size, max_bytes=10 * block_bytes)
+
+    # same traces as a direct read
+    for start, end in [(0, 10), (500, 2500), (99_500, 100_000), (12_345, 18_765)]:
+        assert np.array_equal(cache.get_traces(0, start, end), traces[start:end])
+
+    # cached blocks are not read again
+    cache.reset_counters()
+    num_calls = len(reader.calls)
+    cache.get_traces(0, 13_000, 18_000)
+    assert len(reader.calls) == num_calls
+    assert cache.get_info()["misses"] == 0
+
+    # scrolling only reads the new blocks, in one read
+    cache.get_traces(0, 13_500, 20_500)
+    assert reader.calls[num_calls:] == [(0, 19_000, 21_000)]
+
+    # LRU eviction under the memory budget
+    assert cache.nbytes <= cache.max_bytes
+    cache.get_traces(0, 13_000, 14_000)
+    cache.get_traces(0, 50_000, 59_000)
+    assert cache.get_info()["num_blocks"] == 10
+    assert cache.has_block(0, 13)
+    assert not cache.has_block(0, 14)
+
+    # a request larger than the budget is still correct
+    assert np.array_equal(cache.get_traces(0, 0, 30_000), traces[:30_000])
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_trace_cache_inflight():
+    traces = make_traces()
+    reader = CountingReader(traces, delay=0.05)
+    cache = TraceCache(reader.get_traces, lambda segment_index: traces.shape[0], 1000)
+
+    # concurrent requests of the same blocks: each block is read once, the other threads wait
+    results = {}
+
+    def request(i):
+        results[i] = cache.get_traces(0, 2000, 8000)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i in range(4):
+        assert np.array_equal(results[i], traces[2000:8000])
+    read_blocks = [b for _, start, end in reader.calls for b in range(start // 1000, -(-end // 1000))]
+    assert sorted(read_blocks) == list(range(2, 8))
+    assert len(cache._inflight) == 0
+
+
+class GatedReader(CountingReader):
+    # the first read waits until release() so that requests can be superseded while it runs
+    def __init__(self, traces):
+        CountingReader.__init__(self, traces)
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def release(self):
+        self._release.set()
+
+    def get_traces(self, segment_index, start_frame, end_frame):
+        self.started.set()
+        assert self._release.wait(timeout=10)
+        return CountingReader.get_traces(self, segment_index, start_frame, end_frame)
+
+
+def test_trace_prefetcher():
+    traces = make_traces()
+    reader = GatedReader(traces)
+    cache = TraceCache(reader.get_traces, lambda segment_index: traces.shape[0], 1000)
+    prefetcher = TracePrefetcher(cache)
+
+    prefetcher.prefetch(0, 0, 20_000)
+    assert reader.started.wait(timeout=10)
+    # superseded while its first block is read: a pending request that never starts
+    prefetcher.prefetch(0, 30_000, 32_000)
+    # the latest request
+    prefetcher.prefetch(0, 50_000, 53_000)
+    future = prefetcher._future
+    reader.release()
+    future.result(timeout=10)
+
+    # the running request stops after its current block, the pending one is never read
+    assert reader.calls[0] == (0, 0, 1000)
+    assert reader.calls[1:] == [(0, 50_000 + i * 1000, 51_000 + i * 1000) for i in range(3)]
+    assert cache.has_block(0, 0)
+    assert not cache.has_block(0, 1)
+    assert not cache.has_block(0, 30)
+    assert all(cache.has_block(0, block_index) for block_index in (50, 51, 52))
+    assert np.array_equal(cache.get_traces(0, 50_000, 53_000), traces[50_000:53_000])
+
+    # cancel() drops a pending request
+    busy = threading.Event()
+    prefetcher._executor.submit(busy.wait, 10)
+    prefetcher.prefetch(0, 70_000, 71_000)
+    prefetcher.cancel()
+    busy.set()
+    prefetcher.shutdown()
+    prefetcher._executor.shutdown(wait=True)
+    assert not cache.has_block(0, 70)
+    assert all(start < 70_000 for _, start, _ in reader.calls)
+
+
+def test_async_trace_fetcher():
+    traces = make_traces()
+    reader = GatedReader(traces)
+    fetcher = AsyncTraceFetcher()
+    # the UI event loop: delivered callbacks are queued and run later in the test thread
+    ui_queue = []
+    delivered = []
+
+    def request(start_frame, end_frame):
+        return fetcher.submit(
+            lambda: reader.get_traces(0, start_frame, end_frame),
+            lambda result: delivered.append((start_frame, result)),
+            ui_queue.append,
+        )
+
+    def run_ui_queue():
+        while ui_queue:
+            ui_queue.pop(0)()
+
+    # superseded while running: the result is dropped in the worker
+    request(0, 1000)
+    assert reader.started.wait(timeout=10)
+    # superseded before starting: never fetched
+    request(10_000, 11_000)
+    request_id = request(20_000, 21_000)
+    future = fetcher._future
+    reader.release()
+    future.result(timeout=10)
+    run_ui_queue()
+    assert fetcher.is_latest(request_id)
+    assert [call[1] for call in reader.calls] == [0, 20_000]
+    assert len(delivered) == 1
+    assert delivered[0][0] == 20_000
+    assert np.array_equal(delivered[0][1], traces[20_000:21_000])
+
+    # superseded after the result was queued for the UI: dropped in the UI thread
+    delivered.clear()
+    request(30_000, 31_000)
+    fetcher._future.result(timeout=10)
+    assert len(ui_queue) == 1
+    request(40_000, 41_000)
+    fetcher._future.result(timeout=10)
+    run_ui_queue()
+    assert [start for start, _ in delivered] == [40_000]
+
+    # cancel(): a result not yet delivered is dropped
+    delivered.clear()
+    request(50_000, 51_000)
+    fetcher._future.result(timeout=10)
+    fetcher.cancel()
+    run_ui_queue()
+    assert delivered == []
+
+    # an error in a request does not stop the worker
+    fetcher.submit(lambda: 1 / 0, delivered.append, ui_queue.append)
+    fetcher._future.result(timeout=10)
+    assert ui_queue == []
+    request(60_000, 61_000)
+    fetcher._future.result(timeout=10)
+    run_ui_queue()
+    assert [start for start, _ in delivered] == [60_000]
+    fetcher.shutdown()
+
+
+def test_decimate_min_max():
+    rng = np.random.default_rng(0)
+    for num_samples, num_bins in [(10_000, 100), (10_003, 100), (60_000, 1500), (59_999, 1500)]:
+        times = np.arange(num_samples) / 30000.
+        data = rng.normal(size=(3, num_samples)).astype("float32")
+        dec_times, dec_data = decimate_min_max(times, data, num_bins)
+
+        # brute force envelope
+        bin_size = int(np.ceil(num_samples / num_bins))
+        expected = []
+        for start in range(0, num_samples, bin_size):
+            block = data[:, start:start + bin_size]
+            expected.append(np.stack([block.min(axis=1), block.max(axis=1)], axis=1))
+        expected = np.concatenate(expected, axis=1)
+        assert np.array_equal(dec_data, expected)
+        assert dec_times.size == dec_data.shape[1]
+        assert np.all(np.diff(dec_times) >= 0)
+        # extrema are kept
+        assert np.array_equal(dec_data.max(axis=1), data.max(axis=1))
+        assert np.array_equal(dec_data.min(axis=1), data.min(axis=1))
+
+    # nothing to gain: the data is returned as is
+    times = np.arange(150) / 30000.
+    data = rng.normal(size=(3, 150))
+    dec_times, dec_data = decimate_min_max(times, data, 100)
+    assert dec_data is data
+
+
+def test_segment_time_index():
+    sampling_frequency = 30000.
+    recording = si.generate_recording(num_channels=2, durations=[10., 5.], sampling_frequency=sampling_frequency, seed=0)
+    recording.set_times(np.arange(recording.get_num_samples(1)) / sampling_frequency + 12.5, segment_index=1)
+    rng = np.random.default_rng(0)
+    num_samples = recording.get_num_samples(0)
+    irregular_times = np.cumsum(rng.uniform(0.5, 1.5, num_samples)) / sampling_frequency + 3.
+    recording_irregular = si.generate_recording(num_channels=2, durations=[10.], sampling_frequency=sampling_frequency, seed=0)
+    recording_irregular.set_times(irregular_times, segment_index=0)
+
+    # no time vector, affine time vector, irregular time vector
+    cases = [(recording, 0), (recording, 1), (recording_irregular, 0)]
+    for rec, segment_index in cases:
+        time_index = SegmentTimeIndex.from_recording(rec, segment_index)
+        if rec is recording_irregular:
+            assert not time_index.is_affine
+        else:
+            assert time_index.is_affine
+        n = rec.get_num_samples(segment_index)
+        times = rec.get_times(segment_index=segment_index)
+        sample_indices = np.array([0, 1, 1234, n // 2, n - 1])
+        assert np.allclose(time_index.sample_index_to_time(sample_indices), times[sample_indices])
+        assert np.allclose(time_index.get_times(1000, 2000), times[1000:2000])
+        assert np.isclose(time_index.t_stop, times[-1])
+        for sample_index in sample_indices:
+            t = times[sample_index]
+            assert time_index.time_to_sample_index(t) == rec.time_to_sample_index(t, segment_index=segment_index)
+        # in between 2 samples
+        t = (times[100] + times[101]) / 2
+        assert time_index.time_to_sample_index(np.array([t]))[0] in (100, 101)
+
+    # a time vector which is not a numpy array is never read entirely
+    class ArrayLike:
+        def __init__(self, array):
+            self.array = array
+            self.max_read = 0
+
+        def __getitem__(self, key):
+            values = self.array[key]
+            self.max_read = max(self.max_read, np.size(values))
+            return values
+
+    time_vector = ArrayLike(irregular_times)
+    time_index = SegmentTimeIndex(num_samples, sampling_frequency, time_vector=time_vector)
+    assert not time_index.is_affine
+    assert time_index.time_vector is time_vector
+    time_vector.max_read = 0
+    times = np.concatenate([rng.uniform(irregular_times[0] - 1., irregular_times[-1] + 1., 1000), irregular_times[[0, 10, 20, -1]]])
+    assert np.array_equal(time_index.time_to_sample_index(times), np.searchsorted(irregular_times, times, side="right") - 1)
+    assert time_index.time_to_sample_index(irregular_times[12345]) == 12345
+    sample_indices = rng.integers(0, num_samples, 1000)
+    assert np.array_equal(time_index.sample_index_to_time(sample_indices), irregular_times[sample_indices])
+    assert time_index.sample_index_to_time(12345) == irregular_times[12345]
+    assert np.array_equal(time_index.get_times(1000, 2000), irregular_times[1000:2000])
+    assert time_vector.max_read < num_samples
+
+    # a zarr time vector stays a zarr array
+    import zarr
+    zarr_times = zarr.array(irregular_times, chunks=(10_000,))
+    time_index = SegmentTimeIndex(num_samples, sampling_frequency, time_vector=zarr_times)
+    assert time_index.time_vector is zarr_times
+    assert np.array_equal(time_index.time_to_sample_index(times), np.searchsorted(irregular_times, times, side="right") - 1)
+    assert np.array_equal(time_index.sample_index_to_time(sample_indices), irregular_times[sample_indices])
+
+
+def test_extract_snippets():
+    traces = make_traces(num_samples=50_000, num_channels=6)
+    num_samples = traces.shape[0]
+    nbefore, nafter = 20, 40
+    rng = np.random.default_rng(0)
+    # unsorted, with duplicates, close spikes, isolated spikes and spikes crossing the borders
+    sample_indices = np.concatenate([
+        rng.integers(0, num_samples, 300),
+        [5, 5, 19, 20, num_samples - 40, num_samples - 41, num_samples - 1],
+        np.arange(10_000, 10_100, 3),
+    ])
+    rng.shuffle(sample_indices)
+
+    for channel_indices in (None, np.array([4, 1, 2])):
+        reader = CountingReader(traces)
+        snippets, valid = extract_snippets(
+            lambda start, end: reader.get_traces(0, start, end), sample_indices, nbefore, nafter,
+            num_samples, chunk_size=3000, channel_indices=channel_indices,
+        )
+        # per spike slicing
+        for i, sample_index in enumerate(sample_indices):
+            start, end = sample_index - nbefore, sample_index + nafter
+            expected_valid = start >= 0 and end <= num_samples
+            assert valid[i] == expected_valid
+            if expected_valid:
+                expected = traces[start:end]
+                if channel_indices is not None:
+                    expected = expected[:, channel_indices]
+                assert np.array_equal(snippets[i], expected)
+            else:
+                assert np.all(snippets[i] == 0)
+        # far less reads than spikes, and never more than a chunk and a snippet
+        assert len(reader.calls) < sample_indices.size // 2
+        assert max(end - start for _, start, end in reader.calls) <= 3000 + nbefore + nafter
+
+
+if __name__ == '__main__':
+    test_trace_cache()
+    test_trace_cache_inflight()
+    test_trace_prefetcher()
+    test_async_trace_fetcher()
+    test_decimate_min_max()
+    test_segment_time_index()
+    test_extract_snippets()
@@ -0,0 +1,99 @@
+import numpy as np
+
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.traceview import TraceView
+from spikeinterface_gui.view_base import ViewBase
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def make_scatter_with_unit_loop(view, spikes_chunk, ind1, times_chunk, data_curves, visible_channel_inds):
+    # the previous implementation: the spikes of each visible unit are masked one by one
+    scatter_x = []
+    scatter_y = []
+    scatter_colors = []
+    global_to_local_chan_inds = np.zeros(view.controller.channel_ids.size, dtype='int64')
+    global_to_local_chan_inds[visible_channel_inds] = np.arange(visible_channel_inds.size, dtype='int64')
+    for unit_index, unit_id in view.controller.iter_visible_units():
+        unit_spikes = spikes_chunk[spikes_chunk["unit_index"] == unit_index]
+        channel_inds = unit_spikes["channel_index"]
+        sample_inds = unit_spikes["sample_index"] - ind1
+        chan_mask = np.isin(channel_inds, visible_channel_inds)
+        sample_inds = sample_inds[chan_mask]
+        channel_inds = channel_inds[chan_mask]
+        x = times_chunk[sample_inds]
+        if view.channel_order_reverse is not None:
+            y = view.channel_order_reverse[channel_inds] + 0.5
+        else:
+            y = data_curves[global_to_local_chan_inds[channel_inds], sample_inds]
+        scatter_x.extend(x)
+        scatter_y.extend(y)
+        scatter_colors.extend([view.get_unit_color(unit_id)] * len(x))
+    return scatter_x, scatter_y, scatter_colors
+
+
+def test_spike_overlay(monkeypatch):
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none")
+
+    # the view without the UI, with the panel colors (html strings)
+    def init_without_ui(self, controller=None, parent=None, backend="qt"):
+        self.controller = controller
+        self.backend = backend
+        self.settings = {p['name']: p['value'] for p in self._settings}
+    monkeypatch.setattr(ViewBase, "__init__", init_without_ui)
+    view = TraceView(controller=controller, backend="panel")
+
+    segment_index = 0
+    ind1, ind2 = 1000, controller.get_num_samples(segment_index) - 1000
+    rng = np.random.default_rng(0)
+    num_channels = controller.channel_ids.size
+    traces_chunk = rng.normal(size=(ind2 - ind1, num_channels)).astype("float32")
+    times_chunk = (np.arange(ind1, ind2) / controller.sampling_frequency).astype("float64")
+    sl = controller.segment_slices[segment_index]
+    spikes_seg = controller.spikes[sl]
+    i1, i2 = np.searchsorted(spikes_seg["sample_index"], [ind1, ind2])
+    spikes_chunk = spikes_seg[i1:i2]
+
+    unit_ids = controller.unit_ids
+    channel_order_reverse = rng.permutation(num_channels)
+    for visible_unit_ids in (unit_ids[:1], unit_ids[::2], unit_ids):
+        controller.set_visible_unit_ids(list(visible_unit_ids))
+        for visible_channel_inds in (np.arange(num_channels), np.arange(0, num_channels, 3)):
+            controller.visible_channel_inds = visible_channel_inds
+            # trace view, then trace map view with channels ordered by depth
+            for order_reverse in (None, channel_order_reverse):
+                view.channel_order_reverse = order_reverse
+                fetched = dict(ind1=ind1, ind2=ind2, traces_chunk=traces_chunk, times_chunk=times_chunk)
+                _, data_curves, scatter_x, scatter_y, scatter_colors = view.make_data_in_chunk(segment_index, fetched)
+                assert scatter_x.size == scatter_y.size == scatter_colors.size
+
+                expected = make_scatter_with_unit_loop(view, spikes_chunk, ind1, times_chunk, data_curves,
+                                                       visible_channel_inds)
+                # the loop is ordered by unit, the vectorized overlay by time
+                assert len(expected[0]) == scatter_x.size
+                assert sorted(zip(*expected)) == sorted(zip(scatter_x, scatter_y, scatter_colors))
+
+    # the lookup table gives the color of the unit of each spike
+    unit_indices = np.array([3, 0, 3, 5, 0])
+    colors = view.get_spike_colors_from_lut(unit_indices)
+    assert list(colors) == [view.get_unit_color(unit_ids[unit_index]) for unit_index in unit_indices]
+    assert view.get_spike_colors_from_lut(np.array([], dtype="int64")).size == 0
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
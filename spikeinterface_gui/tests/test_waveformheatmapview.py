@@ -0,0 +1,40 @@
+import numpy as np
+
+from spikeinterface_gui.waveformheatmapview import compute_waveforms_histogram
+
+
+def compute_waveforms_histogram_with_loop(waveforms, bin_min, bin_max, bin_size):
+    # the previous implementation: one fancy indexing per waveform
+    data = waveforms.swapaxes(1, 2).reshape(waveforms.shape[0], -1)
+    bins = np.arange(bin_min, bin_max, bin_size)
+    hist2d = np.zeros((data.shape[1], bins.size))
+    indexes0 = np.arange(data.shape[1])
+    data_binned = np.floor((data - bin_min) / bin_size).astype('int32')
+    data_binned = data_binned.clip(0, bins.size - 1)
+    for d in data_binned:
+        hist2d[indexes0, d] += 1
+    return hist2d
+
+
+def test_compute_waveforms_histogram():
+    rng = np.random.default_rng(0)
+    # (num_waveforms, num_samples, num_channels), with values outside of the bins
+    waveforms = (rng.normal(size=(200, 60, 5)) * 8.).astype('float32')
+    bin_min, bin_max, bin_size = -20., 8., 0.1
+    num_bins = np.arange(bin_min, bin_max, bin_size).size
+
+    hist = compute_waveforms_histogram(waveforms, bin_min, bin_size, num_bins)
+    expected = compute_waveforms_histogram_with_loop(waveforms, bin_min, bin_max, bin_size)
+    assert hist.shape == expected.shape
+    assert np.array_equal(hist, expected)
+    # each (channel, sample) counts all waveforms
+    assert np.all(hist.sum(axis=1) == waveforms.shape[0])
+
+    # histograms are additive: a unit histogram can be summed with others
+    hist0 = compute_waveforms_histogram(waveforms[:80], bin_min, bin_size, num_bins)
+    hist1 = compute_waveforms_histogram(waveforms[80:], bin_min, bin_size, num_bins)
+    assert np.array_equal(hist0 + hist1, hist)
+
+
+if __name__ == '__main__':
+    test_compute_waveforms_histogram()
@@ -0,0 +1,117 @@
+import numpy as np
+
+import spikeinterface_gui.waveformview as waveformview
+from spikeinterface_gui.controller import Controller
+from spikeinterface_gui.waveformview import WaveformView
+from spikeinterface_gui.view_base import ViewBase
+
+from spikeinterface_gui.tests.testingtools import clean_all, make_analyzer_folder
+
+import spikeinterface.full as si
+
+from pathlib import Path
+
+test_folder = Path('my_dataset')
+
+
+def setup_module():
+    make_analyzer_folder(test_folder, case="tiny")
+
+def teardown_module():
+    clean_all(test_folder)
+
+
+def get_waveforms_samples_dense(view, unit_id, channel_indexes):
+    # the previous implementation: dense waveforms of the unit, subset of "num_waveforms", common channels
+    # (with the seeded subset instead of a new random one at each refresh)
+    wf_ext = view.controller.analyzer.get_extension("waveforms")
+    waveforms = wf_ext.get_waveforms_one_unit(unit_id, force_dense=True)
+    num_waveforms = view.settings["num_waveforms"]
+    if len(waveforms) > num_waveforms:
+        unit_index = list(view.controller.unit_ids).index(unit_id)
+        rng = np.random.default_rng(seed=unit_index)
+        inds = np.sort(rng.choice(len(waveforms), num_waveforms, replace=False))
+        waveforms = waveforms[inds, :, :]
+    return waveforms[:, :, channel_indexes]
+
+
+def test_waveforms_samples_cache(monkeypatch):
+    sorting_analyzer = si.load_sorting_analyzer(test_folder / "sorting_analyzer")
+    controller = Controller(sorting_analyzer, backend="none")
+
+    # the view without the UI
+    def init_without_ui(self, controller=None, parent=None, backend="qt"):
+        self.controller = controller
+        self.backend = backend
+        self.settings = {p['name']: p['value'] for p in self._settings}
+    monkeypatch.setattr(ViewBase, "__init__", init_without_ui)
+    view = WaveformView(controller=controller)
+
+    # count the reads of the waveforms extension
+    num_reads = dict(count=0)
+    get_waveforms = controller.get_waveforms
+    def counting_get_waveforms(unit_id):
+        num_reads["count"] += 1
+        return get_waveforms(unit_id)
+    monkeypatch.setattr(controller, "get_waveforms", counting_get_waveforms)
+
+    unit_ids = controller.unit_ids
+    num_channels = controller.channel_ids.size
+    all_channels = np.arange(num_channels)
+    some_channels = np.array([num_channels - 1, 0, 3])
+    for num_waveforms in (20, 10_000):
+        view.settings["num_waveforms"] = num_waveforms
+        num_reads["count"] = 0
+        for channel_indexes in (all_channels, some_channels):
+            for unit_id in unit_ids:
+                samples = view.get_waveforms_samples(unit_id, channel_indexes)
+                expected = get_waveforms_samples_dense(view, unit_id, channel_indexes)
+                assert samples.shape == expected.shape
+                assert samples.shape[0] <= num_waveforms
+                assert np.array_equal(samples, expected)
+        # read once per unit, the other channels come from the cache
+        assert num_reads["count"] == unit_ids.size
+
+    # the same subset at each refresh
+    unit_id = unit_ids[0]
+    view.settings["num_waveforms"] = 20
+    samples = view.get_waveforms_samples(unit_id, all_channels)
+    num_reads["count"] = 0
+    assert np.array_equal(view.get_waveforms_samples(unit_id, all_channels), samples)
+    assert num_reads["count"] == 0
+
+    # a new num_waveforms draws a new subset
+    view.settings["num_waveforms"] = 5
+    assert view.get_waveforms_samples(unit_id, all_channels).shape[0] == 5
+    assert num_reads["count"] == 1
+    assert list(view._waveforms_samples_cache.keys()) == [unit_id]
+
+    # least recently used units are dropped
+    monkeypatch.setattr(waveformview, "_max_cached_units_samples", 2)
+    view.get_waveforms_samples(unit_ids[1], all_channels)
+    view.get_waveforms_samples(unit_ids[0], all_channels)
+    view.get_waveforms_samples(unit_ids[2], all_channels)
+    assert list(view._waveforms_samples_cache.keys()) == [unit_ids[0], unit_ids[2]]
+    num_reads["count"] = 0
+    view.get_waveforms_samples(unit_ids[1], all_channels)
+    assert num_reads["count"] == 1
+
+    # channel sparse waveforms: zeros on the channels outside of the unit sparsity
+    sparse_chan_inds = np.array([0, 2, num_channels - 1])
+    def sparse_get_waveforms(unit_id):
+        wfs, chan_inds = get_waveforms(unit_id)
+        return wfs[:, :, sparse_chan_inds], sparse_chan_inds
+    monkeypatch.setattr(controller, "get_waveforms", sparse_get_waveforms)
+    view.settings["num_waveforms"] = 20
+    for unit_id in unit_ids[:2]:
+        samples = view.get_waveforms_samples(unit_id, some_channels)
+        expected = get_waveforms_samples_dense(view, unit_id, some_channels)
+        in_sparsity = np.isin(some_channels, sparse_chan_inds)
+        assert np.any(in_sparsity) and not np.all(in_sparsity)
+        assert np.array_equal(samples[:, :, in_sparsity], expected[:, :, in_sparsity])
+        assert np.all(samples[:, :, ~in_sparsity] == 0)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main([__file__])
@@ -16,7 +16,13 @@ def clean_all(test_folder):
 def make_analyzer_folder(test_folder, case="small", unit_dtype="str"):
     clean_all(test_folder)
 
-    if case ==  'small':
+    if case == 'tiny':
+        # fast to generate, for the tests of the tools
+        num_probe = 1
+        durations = [30.0, 10.0]
+        num_channels = 8
+        num_units = 6
+    elif case ==  'small':
         num_probe = 1
         durations = [300.0, 100.0]
         num_channels = 32
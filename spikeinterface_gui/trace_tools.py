@@ -0,0 +1,562 @@
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class TraceCache:
+    """LRU cache of trace blocks, aligned on a fixed chunk size, under a memory budget.
+
+    Any requested interval is assembled from the cached blocks, the missing blocks are fetched
+    with one call per contiguous run. So scrolling by a fraction of a window only fetches the
+    new part of the window.
+
+    Parameters
+    ----------
+    get_traces_func : callable
+        Function with signature `(segment_index, start_frame, end_frame) -> traces`.
+    get_num_samples_func : callable
+        Function with signature `(segment_index) -> num_samples`.
+    chunk_size : int
+        The block size in samples.
+    max_bytes : int
+        The memory budget. Least recently used blocks are evicted above it.
+    """
+    def __init__(self, get_traces_func, get_num_samples_func, chunk_size, max_bytes=512 * 1024**2):
+        self.get_traces_func = get_traces_func
+        self.get_num_samples_func = get_num_samples_func
+        self.chunk_size = int(chunk_size)
+        self.max_bytes = int(max_bytes)
+
+        # (segment_index, block_index) -> traces
+        self._blocks = OrderedDict()
+        # (segment_index, block_index) -> Event for blocks being fetched
+        self._inflight = {}
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.nbytes = 0
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_info(self):
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            num_blocks=len(self._blocks),
+            nbytes=self.nbytes,
+            max_bytes=self.max_bytes,
+        )
+
+    def has_block(self, segment_index, block_index):
+        return (segment_index, block_index) in self._blocks
+
+    def get_block_range(self, start_frame, end_frame):
+        """Return the first and the last+1 block index covering [start_frame, end_frame["""
+        first = start_frame // self.chunk_size
+        last = max(first + 1, -(-end_frame // self.chunk_size))
+        return first, last
+
+    def fetch_blocks(self, segment_index, first_block, last_block):
+        """Fetch and store the missing blocks in [first_block, last_block[ (one read per contiguous run).
+
+        Blocks that are already being fetched by another thread are waited for, not fetched twice.
+        """
+        num_samples = self.get_num_samples_func(segment_index)
+        block_index = first_block
+        while block_index < last_block:
+            with self._lock:
+                if self.has_block(segment_index, block_index):
+                    block_index += 1
+                    continue
+                event = self._inflight.get((segment_index, block_index))
+                if event is None:
+                    # claim a run of missing blocks
+                    owner = True
+                    run_start = block_index
+                    while (block_index < last_block and not self.has_block(segment_index, block_index)
+                           and (segment_index, block_index) not in self._inflight):
+                        block_index += 1
+                    run_stop = block_index
+                    event = threading.Event()
+                    for b in range(run_start, run_stop):
+                        self._inflight[(segment_index, b)] = event
+                else:
+                    owner = False
+
+            if not owner:
+                event.wait()
+                block_index += 1
+                continue
+
+            try:
+                start = run_start * self.chunk_size
+                end = min(run_stop * self.chunk_size, num_samples)
+                traces = self.get_traces_func(segment_index, start, end)
+                with self._lock:
+                    for b in range(run_start, run_stop):
+                        i0 = (b - run_start) * self.chunk_size
+                        block = traces[i0:i0 + self.chunk_size]
+                        if run_stop - run_start > 1:
+                            # do not keep the full run alive through a view
+                            block = block.copy()
+                        self._put(segment_index, b, block)
+            finally:
+                with self._lock:
+                    for b in range(run_start, run_stop):
+                        self._inflight.pop((segment_index, b), None)
+                event.set()
+
+    def _put(self, segment_index, block_index, block):
+        key = (segment_index, block_index)
+        if key in self._blocks:
+            self.nbytes -= self._blocks.pop(key).nbytes
+        self._blocks[key] = block
+        self.nbytes += block.nbytes
+        # evict least recently used
+        while self.nbytes > self.max_bytes and len(self._blocks) > 1:
+            _, old_block = self._blocks.popitem(last=False)
+            self.nbytes -= old_block.nbytes
+
+    def get_traces(self, segment_index, start_frame, end_frame):
+        """Get traces for [start_frame, end_frame[ using cached blocks and fetching the missing ones."""
+        first_block, last_block = self.get_block_range(start_frame, end_frame)
+
+        with self._lock:
+            missing = 0
+            for block_index in range(first_block, last_block):
+                key = (segment_index, block_index)
+                if key in self._blocks:
+                    self._blocks.move_to_end(key)
+                    self.hits += 1
+                else:
+                    missing += 1
+            self.misses += missing
+
+        if missing > 0:
+            self.fetch_blocks(segment_index, first_block, last_block)
+
+        with self._lock:
+            blocks = []
+            for block_index in range(first_block, last_block):
+                key = (segment_index, block_index)
+                block = self._blocks.get(key)
+                if block is not None:
+                    self._blocks.move_to_end(key)
+                blocks.append(block)
+
+        # never read traces with the lock held: other threads only wait for the blocks they need
+        for k, block in enumerate(blocks):
+            if block is None:
+                # evicted in the meantime because the budget is smaller than the request
+                start = (first_block + k) * self.chunk_size
+                end = min(start + self.chunk_size, self.get_num_samples_func(segment_index))
+                blocks[k] = self.get_traces_func(segment_index, start, end)
+
+        parts = []
+        for k, block in enumerate(blocks):
+            block_start = (first_block + k) * self.chunk_size
+            i0 = max(start_frame - block_start, 0)
+            i1 = min(end_frame - block_start, block.shape[0])
+            parts.append(block[i0:i1])
+        if len(parts) == 1:
+            # zero copy
+            return parts[0]
+        else:
+            return np.concatenate(parts, axis=0)
+
+
+class TracePrefetcher:
+    """Read-ahead of trace blocks into a TraceCache with a worker thread.
+
+    Only the last request is kept: a new request cancels the pending one, and a running
+    one stops at the next block. So jumping far away does not wait for stale reads.
+
+    Parameters
+    ----------
+    trace_cache : TraceCache
+        The cache to fill.
+    """
+    def __init__(self, trace_cache):
+        self.trace_cache = trace_cache
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sigui_prefetch")
+        self._generation = 0
+        self._future = None
+
+    def cancel(self):
+        self._generation += 1
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def prefetch(self, segment_index, start_frame, end_frame):
+        """Cancel the previous request and fetch [start_frame, end_frame[ in the background."""
+        self.cancel()
+        if end_frame <= start_frame:
+            return
+        self._future = self._executor.submit(self._run, self._generation, segment_index, start_frame, end_frame)
+
+    def _run(self, generation, segment_index, start_frame, end_frame):
+        first_block, last_block = self.trace_cache.get_block_range(start_frame, end_frame)
+        for block_index in range(first_block, last_block):
+            if generation != self._generation:
+                # stale
+                return
+            self.trace_cache.fetch_blocks(segment_index, block_index, block_index + 1)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+
+class SegmentTimeIndex:
+    """Conversions between sample indices and times for one recording segment.
+
+    When the times are regular (no time vector, or a time vector that is affine up to a small
+    tolerance) everything is computed with `t_start + sample_index / sampling_frequency` and
+    chunk times are built only for the chunk. Otherwise the time vector is kept as it is stored
+    (a memmap or a zarr array) and never copied entirely: chunks are slices (views of a memmap)
+    and times are converted with a binary search, done block by block on array-likes
+    (see `searchsorted_right_lazy()`).
+
+    Conversions are vectorized and follow spikeinterface conventions: without time vector the
+    sample index is rounded, with a time vector it is the last sample before the time.
+
+    Parameters
+    ----------
+    num_samples : int
+        The number of samples of the segment.
+    sampling_frequency : float
+        The sampling frequency.
+    t_start : float, default: 0.
+        The time of the first sample (ignored with a time vector).
+    time_vector : np.array | array-like | None, default: None
+        The time vector, if any. Array-likes (zarr arrays) are only read by slices.
+    regular_tolerance : float, default: 0.001
+        A time vector is considered affine if it does not deviate by more than this fraction of the sampling period.
+    """
+    def __init__(self, num_samples, sampling_frequency, t_start=0., time_vector=None, regular_tolerance=0.001):
+        self.num_samples = int(num_samples)
+        self.sampling_frequency = float(sampling_frequency)
+        # rounding mode of time_to_sample_index() in the affine case
+        self._round = True
+        if time_vector is not None and self.num_samples > 0:
+            t0 = float(time_vector[0])
+            if self._is_affine(time_vector, t0, regular_tolerance):
+                # same as a binary search in the time vector
+                self._round = False
+                time_vector = None
+            t_start = t0
+        self.t_start = float(t_start) if t_start is not None else 0.
+        self.time_vector = time_vector
+
+    @classmethod
+    def from_recording(cls, recording, segment_index, **kwargs):
+        if recording.has_time_vector(segment_index=segment_index):
+            # the time vector as stored: recording.get_times() would load it entirely in memory
+            time_vector = recording.segments[segment_index].get_times_kwargs()["time_vector"]
+            return cls(recording.get_num_samples(segment_index), recording.sampling_frequency,
+                       time_vector=time_vector, **kwargs)
+        else:
+            return cls(recording.get_num_samples(segment_index), recording.sampling_frequency,
+                       t_start=recording.get_start_time(segment_index=segment_index), **kwargs)
+
+    def _is_affine(self, time_vector, t0, regular_tolerance, chunk_size=10_000_000):
+        tolerance = regular_tolerance / self.sampling_frequency
+        for start in range(0, self.num_samples, chunk_size):
+            end = min(start + chunk_size, self.num_samples)
+            expected = np.arange(start, end, dtype="float64") / self.sampling_frequency + t0
+            if np.max(np.abs(np.asarray(time_vector[start:end]) - expected)) > tolerance:
+                return False
+        return True
+
+    @property
+    def is_affine(self):
+        return self.time_vector is None
+
+    @property
+    def t_stop(self):
+        """The time of the last sample"""
+        return float(self.sample_index_to_time(self.num_samples - 1))
+
+    def get_times(self, start_frame, end_frame):
+        """Times of [start_frame, end_frame[: a view of the time vector or only the chunk computed"""
+        if self.time_vector is None:
+            times = np.arange(start_frame, end_frame, dtype="float64")
+            times /= self.sampling_frequency
+            times += self.t_start
+            return times
+        return np.asarray(self.time_vector[start_frame:end_frame])
+
+    def sample_index_to_time(self, sample_index):
+        if self.time_vector is None:
+            return np.asarray(sample_index) / self.sampling_frequency + self.t_start
+        if isinstance(self.time_vector, np.ndarray):
+            return self.time_vector[sample_index]
+        return take_lazy(self.time_vector, sample_index)
+
+    def time_to_sample_index(self, time):
+        if self.time_vector is None:
+            sample_index = (np.asarray(time) - self.t_start) * self.sampling_frequency
+            if self._round:
+                return np.round(sample_index).astype("int64")
+            else:
+                # a small margin so that the time of a sample gives this sample despite float errors
+                return np.floor(sample_index + 1e-6).astype("int64")
+        if isinstance(self.time_vector, np.ndarray):
+            return np.searchsorted(self.time_vector, time, side="right") - 1
+        return searchsorted_right_lazy(self.time_vector, time, self.num_samples) - 1
+
+
+def take_lazy(array, indices, block_size=65536):
+    """`array[indices]` for an array-like (zarr array) reading only the blocks that contain the indices.
+
+    Consecutive indices of the same block are read with one slice.
+    """
+    indices = np.asarray(indices, dtype="int64")
+    unique_indices, inverse = np.unique(indices.ravel(), return_inverse=True)
+    values = np.empty(unique_indices.size, dtype="float64")
+    block_indices = unique_indices // block_size
+    bounds = np.flatnonzero(np.diff(block_indices)) + 1
+    for i0, i1 in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [unique_indices.size]])):
+        start, stop = unique_indices[i0], unique_indices[i1 - 1] + 1
+        block = np.asarray(array[start:stop])
+        values[i0:i1] = block[unique_indices[i0:i1] - start]
+    return values[inverse].reshape(indices.shape)[()]
+
+
+def searchsorted_right_lazy(array, values, size, block_size=65536):
+    """`np.searchsorted(array, values, side="right")` for a sorted array-like (zarr array) without reading it entirely.
+
+    A binary search on the first element of each block (scalar reads) finds the block of each value,
+    then only these blocks are read.
+
+    Parameters
+    ----------
+    array : array-like
+        The sorted array, it must support slicing.
+    values : np.array | float
+        The values to search.
+    size : int
+        The size of the array.
+    block_size : int, default: 65536
+        The size of the blocks read.
+    """
+    values = np.asarray(values, dtype="float64")
+    unique_values, inverse = np.unique(values.ravel(), return_inverse=True)
+    positions = np.empty(unique_values.size, dtype="int64")
+    num_blocks = -(-size // block_size)
+    block_starts = {}
+
+    def get_block_start(block_index):
+        if block_index not in block_starts:
+            block_starts[block_index] = float(array[block_index * block_size])
+        return block_starts[block_index]
+
+    # values are sorted: the blocks are found in increasing order and each block is read once
+    lo = 0
+    current_block_index, current_block = None, None
+    for k, value in enumerate(unique_values):
+        hi = num_blocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get_block_start(mid) <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        block_index = lo - 1
+        if block_index < 0:
+            positions[k] = 0
+            continue
+        start = block_index * block_size
+        if block_index != current_block_index:
+            current_block_index = block_index
+            current_block = np.asarray(array[start:min(start + block_size, size)])
+        positions[k] = start + np.searchsorted(current_block, value, side="right")
+        # the next (larger) value is in this block or after it
+        lo = block_index
+    return positions[inverse].reshape(values.shape)[()]
+
+
+class AsyncTraceFetcher:
+    """Run trace requests of a view in a worker thread and deliver the results to the UI thread.
+
+    Only the latest request matters: a new request cancels the pending one, and the result of a
+    request that was superseded while it was running is dropped (checked in the worker and again
+    in the UI thread).
+
+    A request is a `fetch_func` (no argument, run in the worker: it must not touch the UI) and a
+    `done_func(result)` (run in the UI thread). `invoke_func(func)` must call `func` in the UI thread,
+    for instance with a queued Qt signal or `Document.add_next_tick_callback()` with bokeh.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sigui_fetch")
+        self._request_id = 0
+        self._future = None
+
+    def submit(self, fetch_func, done_func, invoke_func):
+        """Submit a new request, the previous ones are superseded. Return the request id."""
+        self._request_id += 1
+        request_id = self._request_id
+        if self._future is not None:
+            # not started yet
+            self._future.cancel()
+        self._future = self._executor.submit(self._run, request_id, fetch_func, done_func, invoke_func)
+        return request_id
+
+    def is_latest(self, request_id):
+        return request_id == self._request_id
+
+    def _run(self, request_id, fetch_func, done_func, invoke_func):
+        if not self.is_latest(request_id):
+            return
+        try:
+            result = fetch_func()
+        except Exception:
+            traceback.print_exc()
+            return
+        if not self.is_latest(request_id):
+            return
+
+        def deliver():
+            # a newer request can have been submitted while the result was queued
+            if self.is_latest(request_id):
+                done_func(result)
+
+        invoke_func(deliver)
+
+    def cancel(self):
+        """Drop all requests: pending ones are cancelled, running ones are not delivered."""
+        self._request_id += 1
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def decimate_min_max(times, data, num_bins):
+    """Pixel-aware min/max envelope decimation of traces.
+
+    The time axis is split in `num_bins` bins (typically the width of the plot in pixels) and
+    each bin is replaced by its min and its max. Spikes and artifacts are kept, while the
+    number of points does not depend anymore on the window duration.
+
+    Parameters
+    ----------
+    times : np.array
+        The times, shape (num_samples, ).
+    data : np.array
+        The traces, shape (num_channels, num_samples).
+    num_bins : int
+        The number of bins.
+
+    Returns
+    -------
+    dec_times : np.array
+        shape (2 * num_bins, )
+    dec_data : np.array
+        shape (num_channels, 2 * num_bins)
+    """
+    num_samples = times.size
+    bin_size = int(np.ceil(num_samples / max(int(num_bins), 1)))
+    if bin_size <= 2:
+        # nothing to gain
+        return times, data
+    num_bins = int(np.ceil(num_samples / bin_size))
+    num_full_bins = num_samples // bin_size
+
+    dec_data = np.empty((data.shape[0], num_bins, 2), dtype=data.dtype)
+    # full bins are reduced on a reshaped view (no padded copy of the traces)
+    blocks = data[:, :num_full_bins * bin_size].reshape(data.shape[0], num_full_bins, bin_size)
+    np.min(blocks, axis=2, out=dec_data[:, :num_full_bins, 0])
+    np.max(blocks, axis=2, out=dec_data[:, :num_full_bins, 1])
+    if num_full_bins < num_bins:
+        tail = data[:, num_full_bins * bin_size:]
+        dec_data[:, -1, 0] = tail.min(axis=1)
+        dec_data[:, -1, 1] = tail.max(axis=1)
+
+    starts = np.arange(num_bins) * bin_size
+    dec_times = np.empty((num_bins, 2), dtype=times.dtype)
+    dec_times[:, 0] = times[starts]
+    dec_times[:, 1] = times[np.minimum(starts + bin_size // 2, num_samples - 1)]
+
+    return dec_times.reshape(-1), dec_data.reshape(data.shape[0], -1)
+
+
+def extract_snippets(get_traces_func, sample_indices, nbefore, nafter, num_samples, chunk_size, channel_indices=None,
+                     max_gap=None):
+    """Batched extraction of snippets around many spikes of one segment.
+
+    Spikes are grouped by trace chunk so that each chunk is read only once, then all snippets
+    of a group are gathered at once with fancy indexing. A read covers only the span of the
+    snippets of its group: a group is also split where the gap between two snippets is larger
+    than `max_gap`, so that isolated spikes do not read a full chunk.
+
+    Parameters
+    ----------
+    get_traces_func : callable
+        Function with signature `(start_frame, end_frame) -> traces (num_samples, num_channels)`.
+    sample_indices : np.array
+        The spike samples.
+    nbefore, nafter : int
+        The snippet is [sample - nbefore, sample + nafter[.
+    num_samples : int
+        The number of samples of the segment.
+    chunk_size : int
+        The chunk size used to group spikes (typically the chunk size of the traces cache).
+    channel_indices : np.array | None, default: None
+        Keep only these channels.
+    max_gap : int | None, default: None
+        The largest gap in samples between two snippets read together, 10 snippet widths if None.
+
+    Returns
+    -------
+    snippets : np.array
+        shape (num_spikes, nbefore + nafter, num_channels), in the order of `sample_indices`.
+        Snippets crossing the borders of the segment are filled with zeros.
+    valid : np.array
+        bool mask, False for snippets crossing the borders.
+    """
+    sample_indices = np.asarray(sample_indices, dtype="int64")
+    width = nbefore + nafter
+    starts = sample_indices - nbefore
+    valid = (starts >= 0) & (sample_indices + nafter <= num_samples)
+
+    snippets = None
+    order = np.argsort(starts[valid], kind="stable")
+    valid_inds = np.flatnonzero(valid)[order]
+    sorted_starts = starts[valid_inds]
+    if max_gap is None:
+        max_gap = 10 * width
+    chunk_ids = sorted_starts // chunk_size
+    gaps = np.diff(sorted_starts) - width
+    boundaries = np.flatnonzero((np.diff(chunk_ids) != 0) | (gaps > max_gap)) + 1
+    local = np.arange(width)
+    for group in np.split(np.arange(valid_inds.size), boundaries):
+        if group.size == 0:
+            continue
+        read_start = int(sorted_starts[group[0]])
+        read_end = int(sorted_starts[group[-1]]) + width
+        traces = get_traces_func(read_start, read_end)
+        if channel_indices is not None:
+            traces = traces[:, channel_indices]
+        if snippets is None:
+            snippets = np.zeros((sample_indices.size, width, traces.shape[1]), dtype=traces.dtype)
+        snippets[valid_inds[group]] = traces[(sorted_starts[group] - read_start)[:, None] + local[None, :]]
+
+    if snippets is None:
+        num_channels = 0 if channel_indices is None else len(channel_indices)
+        snippets = np.zeros((sample_indices.size, width, num_channels), dtype="float32")
+    return snippets, valid
@@ -19,8 +19,14 @@ class TraceMapView(ViewBase, MixinViewTrace):
         {'name': 'colormap', 'type': 'list', 'limits' : ['gray', 'bwr',  'PiYG', 'jet', 'hot', ]},
         {'name': 'reverse_colormap', 'type': 'bool', 'value': True},
         {'name': 'show_on_selected_units', 'type': 'bool', 'value': True},
+        {'name': 'use_overview', 'type': 'bool', 'value': True},
+        {'name': 'overview_mode', 'type': 'list', 'limits' : ['peak', 'rms', 'min', 'max']},
+        {'name': 'async_trace_fetch', 'type': 'bool', 'value': True},
     ]
 
+    # number of bins of the overview when the width of the plot is not known yet
+    _default_overview_width = 1500
+
 
     def __init__(self, controller=None, parent=None, backend="qt"):
         pos = controller.get_contact_location()
@@ -35,6 +41,9 @@ class TraceMapView(ViewBase, MixinViewTrace):
         self.color_limit = None
         self.last_data_curves = None
         self.factor = None
+        self._overview_displayed = False
+        # number of bins of the overview, updated with the width of the plot
+        self.overview_width = self._default_overview_width
 
         self.xsize = 0.5
         self._block_auto_refresh_and_notify = False
@@ -71,6 +80,63 @@ class TraceMapView(ViewBase, MixinViewTrace):
     def get_visible_channel_inds(self):
         return self.channel_order
 
+    def get_xsize_limit(self):
+        # raw traces are limited to xsize_max, the overview goes up to the full segment
+        if self.settings['use_overview'] and self.controller.has_trace_overview():
+            t_start, t_stop = self.controller.get_t_start_t_stop()
+            return max(self.settings['xsize_max'], t_stop - t_start)
+        return self.settings['xsize_max']
+
+    def use_overview(self):
+        return (
+            self.settings['use_overview']
+            and self.controller.has_trace_overview()
+            and self.xsize > self.settings['xsize_max']
+        )
+
+    def get_overview_in_chunk(self, t1, t2, segment_index, width_pixels, mode="peak"):
+        """
+        Read the image of the chunk from the traces overview (no spikes).
+        times_chunk only contains the start and the stop time of the image.
+        This does not touch the UI, so it can run in a worker thread.
+        """
+        ind1, ind2 = self.controller.get_chunk_indices(t1, t2, segment_index)
+        if ind2 <= ind1:
+            return np.array([]), np.zeros((self.channel_order.size, 0), dtype="float32")
+        bin_start_frames, bin_size, values = self.controller.get_trace_overview(
+            segment_index, ind1, ind2, width_pixels, mode=mode
+        )
+        if bin_start_frames.size == 0:
+            return np.array([]), np.zeros((self.channel_order.size, 0), dtype="float32")
+        last_frame = min(bin_start_frames[-1] + bin_size, self.controller.get_num_samples(segment_index))
+        times_chunk = np.array([
+            self.controller.sample_index_to_time(bin_start_frames[0]),
+            self.controller.sample_index_to_time(last_frame),
+        ])
+        data_curves = values[:, self.channel_order].T
+        return times_chunk, data_curves
+
+    def make_fetch_func(self, t1, t2, segment_index):
+        # use the overview for long windows (when available) and the raw traces otherwise
+        if self.use_overview():
+            width_pixels, mode = self.overview_width, self.settings['overview_mode']
+            return lambda: dict(overview=self.get_overview_in_chunk(t1, t2, segment_index, width_pixels, mode=mode))
+        return MixinViewTrace.make_fetch_func(self, t1, t2, segment_index)
+
+    def make_data_in_chunk(self, segment_index, fetched):
+        overview = "overview" in fetched
+        if overview != self._overview_displayed:
+            # raw traces and overview do not have the same scale (rms)
+            self._overview_displayed = overview
+            self.color_limit = None
+        if overview:
+            times_chunk, data_curves = fetched["overview"]
+            # already one bin per pixel
+            self.last_data_curves = data_curves.copy()
+            empty = np.array([])
+            return times_chunk, data_curves, empty, empty, empty
+        return MixinViewTrace.make_data_in_chunk(self, segment_index, fetched)
+
     ## Qt ##
     def _qt_make_layout(self, **kargs):
         from .myqt import QT
@@ -97,11 +163,12 @@ class TraceMapView(ViewBase, MixinViewTrace):
 
     def _qt_on_settings_changed(self, do_refresh=True):
 
-        self.spinbox_xsize.opts['bounds'] = [0.001, self.settings['xsize_max']]
-        if self.xsize > self.settings['xsize_max']:
+        xsize_limit = self.get_xsize_limit()
+        self.spinbox_xsize.opts['bounds'] = [0.001, xsize_limit]
+        if self.xsize > xsize_limit:
             self.spinbox_xsize.sigValueChanged.disconnect(self.on_xsize_changed)
-            self.spinbox_xsize.setValue(self.settings['xsize_max'])
-            self.xsize = self.settings['xsize_max']
+            self.spinbox_xsize.setValue(xsize_limit)
+            self.xsize = xsize_limit
             self.spinbox_xsize.sigValueChanged.connect(self.on_xsize_changed)
             self.notify_time_info_updated()
 
@@ -114,6 +181,8 @@ class TraceMapView(ViewBase, MixinViewTrace):
         self._qt_seek_with_selected_spike()
 
     def _qt_refresh(self):
+        # the overview can be ready after the view creation
+        self.spinbox_xsize.opts['bounds'] = [0.001, self.get_xsize_limit()]
         t, _ = self.controller.get_time()
         self._qt_seek(t)
 
@@ -138,8 +207,14 @@ class TraceMapView(ViewBase, MixinViewTrace):
         self.scroll_time.valueChanged.connect(self._qt_on_scroll_time)
 
         segment_index = self.controller.get_time()[1]
-        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = \
-            self.get_data_in_chunk(t1, t2, segment_index)
+        self.overview_width = int(self.plot.vb.width()) or self._default_overview_width
+        self.request_data_in_chunk(t1, t2, segment_index, self._qt_render_chunk)
+
+    def _qt_render_chunk(self, t1, t2, data):
+        from .myqt import QT
+        import pyqtgraph as pg
+
+        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = data
         data_curves = data_curves.T
 
         if times_chunk.size == 0:
@@ -283,11 +358,22 @@ class TraceMapView(ViewBase, MixinViewTrace):
         else:
             auto_scale = False
 
-        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = \
-            self.get_data_in_chunk(t1, t2, segment_index)
+        # the overview can be ready after the view creation
+        self.xsize_spinner.end = self.get_xsize_limit()
+        self.overview_width = self.figure.inner_width or self._default_overview_width
+        self.request_data_in_chunk(
+            t1, t2, segment_index,
+            lambda t1, t2, data: self._panel_render_chunk(t1, t2, data, auto_scale=auto_scale),
+        )
+
+    def _panel_render_chunk(self, t1, t2, data, auto_scale=False):
+        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = data
         data_curves = data_curves.T
+        if times_chunk.size == 0:
+            return
 
         if self.color_limit is None:
+            auto_scale = True
             self.color_limit = np.max(np.abs(data_curves))
 
         self.image_source.data.update({
@@ -380,6 +466,11 @@ This view shows the trace map of all the channels.
 
 ### Controls
 * **x size (s)**: Set the time window size for the traces.
+  When the GUI is launched with `trace_overview=True`, windows longer than `xsize_max` are displayed
+  from a precomputed min/max/rms overview (built once in background and stored in the analyzer folder),
+  so that the whole recording can be displayed at once. Spikes are not displayed in this mode.
+  The `overview_mode` setting chooses the displayed value ("peak" is the min or the max with the
+  largest amplitude, "rms" shows noisy or dead channels).
 * **auto scale**: Automatically adjust the scale of the traces.
 * **time (s)**: Set the time point to display traces.
 * **mouse wheel**: change the scale of the traces.
@@ -3,6 +3,7 @@ import time
 from contextlib import nullcontext
 
 from .view_base import ViewBase
+from .trace_tools import AsyncTraceFetcher, decimate_min_max
 
 
 # This MixinViewTrace is used both in TraceView and TraceMapView) handling:
@@ -19,86 +20,162 @@ INT32_MAX = 2147483647  # 2**31 - 1
 class MixinViewTrace:
 
     MAX_RETRIEVE_TIME_FOR_BUSY_CURSOR = 0.5  # seconds
+    # number of min/max bins of the curves kept in last_data_curves (only used for the auto scale)
+    LAST_DATA_CURVES_NUM_BINS = 1000
+
+    def __init__(self):
+        # (segment_index, ind1, ind2) of the last displayed chunk, used to guess the scroll direction
+        self._last_chunk_indices = None
+        # worker thread reading traces when the "async_trace_fetch" setting is on
+        self._trace_fetcher = None
+        self._qt_invoker = None
+
+    def get_scroll_direction(self, segment_index, ind1, ind2):
+        """Return 1 (forward), -1 (backward) or 0 (first display or jump) compared to the last chunk"""
+        last = self._last_chunk_indices
+        self._last_chunk_indices = (segment_index, ind1, ind2)
+        if last is None or last[0] != segment_index:
+            return 0
+        delta = ind1 - last[1]
+        if abs(delta) > 2 * (ind2 - ind1):
+            # jump
+            return 0
+        return int(np.sign(delta))
+
+    def fetch_chunk(self, t1, t2, segment_index):
+        """Read the traces of the chunk. This does not touch the UI, so it can run in a worker thread."""
+        ind1, ind2 = self.controller.get_chunk_indices(t1, t2, segment_index)
+        traces_chunk = self.controller.get_traces(segment_index=segment_index, start_frame=ind1, end_frame=ind2)
+        times_chunk = self.controller.get_times_chunk(segment_index=segment_index, t1=t1, t2=t2)
+        return dict(ind1=ind1, ind2=ind2, traces_chunk=traces_chunk, times_chunk=times_chunk)
+
+    def make_fetch_func(self, t1, t2, segment_index):
+        """Return the function reading the chunk. Settings are read here, in the UI thread."""
+        return lambda: self.fetch_chunk(t1, t2, segment_index)
 
     def get_data_in_chunk(self, t1, t2, segment_index):
         with self.trace_context():
-            ind1, ind2 = self.controller.get_chunk_indices(t1, t2, segment_index)
-
             t_traces_start = time.perf_counter()
-            traces_chunk = self.controller.get_traces(segment_index=segment_index, start_frame=ind1, end_frame=ind2)
-            times_chunk = self.controller.get_times_chunk(segment_index=segment_index, t1=t1, t2=t2)
+            fetched = self.make_fetch_func(t1, t2, segment_index)()
             t_traces_end = time.perf_counter()
             elapsed = t_traces_end - t_traces_start
             if elapsed > self.MAX_RETRIEVE_TIME_FOR_BUSY_CURSOR:
                 self.trace_context = self.busy_cursor
             else:
                 self.trace_context = nullcontext
+            return self.make_data_in_chunk(segment_index, fetched)
+
+    def request_data_in_chunk(self, t1, t2, segment_index, render_func):
+        """
+        Get the data of the chunk (see get_data_in_chunk()) and call `render_func(t1, t2, data)`.
+
+        With the "async_trace_fetch" setting, traces are read in a worker thread and `render_func`
+        is called later in the UI thread, so the UI never waits for a slow preprocessing chain.
+        The result of a request superseded by a newer one is dropped.
+        """
+        invoke_func = self.get_main_thread_invoker() if self.settings['async_trace_fetch'] else None
+        if invoke_func is None:
+            # a pending async request must not overwrite this chunk later
+            self.cancel_data_requests()
+            render_func(t1, t2, self.get_data_in_chunk(t1, t2, segment_index))
+            return
 
-            sl = self.controller.segment_slices[segment_index]
-            spikes_seg = self.controller.spikes[sl]
-            i1, i2 = np.searchsorted(spikes_seg["sample_index"], [ind1, ind2])
-            spikes_chunk = spikes_seg[i1:i2].copy()
-            spikes_chunk["sample_index"] -= ind1
-
-            # for trace map view, this returns the channels ordered by depth
-            visible_channel_inds = self.get_visible_channel_inds()
-
-            data_curves = traces_chunk[:, visible_channel_inds].copy()
-            data_curves = data_curves.T  # channels x time
-
-            if data_curves.dtype != "float32":
-                data_curves = data_curves.astype("float32")
-            self.last_data_curves = data_curves.copy()
-
-            if self.factor is not None:
-                n = visible_channel_inds.size
-                gains = np.ones(n, dtype=float) * 1.0 / (self.factor * max(self.mad[visible_channel_inds]))
-                offsets = np.arange(n)[::-1] - self.med[visible_channel_inds] * gains
-
-                data_curves *= gains[:, None]
-                data_curves += offsets[:, None]
-
-            scatter_x = []
-            scatter_y = []
-            scatter_colors = []
+        def done(fetched):
+            render_func(t1, t2, self.make_data_in_chunk(segment_index, fetched))
+
+        if self._trace_fetcher is None:
+            self._trace_fetcher = AsyncTraceFetcher()
+        self._trace_fetcher.submit(self.make_fetch_func(t1, t2, segment_index), done, invoke_func)
+
+    def cancel_data_requests(self):
+        """Drop the pending async requests. Must be called when the view is cleared without a request."""
+        if self._trace_fetcher is not None:
+            self._trace_fetcher.cancel()
+
+    def keep_last_data_curves(self, times_chunk, data_curves):
+        """Keep the min/max envelope of the curves: it has the same extrema as the full resolution data."""
+        _, envelope = decimate_min_max(times_chunk, data_curves, num_bins=self.LAST_DATA_CURVES_NUM_BINS)
+        # not decimated when the chunk is short, the curves are then modified in place by the gains
+        self.last_data_curves = envelope.copy() if envelope is data_curves else envelope
+
+    def get_main_thread_invoker(self):
+        if self.backend == "qt":
+            if self._qt_invoker is None:
+                from .utils_qt import MainThreadInvoker
+                self._qt_invoker = MainThreadInvoker(parent=self.qt_widget)
+            return self._qt_invoker.invoke
+        elif self.backend == "panel":
+            from .utils_panel import get_document_invoker
+            return get_document_invoker()
+
+    def get_spike_colors_from_lut(self, unit_indices):
+        """
+        Per spike colors resolved through a lookup table with one entry per unit: an array of
+        QBrush for qt (directly usable by ScatterPlotItem.setData) or of html colors for panel.
+        """
+        lut_unit_inds, color_inds = np.unique(unit_indices, return_inverse=True)
+        unit_ids = self.controller.unit_ids[lut_unit_inds]
+        if self.backend == "qt":
+            import pyqtgraph as pg
+            lut = np.empty(unit_ids.size, dtype=object)
+            lut[:] = [pg.mkBrush(self.get_unit_color(unit_id)) for unit_id in unit_ids]
+        else:
+            lut = np.array([self.get_unit_color(unit_id) for unit_id in unit_ids])
+        return lut[color_inds.reshape(-1)]
+
+    def make_data_in_chunk(self, segment_index, fetched):
+        """Make the curves and the spikes scatter from the traces of fetch_chunk() (in the UI thread)."""
+        ind1, ind2 = fetched["ind1"], fetched["ind2"]
+        traces_chunk, times_chunk = fetched["traces_chunk"], fetched["times_chunk"]
+        # read ahead the next windows in background
+        direction = self.get_scroll_direction(segment_index, ind1, ind2)
+        self.controller.prefetch_traces(segment_index, ind1, ind2, direction=direction)
+
+        sl = self.controller.segment_slices[segment_index]
+        spikes_seg = self.controller.spikes[sl]
+        i1, i2 = np.searchsorted(spikes_seg["sample_index"], [ind1, ind2])
+        # slices are views, no copy
+        spikes_chunk = spikes_seg[i1:i2]
+
+        # for trace map view, this returns the channels ordered by depth
+        visible_channel_inds = self.get_visible_channel_inds()
 
+        # channels x time: the fancy indexing of visible channels is the only full resolution copy
+        data_curves = traces_chunk.T[visible_channel_inds]
+        if data_curves.dtype != "float32":
+            data_curves = data_curves.astype("float32")
+        self.keep_last_data_curves(times_chunk, data_curves)
+
+        if self.factor is not None:
+            n = visible_channel_inds.size
+            gains = np.ones(n, dtype=float) * 1.0 / (self.factor * max(self.mad[visible_channel_inds]))
+            offsets = np.arange(n)[::-1] - self.med[visible_channel_inds] * gains
+
+            data_curves *= gains[:, None]
+            data_curves += offsets[:, None]
+
+        # spikes overlay in one pass: spikes of visible units on visible channels
+        visible_unit_mask = np.zeros(self.controller.unit_ids.size, dtype='bool')
+        visible_unit_mask[self.controller.get_visible_unit_indices()] = True
+        visible_channel_mask = np.zeros(self.controller.channel_ids.size, dtype='bool')
+        visible_channel_mask[visible_channel_inds] = True
+
+        unit_inds = spikes_chunk["unit_index"]
+        channel_inds = spikes_chunk["channel_index"]
+        keep = visible_unit_mask[unit_inds] & visible_channel_mask[channel_inds]
+        unit_inds = unit_inds[keep]
+        channel_inds = channel_inds[keep]
+        sample_inds = spikes_chunk["sample_index"][keep] - ind1
+
+        scatter_x = times_chunk[sample_inds]
+        # Handle depth ordering for TraceMapView
+        if self.channel_order_reverse is not None:
+            scatter_y = self.channel_order_reverse[channel_inds] + 0.5
+        else:
             global_to_local_chan_inds = np.zeros(self.controller.channel_ids.size, dtype='int64')
             global_to_local_chan_inds[visible_channel_inds] = np.arange(visible_channel_inds.size, dtype='int64')
-
-            for unit_index, unit_id in self.controller.iter_visible_units():
-
-                inds = np.flatnonzero(spikes_chunk["unit_index"] == unit_index)
-                if inds.size == 0:
-                    continue
-
-                # Get spikes for this unit
-                unit_spikes = spikes_chunk[inds]
-                channel_inds = unit_spikes["channel_index"]
-                sample_inds = unit_spikes["sample_index"]
-
-                chan_mask = np.isin(channel_inds, visible_channel_inds)
-                if not np.any(chan_mask):
-                    continue
-
-                sample_inds = sample_inds[chan_mask]
-                channel_inds = channel_inds[chan_mask]
-                # Map channel indices to their positions in visible_channel_inds
-                local_channel_inds = global_to_local_chan_inds[channel_inds]
-
-                # Calculate y values using signal values
-                x = times_chunk[sample_inds]
-                # Handle depth ordering for TraceMapView
-                if self.channel_order_reverse is not None:
-                    y = self.channel_order_reverse[channel_inds] + 0.5
-                else:
-                    y = data_curves[local_channel_inds, sample_inds]
-
-                # This should both for qt (QTColor) and panel (html color)
-                color = self.get_unit_color(unit_id)
-
-                scatter_x.extend(x)
-                scatter_y.extend(y)
-                scatter_colors.extend([color] * len(x))
+            scatter_y = data_curves[global_to_local_chan_inds[channel_inds], sample_inds]
+        scatter_colors = self.get_spike_colors_from_lut(unit_inds)
 
         return times_chunk, data_curves, scatter_x, scatter_y, scatter_colors
 
@@ -615,8 +692,12 @@ class TraceView(ViewBase, MixinViewTrace):
         {'name': 'alpha', 'type': 'float', 'value' : 0.8, 'limits':(0, 1.), 'step':0.05},
         {'name': 'xsize_max', 'type': 'float', 'value': 4.0, 'step': 1.0, 'limits':(1.0, np.inf)},
         {'name': 'max_visible_channel', 'type': 'int', 'value':  16},
+        {'name': 'decimate_traces', 'type': 'bool', 'value': True},
+        {'name': 'async_trace_fetch', 'type': 'bool', 'value': True},
     ]
 
+    # number of min/max bins when the plot width in pixels is not known (panel)
+    _default_decimation_width = 1500
 
     def __init__(self, controller=None, parent=None, backend="qt"):
 
@@ -660,6 +741,12 @@ class TraceView(ViewBase, MixinViewTrace):
         self.refresh()
         self.trace_context = trace_context
 
+    def decimate_curves(self, times_chunk, data_curves, width_pixels):
+        """Apply min/max envelope decimation on the curves when there are many samples per pixel"""
+        if not self.settings['decimate_traces'] or width_pixels is None or width_pixels <= 0:
+            return times_chunk, data_curves
+        return decimate_min_max(times_chunk, data_curves, num_bins=width_pixels)
+
     ## qt ##
     def _qt_make_layout(self):
         from .myqt import QT
@@ -721,25 +808,32 @@ class TraceView(ViewBase, MixinViewTrace):
 
         visible_channel_inds = self.get_visible_channel_inds()
         if len(visible_channel_inds) == 0:
+            self.cancel_data_requests()
             self.signals_curve.setData([], [])
             self.scatter.setData(x=[], y=[], brush=[])
             for chan_ind, chan_id in enumerate(self.controller.channel_ids):
                 self.channel_labels[chan_ind].hide()
             return
 
-        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = \
-            self.get_data_in_chunk(t1, t2,  self.controller.get_time()[1])
+        self.request_data_in_chunk(t1, t2, self.controller.get_time()[1], self._qt_render_chunk)
+
+    def _qt_render_chunk(self, t1, t2, data):
+        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = data
+        visible_channel_inds = self.get_visible_channel_inds()
 
         if times_chunk.size == 0:
             self.signals_curve.setData([], [])
             self.scatter.setData(x=[], y=[], brush=[])
             return
 
-        connect = np.ones(data_curves.shape, dtype='bool')
+        # the curves are decimated after spikes positions are computed on the full resolution data
+        curve_times, curve_data = self.decimate_curves(times_chunk, data_curves, int(self.plot.vb.width()))
+
+        connect = np.ones(curve_data.shape, dtype='bool')
         connect[:, -1] = 0
 
-        times_chunk_tile = np.tile(times_chunk, visible_channel_inds.size)
-        self.signals_curve.setData(times_chunk_tile, data_curves.flatten(), connect=connect.flatten())
+        times_chunk_tile = np.tile(curve_times, visible_channel_inds.size)
+        self.signals_curve.setData(times_chunk_tile, curve_data.flatten(), connect=connect.flatten())
 
         self.scatter.setData(x=scatter_x, y=scatter_y, brush=scatter_colors)
 
@@ -852,6 +946,7 @@ class TraceView(ViewBase, MixinViewTrace):
         n = visible_channel_inds.size
 
         if n == 0:
+            self.cancel_data_requests()
             self.signal_source.data.update({
                 "xs": [[]],
                 "ys": [[]],
@@ -863,29 +958,37 @@ class TraceView(ViewBase, MixinViewTrace):
             })
             self.figure.x_range.start = t1
             self.figure.x_range.end = t2
+            self._panel_add_event_lines(t1, t2)
         else:
-            times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = \
-                self.get_data_in_chunk(t1, t2, segment_index)
-
-            self.signal_source.data.update(
-                {
-                    "xs": [times_chunk]*n,
-                    "ys": [data_curves[i, :] for i in range(n)],
-                }
-            )
+            self.request_data_in_chunk(t1, t2, segment_index, self._panel_render_chunk)
 
-            self.spike_source.data.update(
-                {
-                    "x": scatter_x,
-                    "y": scatter_y,
-                    "color": scatter_colors,
-                }
-            )
+    def _panel_render_chunk(self, t1, t2, data):
+        times_chunk, data_curves, scatter_x, scatter_y, scatter_colors = data
+        n = data_curves.shape[0]
 
-            # Update plot ranges for x-axis too
-            self.figure.x_range.start = t1
-            self.figure.x_range.end = t2
-            self.figure.y_range.end = n - 0.5
+        # reduce the number of points sent to the browser
+        width = self.figure.inner_width or self._default_decimation_width
+        curve_times, curve_data = self.decimate_curves(times_chunk, data_curves, width)
+
+        self.signal_source.data.update(
+            {
+                "xs": [curve_times]*n,
+                "ys": [curve_data[i, :] for i in range(n)],
+            }
+        )
+
+        self.spike_source.data.update(
+            {
+                "x": scatter_x,
+                "y": scatter_y,
+                "color": scatter_colors,
+            }
+        )
+
+        # Update plot ranges for x-axis too
+        self.figure.x_range.start = t1
+        self.figure.x_range.end = t2
+        self.figure.y_range.end = n - 0.5
 
         self._panel_add_event_lines(t1, t2)
 
@@ -928,24 +1031,13 @@ class TraceView(ViewBase, MixinViewTrace):
 
 
 
-def find_nearest_spike(controller, x, segment_index, max_distance_samples=None):
+def find_nearest_spike(controller, x, segment_index, max_distance_samples=None, **kwargs):
+    """Find the spike nearest to the time x (see Controller.find_nearest_spike())"""
     if max_distance_samples is None:
         max_distance_samples = controller.sampling_frequency // 30
 
     ind_click = controller.time_to_sample_index(x)
-    (in_seg,) = np.nonzero(controller.spikes["segment_index"] == segment_index)
-
-    if len(in_seg) == 0:
-        return None
-
-    nearest = np.argmin(np.abs(controller.spikes[in_seg]["sample_index"] - ind_click))
-    ind_spike_nearest = in_seg[nearest]
-    sample_index = controller.spikes[ind_spike_nearest]["sample_index"]
-
-    if np.abs(ind_click - sample_index) > max_distance_samples:
-        return None
-
-    return ind_spike_nearest
+    return controller.find_nearest_spike(ind_click, segment_index, max_distance_samples=max_distance_samples, **kwargs)
 
     
 TraceView._gui_help_txt = """
@@ -959,4 +1051,10 @@ This view shows the traces of the selected visible channels from the Probe View.
 * **time (s)**: Set the time point to display traces.
 * **mouse wheel**: change the scale of the traces.
 * **double click**: select the nearest spike and center the view on it.
+
+When the `async_trace_fetch` setting is on, traces are read in a background thread and displayed
+when they arrive, so the window stays responsive with slow preprocessing. Outdated requests are dropped.
+
+When the `decimate_traces` setting is on, long windows are drawn as min/max envelopes (one pair
+of points per pixel), so `xsize_max` can be raised to minutes.
 """
@@ -12,6 +12,22 @@ def get_config_folder() -> Path:
     """
     return Path(os.path.expanduser("~")) / ".config" / "spikeinterface_gui"
 
+def get_cache_folder() -> Path:
+    """Get the user-local folder for the caches of spikeinterface-gui.
+
+    It is "$XDG_CACHE_HOME/spikeinterface_gui" (by default "~/.cache/spikeinterface_gui"),
+    so that caches are never written in the (maybe read-only or shared) analyzer folder.
+
+    Returns
+    -------
+    cache_folder : Path
+        The path to the cache folder.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = Path(os.path.expanduser("~")) / ".cache"
+    return Path(cache_home) / "spikeinterface_gui"
+
 # Functions for the layout
 
 def fill_unnecessary_space(layout_zone, shift):
@@ -97,6 +97,21 @@ checkbox_formatter_template = """
 """
 
 
+def get_document_invoker():
+    """
+    Return a function calling functions in the thread of the current bokeh document from any thread,
+    or None when there is no server session (notebook).
+    """
+    doc = pn.state.curdoc
+    if doc is None or doc.session_context is None:
+        return None
+
+    def invoke(func):
+        doc.add_next_tick_callback(func)
+
+    return invoke
+
+
 def insert_warning(view, warning_msg):
     clear_warning(view)
     alert_html = f"""
@@ -314,6 +314,21 @@ class TimeSeeker(QT.QWidget) :
         if emit:
             self.time_changed.emit(float(self.t))
 
+class MainThreadInvoker(QT.QObject):
+    """Call functions in the Qt main thread from any thread (through a queued signal)."""
+    invoke_requested = QT.pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        QT.QObject.__init__(self, parent)
+        self.invoke_requested.connect(self._on_invoke_requested, QT.Qt.QueuedConnection)
+
+    def _on_invoke_requested(self, func):
+        func()
+
+    def invoke(self, func):
+        self.invoke_requested.emit(func)
+
+
 def get_dict_from_group_param(param, cascade = False):
     assert param.type() == 'group'
     d = {}
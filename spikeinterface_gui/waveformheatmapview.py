@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 import numpy as np
 import matplotlib.cm
 import matplotlib.colors
@@ -6,6 +8,36 @@ import matplotlib.colors
 from .view_base import ViewBase
 
 
+# memory budget of the per unit histograms cache
+_unit_hist_cache_max_bytes = 256 * 1024**2
+
+
+def compute_waveforms_histogram(waveforms, bin_min, bin_size, num_bins):
+    """Histogram of the waveforms values for each (channel, sample) with one bincount.
+
+    Parameters
+    ----------
+    waveforms : np.array
+        shape (num_waveforms, num_samples, num_channels)
+    bin_min, bin_size : float
+        The bins are [bin_min + k * bin_size, bin_min + (k + 1) * bin_size[, values outside are clipped.
+    num_bins : int
+        The number of bins.
+
+    Returns
+    -------
+    hist : np.array
+        int32 counts, shape (num_channels * num_samples, num_bins), channel major.
+    """
+    data = waveforms.swapaxes(1, 2).reshape(waveforms.shape[0], -1)
+    num_features = data.shape[1]
+    data_binned = np.floor((data - bin_min) / bin_size).astype('int64')
+    np.clip(data_binned, 0, num_bins - 1, out=data_binned)
+    data_binned += (np.arange(num_features, dtype='int64') * num_bins)[None, :]
+    hist = np.bincount(data_binned.ravel(), minlength=num_features * num_bins)
+    return hist.astype('int32').reshape(num_features, num_bins)
+
+
 
 class WaveformHeatMapView(ViewBase):
     id = "waveformheatmap"
@@ -27,6 +59,15 @@ class WaveformHeatMapView(ViewBase):
         ViewBase.__init__(self, controller=controller, parent=parent,  backend=backend)
         self.make_color_lut()
 
+        # per unit histograms on the unit channels for the current bins, LRU order
+        self._unit_hists = OrderedDict()
+        self._unit_hists_nbytes = 0
+        self._bins_key = None
+        # running sum of the unit histograms on the intersection channels
+        self._hist_sum = None
+        self._hist_sum_units = set()
+        self._hist_sum_channels = None
+
 
 
     def make_color_lut(self):
@@ -52,31 +93,63 @@ class WaveformHeatMapView(ViewBase):
         if len(intersect_sparse_indexes) == 0:
             return None
 
-        waveforms = []
-        for unit_id in visible_unit_ids:
-            wfs, chan_inds = self.controller.get_waveforms(unit_id)
-            keep = np.isin(chan_inds, intersect_sparse_indexes)
-            waveforms.append(wfs[:, :, keep])
-        waveforms = np.concatenate(waveforms)
-        data  = waveforms.swapaxes(1,2).reshape(waveforms.shape[0], -1)
-        
         bin_min, bin_max = self.settings['bin_min'], self.settings['bin_max']
         bin_size = max(self.settings['bin_size'], 0.01)
         bins = np.arange(bin_min, bin_max, self.settings['bin_size'])
 
+        bins_key = (bin_min, bin_size, bins.size)
+        if bins_key != self._bins_key:
+            self._unit_hists.clear()
+            self._unit_hists_nbytes = 0
+            self._hist_sum = None
+            self._bins_key = bins_key
+
+        visible_unit_ids = set(visible_unit_ids)
+        intersect_sparse_indexes = np.asarray(intersect_sparse_indexes)
+        if (self._hist_sum is not None and self._hist_sum_channels is not None
+                and np.array_equal(self._hist_sum_channels, intersect_sparse_indexes)):
+            # only add/subtract the units that changed
+            for unit_id in visible_unit_ids - self._hist_sum_units:
+                self._hist_sum += self.get_unit_histogram(unit_id, intersect_sparse_indexes)
+            for unit_id in self._hist_sum_units - visible_unit_ids:
+                self._hist_sum -= self.get_unit_histogram(unit_id, intersect_sparse_indexes)
+        else:
+            self._hist_sum = None
+            for unit_id in visible_unit_ids:
+                unit_hist = self.get_unit_histogram(unit_id, intersect_sparse_indexes)
+                if self._hist_sum is None:
+                    self._hist_sum = unit_hist.copy()
+                else:
+                    self._hist_sum += unit_hist
+        self._hist_sum_units = visible_unit_ids
+        self._hist_sum_channels = intersect_sparse_indexes
+
+        return self._hist_sum.astype('float64')
+
+    def get_unit_histogram(self, unit_id, channel_indexes):
+        """Histogram of one unit restricted to channel_indexes (a subset of the unit channels).
+
+        The full histogram of the unit (on its own channels) is cached for the current bins.
+        """
+        bin_min, bin_size, num_bins = self._bins_key
+        entry = self._unit_hists.get(unit_id)
+        if entry is None:
+            wfs, chan_inds = self.controller.get_waveforms(unit_id)
+            hist = compute_waveforms_histogram(wfs, bin_min, bin_size, num_bins)
+            entry = (hist, np.asarray(chan_inds))
+            self._unit_hists[unit_id] = entry
+            self._unit_hists_nbytes += hist.nbytes
+            while self._unit_hists_nbytes > _unit_hist_cache_max_bytes and len(self._unit_hists) > 1:
+                _, (old_hist, _) = self._unit_hists.popitem(last=False)
+                self._unit_hists_nbytes -= old_hist.nbytes
+        else:
+            self._unit_hists.move_to_end(unit_id)
 
-        n = bins.size
-
-        hist2d = np.zeros((data.shape[1], bins.size))
-        indexes0 = np.arange(data.shape[1])
-        
-        data_binned = np.floor((data-bin_min)/bin_size).astype('int32')
-        data_binned = data_binned.clip(0, bins.size-1)
-        
-        for d in data_binned:
-            hist2d[indexes0, d] += 1
-        
-        return hist2d
+        hist, chan_inds = entry
+        num_samples = hist.shape[0] // max(chan_inds.size, 1)
+        keep = np.flatnonzero(np.isin(chan_inds, channel_indexes))
+        rows = (keep[:, None] * num_samples + np.arange(num_samples)[None, :]).ravel()
+        return hist[rows]
 
     ## Qt ##
     def _qt_make_layout(self):
@@ -1,4 +1,6 @@
 import time
+from collections import OrderedDict
+
 import numpy as np
 
 from .view_base import ViewBase
@@ -6,6 +8,8 @@ from .view_base import ViewBase
 from functools import partial
 
 _wheel_refresh_time = 0.1
+# number of units kept in the waveform samples cache
+_max_cached_units_samples = 64
 
 # TODO sam : check the on_params_changed in change params and remove initialize_plot()
 
@@ -22,6 +26,7 @@ class WaveformView(ViewBase):
             "type": "bool",
             "value": False,
         },  # true here can be very slow because it loads traces
+        {"name": "max_selected_spikes", "type": "int", "value": 500},
         {"name": "plot_waveforms_samples", "type": "bool", "value": False},
         {"name": "waveforms_alpha", "type": "float", "value": 0.3},
         {"name": "num_waveforms", "type": "int", "value": 20},
@@ -80,6 +85,10 @@ class WaveformView(ViewBase):
 
         self.last_wheel_event_time = None
 
+        # unit_id -> (subsampled sparse waveforms, channel indices), LRU order
+        self._waveforms_samples_cache = OrderedDict()
+        self._waveforms_samples_num = None
+
     def get_common_channels(self):
         sparse = self.settings["sparse_display"]
         visible_unit_ids = self.controller.get_visible_unit_ids()
@@ -93,24 +102,62 @@ class WaveformView(ViewBase):
 
         return common_channel_indexes
 
-    def get_spike_waveform(self, ind):
+    def get_spike_waveforms(self, inds, channel_indexes):
+        """Get the waveforms (num_spikes, width, len(channel_indexes)) of the selected spikes from the traces.
+
+        At most "max_selected_spikes" spikes (evenly taken) are extracted in one batch, only on
+        channel_indexes, spikes crossing a segment border are removed.
+        """
         if not self.controller.has_extension("recording") or not self.controller.with_traces:
             return None, None
-        seg_num = self.controller.spikes["segment_index"][ind]
-        peak_ind = self.controller.spikes["sample_index"][ind]
+        inds = np.asarray(inds, dtype="int64")
+        max_spikes = max(self.settings["max_selected_spikes"], 1)
+        if inds.size > max_spikes:
+            inds = inds[np.linspace(0, inds.size - 1, max_spikes).astype("int64")]
 
         nbefore, nafter = self.controller.get_waveform_sweep()
         width = nbefore + nafter
+        wfs, valid = self.controller.get_spike_waveforms(inds, channel_indices=channel_indexes)
+        return wfs[valid], width
 
-        # TODO handle return_scaled
-        wf = self.controller.get_traces(
-            trace_source="preprocessed",
-            segment_index=seg_num,
-            start_frame=peak_ind - nbefore,
-            end_frame=peak_ind + nafter,
-            return_in_uV=self.controller.return_in_uV,
-        )
-        return wf, width
+    def get_waveforms_samples(self, unit_id, channel_indexes):
+        """Get at most "num_waveforms" waveforms of one unit on channel_indexes (zeros outside the unit sparsity).
+
+        The subset is drawn once per unit with a seed depending on the unit, kept (channel sparse) in a LRU cache
+        and only redrawn when "num_waveforms" changes. So refreshes do not read the extension again and
+        the displayed waveforms do not flicker.
+        """
+        num_waveforms = self.settings["num_waveforms"]
+        if num_waveforms != self._waveforms_samples_num:
+            self._waveforms_samples_cache.clear()
+            self._waveforms_samples_num = num_waveforms
+
+        entry = self._waveforms_samples_cache.get(unit_id)
+        if entry is None:
+            waveforms, chan_inds = self.controller.get_waveforms(unit_id)
+            if waveforms is None or len(waveforms) == 0:
+                return None
+            if len(waveforms) > num_waveforms:
+                unit_index = list(self.controller.unit_ids).index(unit_id)
+                rng = np.random.default_rng(seed=unit_index)
+                inds = np.sort(rng.choice(len(waveforms), num_waveforms, replace=False))
+                waveforms = waveforms[inds, :, :]
+            entry = (np.ascontiguousarray(waveforms), np.asarray(chan_inds))
+            self._waveforms_samples_cache[unit_id] = entry
+            while len(self._waveforms_samples_cache) > _max_cached_units_samples:
+                self._waveforms_samples_cache.popitem(last=False)
+        else:
+            self._waveforms_samples_cache.move_to_end(unit_id)
+
+        waveforms, chan_inds = entry
+        # position of each requested channel in the unit sparsity (-1 if absent)
+        lookup = np.full(len(self.controller.channel_ids), -1, dtype="int64")
+        lookup[chan_inds] = np.arange(chan_inds.size)
+        pos = lookup[channel_indexes]
+        keep = pos >= 0
+        samples = np.zeros((waveforms.shape[0], waveforms.shape[1], len(channel_indexes)), dtype=waveforms.dtype)
+        samples[:, :, keep] = waveforms[:, :, pos[keep]]
+        return samples
 
     def get_xvectors_not_overlap(self, xvectors, num_visible_units):
         num_x_samples = xvectors.shape[1]
@@ -199,7 +246,8 @@ class WaveformView(ViewBase):
         if hasattr(self, "curve_waveforms_samples"):
             self._qt_clear_waveforms_samples()
 
-        self.curve_waveforms = pg.PlotCurveItem([], [], pen=pg.mkPen(QT.QColor("white"), width=1), connect="finite")
+        self.curve_waveforms_pen = pg.mkPen(QT.QColor("white"), width=1)
+        self.curve_waveforms = pg.PlotCurveItem([], [], pen=self.curve_waveforms_pen, connect="finite")
         self.plot1.addItem(self.curve_waveforms)
 
         # List to hold multiple curve items for waveform samples (one per unit)
@@ -535,18 +583,18 @@ class WaveformView(ViewBase):
 
         # Clear previous waveform samples
         self._qt_clear_waveforms_samples()
+        # the selected spikes mode can change the pen
+        self.curve_waveforms.setPen(self.curve_waveforms_pen)
 
         if self.settings["plot_selected_spike"]:
-            if n_selected != 1:
+            if n_selected == 0:
                 self.curve_waveforms.setData([], [])
                 return
             else:
-                selected_inds = self.controller.get_indices_spike_selected()
-                ind = selected_inds[0]
-                wf, width = self.get_spike_waveform(ind)
-                if wf is None:
+                wfs, width = self.get_spike_waveforms(selected_inds, common_channel_indexes)
+                if wfs is None or wfs.shape[0] == 0:
+                    self.curve_waveforms.setData([], [])
                     return
-                wf = wf[:, common_channel_indexes]
         elif self.settings["plot_waveforms_samples"]:
             if not self.controller.has_extension("waveforms"):
                 self.curve_waveforms.setData([], [])
@@ -555,7 +603,6 @@ class WaveformView(ViewBase):
             if num_waveforms <= 0:
                 self.curve_waveforms.setData([], [])
                 return
-            wf_ext = self.controller.analyzer.get_extension("waveforms")
             visible_unit_ids = self.controller.get_visible_unit_ids()
 
             # Process waveforms per unit to maintain color association
@@ -563,20 +610,13 @@ class WaveformView(ViewBase):
             width = None
 
             for unit_id in visible_unit_ids:
-                waveforms = wf_ext.get_waveforms_one_unit(unit_id, force_dense=True)
-                if waveforms is None or len(waveforms) == 0:
+                # cached subset on the common channels
+                waveforms = self.get_waveforms_samples(unit_id, common_channel_indexes)
+                if waveforms is None:
                     continue
 
                 if width is None:
                     width = waveforms.shape[1]
-
-                # downsample waveforms for this unit
-                if len(waveforms) > num_waveforms:
-                    inds = np.random.choice(len(waveforms), num_waveforms, replace=False)
-                    waveforms = waveforms[inds, :, :]
-
-                # Select only the common channels
-                waveforms = waveforms[:, :, common_channel_indexes]
                 unit_waveforms_data.append((unit_id, waveforms))
 
             if len(unit_waveforms_data) == 0:
@@ -606,32 +646,40 @@ class WaveformView(ViewBase):
             self.curve_waveforms.setData([], [])
             return
 
-        # Handle plotting for single spike (plot_selected_spike case)
+        # Handle plotting for selected spikes (plot_selected_spike case)
         if self.settings["plot_selected_spike"]:
-            # Plot single spike only available in overlap mode
+            # Plot selected spikes only available in overlap mode
             if not self.settings["overlap"]:
                 self.curve_waveforms.setData([], [])
                 return
 
-            # Single spike case - wf.shape[0] should equal width
-            if wf.shape[0] != width:
-                self.curve_waveforms.setData([], [])
-                return
-
+            # all spikes are drawn in one curve, transparent when there are several
+            import pyqtgraph as pg
+            color = QT.QColor("white")
+            n_spikes = wfs.shape[0]
+            if n_spikes > 1:
+                color.setAlpha(int(self.settings["waveforms_alpha"] * 255))
+                self.curve_waveforms.setPen(pg.mkPen(color, width=1))
+
+            # (n_spikes, n_channels, width)
+            wfs = wfs.transpose(0, 2, 1)
             if self.settings["mode"] == "flatten":
-                wf_flat = wf.T.ravel()
-                xvect = np.arange(wf_flat.size)
-                self.curve_waveforms.setData(xvect, wf_flat)
+                wf_flat = wfs.reshape(n_spikes, -1)
+                xvect = np.tile(np.arange(wf_flat.shape[1]), n_spikes)
+                connect = np.ones(wf_flat.shape, dtype="bool")
+                connect[:, -1] = 0
+                self.curve_waveforms.setData(xvect, wf_flat.ravel(), connect=connect.ravel())
             elif self.settings["mode"] == "geometry":
                 ypos = self.contact_location[common_channel_indexes, 1]
-                wf_plot = wf * self.gain_y * self.delta_y + ypos[None, :]
+                wf_plot = wfs * self.gain_y * self.delta_y + ypos[None, :, None]
 
                 connect = np.ones(wf_plot.shape, dtype="bool")
-                connect[0, :] = 0
-                connect[-1, :] = 0
+                connect[:, :, 0] = 0
+                connect[:, :, -1] = 0
                 xvect = self.xvect[common_channel_indexes, :] * self.factor_x
+                xvect = np.broadcast_to(xvect[None, :, :], wf_plot.shape)
 
-                self.curve_waveforms.setData(xvect.ravel(), wf_plot.T.ravel(), connect=connect.T.ravel())
+                self.curve_waveforms.setData(xvect.ravel(), wf_plot.ravel(), connect=connect.ravel())
 
     def _qt_add_scalebars(self):
         """Add scale bars to the plot based on current settings"""
@@ -770,7 +818,7 @@ class WaveformView(ViewBase):
     def _qt_on_spike_selection_changed(self):
         selected_inds = self.controller.get_indices_spike_selected()
         n_selected = selected_inds.size
-        if n_selected == 1 and self.settings["plot_selected_spike"]:
+        if n_selected >= 1 and self.settings["plot_selected_spike"]:
             self._qt_refresh(keep_range=True)
         else:
             # remove the line
@@ -1210,40 +1258,37 @@ class WaveformView(ViewBase):
         selected_inds = self.controller.get_indices_spike_selected()
         n_selected = selected_inds.size
 
-        if n_selected == 1 and self.settings["overlap"]:
-            ind = selected_inds[0]
+        if n_selected >= 1 and self.settings["overlap"]:
             common_channel_indexes = self.get_common_channels()
-            wf, width = self.get_spike_waveform(ind)
-            if wf is None:
+            wfs, width = self.get_spike_waveforms(selected_inds, common_channel_indexes)
+            if wfs is None or wfs.shape[0] == 0:
                 return
-            wf = wf[:, common_channel_indexes]
-
-            if wf.shape[0] == width:
-                # this avoid border bugs
-                if self.settings["mode"] == "flatten":
-                    wf = wf.T.ravel()
-                    x = np.arange(wf.size)
-
-                    color = "white"
-                    source = self.lines_data_source_wfs_flatten
-                    xs = [x]
-                    ys = [wf]
-                    colors = [color]
-                elif self.settings["mode"] == "geometry":
-                    ypos = self.contact_location[common_channel_indexes, 1]
-
-                    wf = wf * self.gain_y * self.delta_y + ypos[None, :]
-
-                    # this disconnect
-                    wf[0, :] = np.nan
-                    xvect = self.xvect[common_channel_indexes, :] * self.factor_x
-
-                    color = "white"
-                    xs = [xvect.ravel()]
-                    ys = [wf.T.ravel()]
-                    colors = [color]
-                    source = self.lines_data_source_wfs_geom
-                source.data = dict(xs=xs, ys=ys, colors=colors)
+            # (n_spikes, n_channels, width)
+            wfs = wfs.transpose(0, 2, 1)
+            n_spikes = wfs.shape[0]
+
+            # one line per spike, transparent when there are several (like qt)
+            alpha = self.settings["waveforms_alpha"] if n_spikes > 1 else 1.0
+            if self.settings["mode"] == "flatten":
+                wfs = wfs.reshape(n_spikes, -1)
+                x = np.arange(wfs.shape[1])
+                xs = [x] * n_spikes
+                source = self.lines_data_source_wfs_flatten
+                lines = self.lines_waveforms_samples_flatten
+            elif self.settings["mode"] == "geometry":
+                ypos = self.contact_location[common_channel_indexes, 1]
+                wfs = wfs * self.gain_y * self.delta_y + ypos[None, :, None]
+
+                # this disconnect
+                wfs[:, :, 0] = np.nan
+                wfs = wfs.reshape(n_spikes, -1)
+                xvect = self.xvect[common_channel_indexes, :] * self.factor_x
+                xs = [xvect.ravel()] * n_spikes
+                source = self.lines_data_source_wfs_geom
+                lines = self.lines_waveforms_samples_geom
+            if lines.glyph.line_alpha != alpha:
+                lines.glyph.line_alpha = alpha
+            source.data = dict(xs=xs, ys=list(wfs), colors=["white"] * n_spikes)
         else:
             # clean existing lines
             if self.settings["mode"] == "flatten":
@@ -1283,7 +1328,6 @@ class WaveformView(ViewBase):
             self.lines_data_source_wfs_geom.data = dict(xs=[], ys=[], colors=[])
             return
 
-        wf_ext = self.controller.analyzer.get_extension("waveforms")
         visible_unit_ids = self.controller.get_visible_unit_ids()
 
         # Process waveforms per unit to maintain color association
@@ -1291,20 +1335,13 @@ class WaveformView(ViewBase):
         width = None
 
         for unit_id in visible_unit_ids:
-            waveforms = wf_ext.get_waveforms_one_unit(unit_id, force_dense=True)
-            if waveforms is None or len(waveforms) == 0:
+            # cached subset on the common channels
+            waveforms = self.get_waveforms_samples(unit_id, common_channel_indexes)
+            if waveforms is None:
                 continue
 
             if width is None:
                 width = waveforms.shape[1]
-
-            # downsample waveforms for this unit
-            if len(waveforms) > num_waveforms:
-                inds = np.random.choice(len(waveforms), num_waveforms, replace=False)
-                waveforms = waveforms[inds, :, :]
-
-            # Select only the common channels
-            waveforms = waveforms[:, :, common_channel_indexes]
             unit_waveforms_data.append((unit_id, waveforms))
 
         if len(unit_waveforms_data) == 0:
@@ -1411,8 +1448,8 @@ WaveformView._gui_help_txt = """
 ## Waveform View
 
 Display average template for visible units.
-If one spike is selected (in spike list) then the spike is super-imposed (white trace)
-(when the 'plot_selected_spike' setting is True)
+If spikes are selected (in spike list or with a lasso) then their waveforms are super-imposed (white traces)
+(when the 'plot_selected_spike' setting is True, at most 'max_selected_spikes' are displayed)
 
 There are 2 modes of display:
   * 'geometry' : snippets are displayed centered on the contact position